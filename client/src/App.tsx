@@ -16,7 +16,7 @@ import TermsOfServicePage from './pages/TermsOfServicePage';
 import CookiePolicyPage from './pages/CookiePolicyPage';
 import ArchivePage from './pages/ArchivePage';
 import { useAuthStore } from './stores/authStore';
-import { useCountryGameStore, usePowiatyGameStore, useUSStatesGameStore, useWojewodztwaGameStore } from './stores/gameStore';
+import { syncAllGuestData, useCountryGameStore, usePowiatyGameStore, useUSStatesGameStore, useWojewodztwaGameStore } from './stores/gameStore';
 import { useEffect } from 'react';
 
 function App() {
@@ -35,10 +35,7 @@ function App() {
   useEffect(() => {
     if (isAuthenticated) {
       const timer = setTimeout(() => {
-        useCountryGameStore.getState().syncGuestData();
-        usePowiatyGameStore.getState().syncGuestData();
-        useUSStatesGameStore.getState().syncGuestData();
-        useWojewodztwaGameStore.getState().syncGuestData();
+        syncAllGuestData();
       }, 500);
       return () => clearTimeout(timer);
     }
@@ -262,6 +262,7 @@ const resources = {
         answer: 'Answer',
         unknown: 'Unknown',
         empty: 'No past games recorded yet.',
+        loadMore: 'Load older days',
       },
       history: {
         empty: 'No questions asked yet. Start by asking something!',
@@ -537,6 +538,7 @@ const resources = {
         answer: 'Odpowiedz',
         unknown: 'Nieznane',
         empty: 'Brak zapisanych poprzednich gier.',
+        loadMore: 'Wczytaj starsze dni',
       },
       history: {
         empty: 'Brak zadanych pytan. Zacznij od pierwszego pytania!',
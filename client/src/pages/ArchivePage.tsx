@@ -1,5 +1,11 @@
 import { useState, useEffect } from 'react';
-import { gameService, powiatService, usStateService, wojewodztwoService } from '../services/api';
+import {
+  HISTORY_PAGE_SIZE,
+  gameService,
+  powiatService,
+  usStateService,
+  wojewodztwoService,
+} from '../services/api';
 import { Loader2, Calendar, Globe, Map, Flag, MapPin } from 'lucide-react';
 import { useTranslation } from 'react-i18next';
 import { cn } from '../lib/utils';
@@ -9,22 +15,29 @@ type GameType = 'country' | 'powiat' | 'us_state' | 'wojewodztwo';
 export default function ArchivePage() {
   const [history, setHistory] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [hasMore, setHasMore] = useState(false);
   const [gameType, setGameType] = useState<GameType>('country');
   const { t } = useTranslation();
 
+  const fetchPage = async (type: GameType, before?: string): Promise<any[]> => {
+    if (type === 'country') {
+      const res = await gameService.getHistory(before);
+      return res.daily_countries || [];
+    }
+    if (type === 'powiat') return powiatService.getHistory(before);
+    if (type === 'us_state') return usStateService.getHistory(before);
+    return wojewodztwoService.getHistory(before);
+  };
+
   useEffect(() => {
     setLoading(true);
+    setHistory([]);
     const fetchHistory = async () => {
         try {
-            let data: any = [];
-            if (gameType === 'country') {
-                const res = await gameService.getHistory();
-                data = res.daily_countries || [];
-            }
-            else if (gameType === 'powiat') data = await powiatService.getHistory();
-            else if (gameType === 'us_state') data = await usStateService.getHistory();
-            else if (gameType === 'wojewodztwo') data = await wojewodztwoService.getHistory();
+            const data = await fetchPage(gameType);
             setHistory(data);
+            setHasMore(data.length === HISTORY_PAGE_SIZE);
         } catch (e) {
             console.error(e);
         } finally {
@@ -34,6 +47,19 @@ export default function ArchivePage() {
     fetchHistory();
   }, [gameType]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await fetchPage(gameType, history[history.length - 1]?.date);
+      setHistory((prev) => [...prev, ...data]);
+      setHasMore(data.length === HISTORY_PAGE_SIZE);
+    } catch (e) {
+      console.error(e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const tabs = [
     { id: 'country', label: t('tabs.countries'), icon: Globe },
     { id: 'powiat', label: t('tabs.powiaty'), icon: Map },
@@ -103,6 +129,16 @@ export default function ArchivePage() {
                {t('archive.empty')}
              </div>
           )}
+          {hasMore && (
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="w-full flex justify-center items-center gap-2 px-6 py-4 border-t border-zinc-800 text-zinc-400 hover:bg-zinc-800/30 hover:text-zinc-200 transition-colors disabled:opacity-50"
+            >
+              {loadingMore && <Loader2 className="animate-spin" size={16} />}
+              {t('archive.loadMore')}
+            </button>
+          )}
         </div>
       )}
     </div>
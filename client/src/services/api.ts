@@ -2,6 +2,8 @@ import axios from 'axios';
 import type { CountryDisplay, GameResponse, Question, Guess } from '../types';
 
 export const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+// Days per archive page; a shorter page means there is nothing older
+export const HISTORY_PAGE_SIZE = 100;
 
 
 const api = axios.create({
@@ -86,8 +88,8 @@ export const gameService = {
     const response = await api.post('/countrydle/guess', { guess, country_id });
     return response.data;
   },
-  getHistory: async (): Promise<any> => {
-    const response = await api.get('/countrydle/statistics/history');
+  getHistory: async (before?: string): Promise<any> => {
+    const response = await api.get('/countrydle/statistics/history', { params: { before } });
     return response.data;
   },
   syncGuestData: async (data: any): Promise<GameResponse> => {
@@ -121,8 +123,8 @@ export const powiatService = {
     const response = await api.get('/powiatdle/leaderboard');
     return response.data;
   },
-  getHistory: async (): Promise<any[]> => {
-    const response = await api.get('/powiatdle/history');
+  getHistory: async (before?: string): Promise<any[]> => {
+    const response = await api.get('/powiatdle/history', { params: { before } });
     return response.data;
   },
   syncGuestData: async (data: any): Promise<any> => {
@@ -156,8 +158,8 @@ export const usStateService = {
     const response = await api.get('/us_statedle/leaderboard');
     return response.data;
   },
-  getHistory: async (): Promise<any[]> => {
-    const response = await api.get('/us_statedle/history');
+  getHistory: async (before?: string): Promise<any[]> => {
+    const response = await api.get('/us_statedle/history', { params: { before } });
     return response.data;
   },
   syncGuestData: async (data: any): Promise<any> => {
@@ -191,8 +193,8 @@ export const wojewodztwoService = {
     const response = await api.get('/wojewodztwodle/leaderboard');
     return response.data;
   },
-  getHistory: async (): Promise<any[]> => {
-    const response = await api.get('/wojewodztwodle/history');
+  getHistory: async (before?: string): Promise<any[]> => {
+    const response = await api.get('/wojewodztwodle/history', { params: { before } });
     return response.data;
   },
   syncGuestData: async (data: any): Promise<any> => {
@@ -205,6 +207,13 @@ export const wojewodztwoService = {
   },
 };
 
+export const syncService = {
+  syncGuestProgress: async (data: Record<string, any>): Promise<any> => {
+    const response = await api.post('/sync', data);
+    return response.data;
+  },
+};
+
 export const timeService = {
   getServerTime: async (): Promise<{ server_time: string; next_game_at: string }> => {
     const response = await api.get('/time');
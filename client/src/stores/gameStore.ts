@@ -1,6 +1,6 @@
 import { create } from 'zustand';
 import type { GameState, Question, Guess } from '../types';
-import { gameService, powiatService, usStateService, wojewodztwoService } from '../services/api';
+import { gameService, powiatService, syncService, usStateService, wojewodztwoService } from '../services/api';
 import { useAuthStore } from './authStore';
 
 interface GameData {
@@ -22,6 +22,8 @@ interface GameActions {
   askQuestion: (questionText: string) => Promise<void>;
   makeGuess: (guessText: string, entityId?: number) => Promise<void>;
   syncGuestData: () => Promise<void>;
+  getGuestProgress: () => any | null;
+  clearGuestProgress: () => void;
   resetGame: () => void;
   toggleEntitySelection: (name: string) => void;
   clearSelection: () => void;
@@ -278,38 +280,56 @@ const createGameStore = (gameType: 'country' | 'powiaty' | 'us_states' | 'wojewo
     
     syncGuestData: async () => {
         try {
-            const clientUser = useAuthStore.getState().user;
-            const { dailyDate } = get();
-            
-            if (!clientUser || !dailyDate) {
-                return;
-            }
-
-            const localKey = getLocalStateKey(gameType, dailyDate);
-            const localData = localStorage.getItem(localKey);
-            
-            if (localData && service.syncGuestData) {
-                const parsed = JSON.parse(localData);
-                if (parsed.questions.length > 0 || parsed.guesses.length > 0) {
-                    // Clear local storage BEFORE calling sync to prevent double sync
-                    localStorage.removeItem(localKey);
-                    
-                    await service.syncGuestData({
-                        state: parsed.state,
-                        questions: parsed.questions.map((q: any) => q.id),
-                        guesses: parsed.guesses.map(guessMapping[gameType]),
-                        date: dailyDate
-                    });
-                    await get().fetchGameState();
-                } else {
-                    localStorage.removeItem(localKey);
-                }
+            const progress = get().getGuestProgress();
+            if (progress && service.syncGuestData) {
+                await service.syncGuestData(progress);
+                // Kept until the server has it, so a failed sync can be retried
+                get().clearGuestProgress();
+                await get().fetchGameState();
             }
         } catch (e) {
             console.error(`[${gameType}] Failed to sync guest data:`, e);
         }
     },
 
+    // Returns what the guest played today in the shape /sync expects
+    getGuestProgress: () => {
+        const clientUser = useAuthStore.getState().user;
+        const { dailyDate } = get();
+
+        if (!clientUser || !dailyDate) {
+            return null;
+        }
+
+        const localKey = getLocalStateKey(gameType, dailyDate);
+        const localData = localStorage.getItem(localKey);
+        if (!localData) {
+            return null;
+        }
+
+        const parsed = JSON.parse(localData);
+        if (parsed.questions.length === 0 && parsed.guesses.length === 0) {
+            localStorage.removeItem(localKey);
+            return null;
+        }
+
+        return {
+            state: parsed.state,
+            questions: parsed.questions.map((q: any) => q.id),
+            guesses: parsed.guesses.map(guessMapping[gameType]),
+            date: dailyDate
+        };
+    },
+
+    // Forgets today's guest progress once the server has taken it (or rejected it for good).
+    // A repeated sync is harmless: progress already on the server wins.
+    clearGuestProgress: () => {
+        const { dailyDate } = get();
+        if (dailyDate) {
+            localStorage.removeItem(getLocalStateKey(gameType, dailyDate));
+        }
+    },
+
     resetGame: () => set({ 
         gameState: null, 
         questions: [], 
@@ -339,5 +359,40 @@ export const usePowiatyGameStore = createGameStore('powiaty');
 export const useUSStatesGameStore = createGameStore('us_states');
 export const useWojewodztwaGameStore = createGameStore('wojewodztwa');
 
+const guestStores = {
+  countrydle: useCountryGameStore,
+  powiatdle: usePowiatyGameStore,
+  us_statedle: useUSStatesGameStore,
+  wojewodztwodle: useWojewodztwaGameStore,
+};
+
+// Moves the guest's progress in every game onto their account with a single request
+export const syncAllGuestData = async () => {
+  const payload: Record<string, any> = {};
+  for (const [game, store] of Object.entries(guestStores)) {
+    const progress = store.getState().getGuestProgress();
+    if (progress) {
+      payload[game] = progress;
+    }
+  }
+  const games = Object.keys(payload) as (keyof typeof guestStores)[];
+  if (games.length === 0) {
+    return;
+  }
+
+  try {
+    const result = await syncService.syncGuestProgress(payload);
+    for (const [game, detail] of Object.entries(result.errors ?? {})) {
+      console.error(`[${game}] Guest progress rejected:`, detail);
+    }
+    // Each game was either synced or can never be, so none of it is worth keeping
+    games.forEach((game) => guestStores[game].getState().clearGuestProgress());
+  } catch (e) {
+    // Rate limited, offline or a server error: the progress stays for the next sign-in
+    console.error('Failed to sync guest data:', e);
+  }
+  await Promise.all(games.map((game) => guestStores[game].getState().fetchGameState()));
+};
+
 // Default export for backward compatibility (pointing to country store)
 export const useGameStore = useCountryGameStore;
@@ -0,0 +1,62 @@
+"""unique_day_dates
+
+Revision ID: 029b995f88ee
+Revises: 7c0f0e9f6b34
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "029b995f88ee"
+down_revision: Union[str, Sequence[str], None] = "7c0f0e9f6b34"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+
+
+def dedupe_days(game: str) -> None:
+    # Lazy day generation could create several days for the same date. Keep the
+    # one most players have played and move everything else onto it.
+    op.execute(
+        f"""
+        CREATE TEMP TABLE day_remap AS
+        SELECT id, keep_id FROM (
+            SELECT d.id,
+                first_value(d.id) OVER (
+                    PARTITION BY d.date
+                    ORDER BY (
+                        SELECT count(*) FROM {game}_states s WHERE s.day_id = d.id
+                    ) DESC, d.id DESC
+                ) AS keep_id
+            FROM {game}_days d
+        ) ranked
+        WHERE id <> keep_id
+        """
+    )
+    for child in ("states", "guesses", "questions"):
+        op.execute(
+            f"""
+            UPDATE {game}_{child} c SET day_id = r.keep_id
+            FROM day_remap r WHERE c.day_id = r.id
+            """
+        )
+    op.execute(f"DELETE FROM {game}_days d USING day_remap r WHERE d.id = r.id")
+    op.execute("DROP TABLE day_remap")
+
+
+def upgrade() -> None:
+    for game in GAMES:
+        dedupe_days(game)
+        op.create_unique_constraint(f"{game}_days_date_key", f"{game}_days", ["date"])
+
+
+def downgrade() -> None:
+    for game in reversed(GAMES):
+        op.drop_constraint(f"{game}_days_date_key", f"{game}_days", type_="unique")
@@ -0,0 +1,38 @@
+"""state_history_indexes
+
+Revision ID: 3b9e2d71c4a5
+Revises: f8db67c4c837
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9e2d71c4a5"
+down_revision: Union[str, Sequence[str], None] = "f8db67c4c837"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+
+
+def upgrade() -> None:
+    for game in GAMES:
+        op.create_index(
+            f"ix_{game}_states_history",
+            f"{game}_states",
+            ["user_id", "day_id"],
+            postgresql_include=["won", "points", "guesses_made"],
+            postgresql_where=sa.text("is_game_over"),
+        )
+
+
+def downgrade() -> None:
+    for game in reversed(GAMES):
+        op.drop_index(f"ix_{game}_states_history", table_name=f"{game}_states")
@@ -0,0 +1,40 @@
+"""state versions
+
+Revision ID: 5e2a9d4c7b16
+Revises: 9c4e1a7f2b38
+Create Date: 2026-10-20 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2a9d4c7b16"
+down_revision: Union[str, Sequence[str], None] = "9c4e1a7f2b38"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["countrydle_states", "powiatdle_states", "us_statedle_states", "wojewodztwodle_states"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column("version", sa.Integer(), server_default="0", nullable=False)
+        )
+        op.add_column(
+            table,
+            sa.Column(
+                "updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "updated_at")
+        op.drop_column(table, "version")
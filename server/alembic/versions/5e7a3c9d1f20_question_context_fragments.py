@@ -0,0 +1,97 @@
+"""question_context_fragments
+
+Revision ID: 5e7a3c9d1f20
+Revises: 9c4f1a6e2b87
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e7a3c9d1f20"
+down_revision: Union[str, Sequence[str], None] = "9c4f1a6e2b87"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# game: (fragment table, target column shared by the days and the fragments)
+GAMES = {
+    "countrydle": ("country_fragments", "country_id"),
+    "powiatdle": ("powiat_fragments", "powiat_id"),
+    "us_statedle": ("us_state_fragments", "us_state_id"),
+    "wojewodztwodle": ("wojewodztwo_fragments", "wojewodztwo_id"),
+}
+SEPARATOR = "E'\\n[ ... ]\\n'"
+
+
+def upgrade() -> None:
+    for game, (fragments, target) in GAMES.items():
+        for table in (f"{game}_questions", f"{game}_questions_archive"):
+            op.add_column(
+                table,
+                sa.Column(
+                    "context_fragments",
+                    postgresql.JSONB(astext_type=sa.Text()),
+                    nullable=True,
+                ),
+            )
+            # Swaps the stored context for references when every piece of it
+            # is still a fragment of the day's target. Scores were never kept.
+            op.execute(
+                f"""
+                WITH pieces AS (
+                    SELECT q.id, q.day_date, d.{target}, p.text, p.ord
+                    FROM {table} q
+                    JOIN {game}_days d ON d.id = q.day_id
+                    CROSS JOIN LATERAL unnest(string_to_array(q.context, {SEPARATOR}))
+                        WITH ORDINALITY AS p(text, ord)
+                    WHERE q.context <> ''
+                ),
+                matched AS (
+                    SELECT p.id, p.day_date, p.ord, min(f.id) AS fragment_id
+                    FROM pieces p
+                    LEFT JOIN {fragments} f ON f.{target} = p.{target} AND f.text = p.text
+                    GROUP BY p.id, p.day_date, p.ord
+                ),
+                resolved AS (
+                    SELECT id, day_date, jsonb_agg(
+                        jsonb_build_object('id', fragment_id, 'score', NULL) ORDER BY ord
+                    ) AS refs
+                    FROM matched
+                    GROUP BY id, day_date
+                    HAVING bool_and(fragment_id IS NOT NULL)
+                )
+                UPDATE {table} q
+                SET context_fragments = r.refs, context = NULL
+                FROM resolved r
+                WHERE q.id = r.id AND q.day_date = r.day_date
+                """
+            )
+            op.execute(
+                f"UPDATE {table} SET context_fragments = '[]', context = NULL "
+                "WHERE context = ''"
+            )
+
+
+def downgrade() -> None:
+    for game, (fragments, _) in reversed(GAMES.items()):
+        for table in (f"{game}_questions_archive", f"{game}_questions"):
+            op.execute(
+                f"""
+                UPDATE {table} q
+                SET context = coalesce((
+                    SELECT string_agg(f.text, {SEPARATOR} ORDER BY r.ord)
+                    FROM jsonb_array_elements(q.context_fragments)
+                        WITH ORDINALITY AS r(ref, ord)
+                    JOIN {fragments} f ON f.id = (r.ref->>'id')::int
+                ), '')
+                WHERE q.context_fragments IS NOT NULL
+                """
+            )
+            op.drop_column(table, "context_fragments")
@@ -0,0 +1,63 @@
+"""gameplay_user_day_indexes
+
+Revision ID: 6281421d8322
+Revises: 029b995f88ee
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6281421d8322"
+down_revision: Union[str, Sequence[str], None] = "029b995f88ee"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+
+
+def upgrade() -> None:
+    for game in GAMES:
+        # Concurrent first requests could create two states for the same player
+        # and day. Keep the one with the most progress.
+        op.execute(
+            f"""
+            DELETE FROM {game}_states s USING (
+                SELECT id, row_number() OVER (
+                    PARTITION BY user_id, day_id
+                    ORDER BY is_game_over DESC, questions_asked + guesses_made DESC, id
+                ) AS rn
+                FROM {game}_states
+                WHERE user_id IS NOT NULL
+            ) ranked
+            WHERE s.id = ranked.id AND ranked.rn > 1
+            """
+        )
+        op.create_index(
+            f"ix_{game}_states_user_id_day_id",
+            f"{game}_states",
+            ["user_id", "day_id"],
+            unique=True,
+        )
+        op.create_index(
+            f"ix_{game}_guesses_user_id_day_id",
+            f"{game}_guesses",
+            ["user_id", "day_id"],
+        )
+        op.create_index(
+            f"ix_{game}_questions_user_id_day_id",
+            f"{game}_questions",
+            ["user_id", "day_id"],
+        )
+
+
+def downgrade() -> None:
+    for game in reversed(GAMES):
+        op.drop_index(f"ix_{game}_questions_user_id_day_id", table_name=f"{game}_questions")
+        op.drop_index(f"ix_{game}_guesses_user_id_day_id", table_name=f"{game}_guesses")
+        op.drop_index(f"ix_{game}_states_user_id_day_id", table_name=f"{game}_states")
@@ -0,0 +1,70 @@
+"""email_outbox
+
+Revision ID: 7d2e6b0c9a41
+Revises: 5e7a3c9d1f20
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7d2e6b0c9a41"
+down_revision: Union[str, Sequence[str], None] = "5e7a3c9d1f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The unused sent_emails log becomes the outbox; its rows stay as sent
+    op.rename_table("sent_emails", "email_outbox")
+    op.execute("ALTER SEQUENCE sent_emails_id_seq RENAME TO email_outbox_id_seq")
+    op.execute("ALTER INDEX sent_emails_pkey RENAME TO email_outbox_pkey")
+    op.execute("ALTER INDEX ix_sent_emails_id RENAME TO ix_email_outbox_id")
+
+    op.add_column(
+        "email_outbox",
+        sa.Column("sender", sa.String(length=255), nullable=False, server_default=""),
+    )
+    op.add_column(
+        "email_outbox",
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "email_outbox",
+        sa.Column(
+            "next_attempt_at", sa.DateTime(), nullable=False, server_default=sa.func.now()
+        ),
+    )
+    op.add_column("email_outbox", sa.Column("last_error", sa.Text(), nullable=True))
+    op.add_column("email_outbox", sa.Column("sent_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE email_outbox SET sent_at = created_at WHERE status = 'sent'")
+    for column in ("sender", "attempts", "next_attempt_at"):
+        op.alter_column("email_outbox", column, server_default=None)
+
+    op.create_index(
+        "ix_email_outbox_due",
+        "email_outbox",
+        ["next_attempt_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_email_outbox_due",
+        table_name="email_outbox",
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+    for column in ("sent_at", "last_error", "next_attempt_at", "attempts", "sender"):
+        op.drop_column("email_outbox", column)
+
+    op.execute("ALTER INDEX ix_email_outbox_id RENAME TO ix_sent_emails_id")
+    op.execute("ALTER INDEX email_outbox_pkey RENAME TO sent_emails_pkey")
+    op.execute("ALTER SEQUENCE email_outbox_id_seq RENAME TO sent_emails_id_seq")
+    op.rename_table("email_outbox", "sent_emails")
@@ -0,0 +1,180 @@
+"""partition_questions_by_day
+
+Revision ID: 9c4f1a6e2b87
+Revises: 3b9e2d71c4a5
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c4f1a6e2b87"
+down_revision: Union[str, Sequence[str], None] = "3b9e2d71c4a5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+COLUMNS = (
+    "id, user_id, day_id, context, original_question, question, valid, answer, "
+    "explanation, asked_at"
+)
+
+
+def question_columns(game: str, id_column: sa.Column) -> list:
+    return [
+        id_column,
+        sa.Column("day_date", sa.Date(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("day_id", sa.Integer(), nullable=True),
+        sa.Column("context", sa.String(), nullable=True),
+        sa.Column("original_question", sa.String(), nullable=False),
+        sa.Column("question", sa.String(), nullable=True),
+        sa.Column("valid", sa.Boolean(), nullable=False),
+        sa.Column("answer", sa.Boolean(), nullable=True),
+        sa.Column("explanation", sa.String(), nullable=False),
+        sa.Column("asked_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["day_id"], [f"{game}_days.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id", "day_date"),
+    ]
+
+
+def month_start(day: date, months: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for game in GAMES:
+        table = f"{game}_questions"
+        op.rename_table(table, f"{table}_old")
+        op.drop_index(f"ix_{table}_id", table_name=f"{table}_old")
+        op.drop_index(f"ix_{table}_user_id_day_id", table_name=f"{table}_old")
+        # Frees the constraint names for the new table
+        op.drop_constraint(f"{table}_pkey", f"{table}_old", type_="primary")
+        for column in ("user_id", "day_id"):
+            op.drop_constraint(
+                f"{table}_{column}_fkey", f"{table}_old", type_="foreignkey"
+            )
+        # Keep the sequence, so ids keep counting from where they were
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+        op.create_table(
+            table,
+            *question_columns(
+                game,
+                sa.Column(
+                    "id",
+                    sa.Integer(),
+                    server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"),
+                    nullable=False,
+                ),
+            ),
+            postgresql_partition_by="RANGE (day_date)",
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        first = conn.scalar(
+            sa.text(
+                f"SELECT min(coalesce(d.date, q.asked_at::date)) FROM {table}_old q "
+                f"LEFT JOIN {game}_days d ON d.id = q.day_id"
+            )
+        )
+        today = date.today()
+        month, last = month_start(first or today), month_start(today, 1)
+        while month <= last:
+            end = month_start(month, 1)
+            op.execute(
+                f"CREATE TABLE {table}_{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month}') TO ('{end}')"
+            )
+            month = end
+
+        old_columns = ", ".join(f"q.{column}" for column in COLUMNS.split(", "))
+        op.execute(
+            f"""
+            INSERT INTO {table} (day_date, {COLUMNS})
+            SELECT coalesce(d.date, q.asked_at::date, current_date), {old_columns}
+            FROM {table}_old q
+            LEFT JOIN {game}_days d ON d.id = q.day_id
+            """
+        )
+        op.drop_table(f"{table}_old")
+        op.create_index(f"ix_{table}_id", table, ["id"])
+        op.create_index(f"ix_{table}_user_id_day_id", table, ["user_id", "day_id"])
+
+        op.create_table(
+            f"{table}_archive",
+            *question_columns(game, sa.Column("id", sa.Integer(), nullable=False)),
+        )
+        op.create_index(f"ix_{table}_archive_user_id", f"{table}_archive", ["user_id"])
+        # lz4 needs a server built with it; otherwise the default pglz is kept
+        op.execute(
+            f"""
+            DO $$
+            BEGIN
+                ALTER TABLE {table}_archive ALTER COLUMN context SET COMPRESSION lz4;
+            EXCEPTION WHEN feature_not_supported THEN NULL;
+            END $$
+            """
+        )
+        op.execute(f"ALTER TABLE {table}_archive SET (toast_tuple_target = 128)")
+
+
+def downgrade() -> None:
+    for game in reversed(GAMES):
+        table = f"{game}_questions"
+        op.rename_table(table, f"{table}_partitioned")
+        op.drop_index(f"ix_{table}_id", table_name=f"{table}_partitioned")
+        op.drop_index(f"ix_{table}_user_id_day_id", table_name=f"{table}_partitioned")
+        # Frees the constraint names for the new table
+        op.drop_constraint(f"{table}_pkey", f"{table}_partitioned", type_="primary")
+        for column in ("user_id", "day_id"):
+            op.drop_constraint(
+                f"{table}_{column}_fkey", f"{table}_partitioned", type_="foreignkey"
+            )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+        op.create_table(
+            table,
+            sa.Column(
+                "id",
+                sa.Integer(),
+                server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"),
+                nullable=False,
+            ),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("day_id", sa.Integer(), nullable=True),
+            sa.Column("context", sa.String(), nullable=True),
+            sa.Column("original_question", sa.String(), nullable=False),
+            sa.Column("question", sa.String(), nullable=True),
+            sa.Column("valid", sa.Boolean(), nullable=False),
+            sa.Column("answer", sa.Boolean(), nullable=True),
+            sa.Column("explanation", sa.String(), nullable=False),
+            sa.Column("asked_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["day_id"], [f"{game}_days.id"]),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.execute(
+            f"""
+            INSERT INTO {table} ({COLUMNS})
+            SELECT {COLUMNS} FROM {table}_archive
+            UNION ALL
+            SELECT {COLUMNS} FROM {table}_partitioned
+            """
+        )
+        op.drop_table(f"{table}_archive")
+        op.drop_table(f"{table}_partitioned")
+        op.create_index(f"ix_{table}_id", table, ["id"])
+        op.create_index(f"ix_{table}_user_id_day_id", table, ["user_id", "day_id"])
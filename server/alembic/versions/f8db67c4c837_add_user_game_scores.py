@@ -0,0 +1,81 @@
+"""add_user_game_scores
+
+Revision ID: f8db67c4c837
+Revises: 6281421d8322
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f8db67c4c837"
+down_revision: Union[str, Sequence[str], None] = "6281421d8322"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+HIDDEN_USERNAME_PATTERNS = r"ARRAY['test\_%', 'pytest\_%', 'guess\_c\_%', 'ask\_q\_%']"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_game_scores",
+        sa.Column("game", sa.String(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("points", sa.Integer(), nullable=False),
+        sa.Column("wins", sa.Integer(), nullable=False),
+        sa.Column("games_played", sa.Integer(), nullable=False),
+        sa.Column("streak", sa.Integer(), nullable=False),
+        sa.Column("longest_streak", sa.Integer(), nullable=False),
+        sa.Column("last_played", sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("game", "user_id"),
+    )
+    op.create_index(
+        "ix_user_game_scores_ranking",
+        "user_game_scores",
+        [
+            "game",
+            sa.text("points DESC"),
+            sa.text("wins DESC"),
+            sa.text("streak DESC"),
+            "user_id",
+        ],
+    )
+
+    for game in GAMES:
+        op.execute(
+            f"""
+            INSERT INTO user_game_scores
+                (game, user_id, points, wins, games_played, streak, longest_streak, last_played)
+            SELECT '{game}', s.user_id, coalesce(sum(s.points), 0),
+                count(*) FILTER (WHERE s.won), count(*), 0, 0, max(d.date)
+            FROM {game}_states s
+            JOIN {game}_days d ON d.id = s.day_id
+            JOIN users u ON u.id = s.user_id
+            WHERE s.is_game_over
+                AND (u.username IS NULL OR NOT u.username LIKE ANY ({HIDDEN_USERNAME_PATTERNS}))
+            GROUP BY s.user_id
+            """
+        )
+
+    # Countrydle points and streaks have always been kept in user_points
+    op.execute(
+        """
+        UPDATE user_game_scores g
+        SET points = p.points, streak = p.streak, longest_streak = p.longest_streak
+        FROM user_points p
+        WHERE g.game = 'countrydle' AND g.user_id = p.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_game_scores_ranking", table_name="user_game_scores")
+    op.drop_table("user_game_scores")
@@ -4,7 +4,6 @@ load_dotenv()
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi_mail import MessageSchema
 from utils.google import verify_google_token
 
 import datetime
@@ -13,7 +12,8 @@ from countrydle import router as countrydle_router
 from powiatdle import router as powiatdle_router
 from us_statedle import router as us_statedle_router
 from wojewodztwodle import router as wojewodztwodle_router
-from db import get_db
+from sync import router as sync_router
+from db import get_db, passwords, replica, telemetry
 
 from db.repositories.user import UserRepository
 from schemas.user import GoogleSignIn, UserCreate, UserDisplay
@@ -33,16 +33,56 @@ from users import router as users_router
 from users.utils import (
     create_access_token,
     send_verification_email,
+    user_claims,
     verify_email_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
 
-from utils.email import fm_noreply
+from utils.email import queue_email
+from utils import (
+    auth_cache,
+    catalogs,
+    daily_targets,
+    email,
+    google,
+    history,
+    idempotency,
+    profile_stats,
+    rate_limit,
+    retention,
+    state_cache,
+)
 
 app = FastAPI(lifespan=lifespan)
 
 SERVER_VERSION = "1.0.9"
 
+
+@app.middleware("http")
+async def db_telemetry(request: Request, call_next):
+    with telemetry.track() as db:
+        response = await call_next(request)
+
+    route = request.scope.get("route")
+    telemetry.record(f"{request.method} {route.path if route else 'unmatched'}", db)
+    if telemetry.DEBUG:
+        response.headers.update(db.headers())
+    return response
+
+
+@app.middleware("http")
+async def idempotency_keys(request: Request, call_next):
+    return await idempotency.handle(request, call_next)
+
+
+# Outside the others, so a limited client costs neither an idempotency key nor a session
+@app.middleware("http")
+async def rate_limits(request: Request, call_next):
+    return await rate_limit.handle(request, call_next)
+
+
+# Added last so it is outermost: responses the middlewares above answer on
+# their own (429s, replays, conflicts) must carry the CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -57,8 +97,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The client reads these on 429s and conditional GETs
+    expose_headers=["Retry-After", "ETag"],
 )
 
+
 templates = Jinja2Templates(directory="templates")
 
 app.mount("/static", StaticFiles(directory="templates"), name="static")
@@ -68,6 +111,7 @@ app.include_router(countrydle_router, tags=["countrydle"])
 app.include_router(powiatdle_router, tags=["powiatdle"])
 app.include_router(us_statedle_router, tags=["us_statedle"])
 app.include_router(wojewodztwodle_router, tags=["wojewodztwodle"])
+app.include_router(sync_router, tags=["sync"])
 
 
 
@@ -84,28 +128,30 @@ async def get_version():
 
 @app.get("/time")
 async def get_server_time():
-    """Returns the current server time and the time until the next midnight (UTC)"""
+    """Returns the current server time and the moment the next game day starts"""
     now = datetime.datetime.now(datetime.timezone.utc)
-    tomorrow = now + datetime.timedelta(days=1)
-    next_midnight = datetime.datetime(
-        year=tomorrow.year,
-        month=tomorrow.month,
-        day=tomorrow.day,
-        hour=0,
-        minute=0,
-        second=0,
-        microsecond=0,
-        tzinfo=datetime.timezone.utc
-    )
-    
-    # If the server uses local time for date.today(), we should probably use local time here too.
-    # However, standard practice is usually UTC. 
-    # Let's check if date.today() is timezone aware. It usually returns local date.
-    # If the server is running in UTC (which it likely is in Docker), then UTC is correct.
-    
     return {
         "server_time": now.isoformat(),
-        "next_game_at": next_midnight.isoformat()
+        "next_game_at": daily_targets.next_rollover().isoformat()
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "db": telemetry.stats(),
+        "replica": replica.stats() if replica else None,
+        "daily_targets": daily_targets.stats(),
+        "history": history.stats(),
+        "catalogs": catalogs.stats(),
+        "profile_stats": profile_stats.stats(),
+        "retention": retention.stats(),
+        "auth_cache": auth_cache.stats(),
+        "google_keys": google.stats(),
+        "email_outbox": email.stats(),
+        "idempotency": idempotency.stats(),
+        "rate_limit": rate_limit.stats(),
+        "state_cache": state_cache.stats(),
     }
 
 
@@ -116,11 +162,17 @@ async def login(
     session: AsyncSession = Depends(get_db),
 ):
     user = await UserRepository(session).get_user(form_data.username)
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-    if not user or not UserRepository.verify_password(
+    valid, new_hash = await passwords.verify_and_update(
         form_data.password, user.hashed_password
-    ):
+    )
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        await UserRepository(session).rehash_password(user, new_hash)
+        await session.commit()
 
     # if not user.verified:
     #     raise HTTPException(
@@ -128,7 +180,7 @@ async def login(
     #         detail="User's email is not verified! Verify your email before login!",
     #     )
 
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data=user_claims(user))
 
     expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
@@ -151,25 +203,23 @@ async def login(
 async def google_signin(
     credential: GoogleSignIn,
     response: Response,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_db),
 ):
-    token_info = verify_google_token(credential.credential)
+    token_info = await verify_google_token(credential.credential)
     user = await UserRepository(session).get_by_email(token_info["email"])
 
     if not user:
         user = await UserRepository(session).register_by_google(token_info)
-        message = MessageSchema(
-            subject="Verify Your Email",
-            recipients=[user.email],  # List of recipients
-            subtype="html",
-            template_body={"username": user.username},
-        )
-        background_tasks.add_task(
-            fm_noreply.send_message, message, template_name="google_login_alert.html"
+        await queue_email(
+            session,
+            user.email,
+            "Verify Your Email",
+            "google_login_alert.html",
+            {"username": user.username},
         )
+        await session.commit()
 
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data=user_claims(user))
 
     expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
@@ -208,7 +258,7 @@ async def register(
     session: AsyncSession = Depends(get_db),
 ):
     new_user = await UserRepository(session).register_user(user=user)
-    # await send_verification_email(new_user, background_tasks)
+    # await send_verification_email(new_user, session)
     return {"message": "User registered successfully!", "ok": True}
 
 
@@ -1,44 +1,29 @@
+"""Deletes test accounts and old guest questions right away.
+
+The same cleanup runs every night from the scheduler; this is for clearing
+the database after a test run without waiting for it. Test accounts of any
+age are deleted, in chunks, with their games.
+"""
+
 import asyncio
-import os
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import text
-from dotenv import load_dotenv
+import logging
 
-load_dotenv()
+from db import engine
+from utils import daily_targets, retention
 
-# Use internal docker DB URL
-DB_URL = "postgresql+asyncpg://postgres:root@db:5432/guess_country"
 
 async def main():
-    print(f"Connecting to DB: {DB_URL}")
     try:
-        engine = create_async_engine(DB_URL)
-        async with engine.connect() as conn:
-            patterns = ['test_%', 'pytest_%', 'guess_c_%', 'ask_q_%', 'guest_%']
-            
-            print("Cleaning up test users...")
-            total_deleted = 0
-            
-            for p in patterns:
-                # Count first
-                result = await conn.execute(text(f"SELECT COUNT(*) FROM users WHERE username LIKE '{p}'"))
-                count = result.scalar()
-                
-                if count > 0:
-                    print(f"Found {count} users matching pattern '{p}'")
-                    # Delete
-                    await conn.execute(text(f"DELETE FROM users WHERE username LIKE '{p}'"))
-                    await conn.commit()
-                    print(f"Deleted users matching '{p}'")
-                    total_deleted += count
-                else:
-                    print(f"No users found for pattern '{p}'")
-            
-            print(f"\nTotal users deleted: {total_deleted}")
-                
+        report = await retention.run(
+            engine, daily_targets.game_today(), test_user_retention_hours=0
+        )
+        for table, rows in report.deleted.items():
+            print(f"{table}: {rows}")
+        print(f"\nTotal: {report.summary()}")
+    finally:
         await engine.dispose()
-    except Exception as e:
-        print(f"Error: {e}")
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
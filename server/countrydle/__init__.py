@@ -19,10 +19,10 @@ from schemas.countrydle import (
     QuestionDisplay,
 )
 from schemas.country import CountryDisplay
+from schemas.fragment import QuestionContext
 from schemas.user import UserDisplay
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import update
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from countrydle import statistics
 from db.repositories.guess import (
@@ -32,11 +32,11 @@ from db.repositories.question import (
     CountrydleQuestionsRepository,
 )
 from qdrant.utils import add_question_to_qdrant
-from db.repositories.country import CountryRepository
 from users.utils import get_current_or_guest_user, get_current_user
+from utils import catalogs, daily_targets, question_context, state_cache
 
 import countrydle.utils as gutils
-from game_logic import GameConfig, GameRules, GameState
+from game_logic import GameConfig, GameRules
 
 load_dotenv()
 
@@ -49,176 +49,68 @@ COUNTRYDLE_CONFIG = GameConfig(max_questions=10, max_guesses=3)
 game_rules = GameRules(COUNTRYDLE_CONFIG)
 
 
-def db_state_to_game_state(db_state) -> GameState:
-    """Helper to convert DB state to Logic GameState"""
-    return GameState(
-        questions_used=COUNTRYDLE_CONFIG.max_questions - db_state.remaining_questions,
-        guesses_used=COUNTRYDLE_CONFIG.max_guesses - db_state.remaining_guesses,
-        is_won=db_state.won,
-        is_lost=db_state.is_game_over and not db_state.won,
-    )
-
-
 @router.post("/sync", response_model=CountrydleStateResponse)
 async def sync_guest_data(
     sync_data: CountrydleSyncSchema,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
 ):
-    from datetime import datetime
-    
-    # 1. Get the day country
-    try:
-        game_date = datetime.strptime(sync_data.date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-        
-    day_country = await CountrydleRepository(session).get_day_country_by_date(game_date)
-    if not day_country:
-        raise HTTPException(status_code=404, detail="Game for this date not found.")
-
-    # 2. Get or create user state
-    state = await CountrydleStateRepository(session).get_state(
-        user,
-        day_country,
-        max_questions=COUNTRYDLE_CONFIG.max_questions,
-        max_guesses=COUNTRYDLE_CONFIG.max_guesses,
-    )
-    
-    # BEST SOLUTION: Prioritize Server State
-    # If the user already has any progress on the server (at least 1 question or guess),
-    # we ignore the guest sync to prevent merging conflicts or exceeding game limits.
-    if state.questions_asked > 0 or state.guesses_made > 0:
-        return await get_state(user, session)
-
-    # 3. Update questions - only claim those that belong to this day and have no user assigned
-    if sync_data.questions:
-        from db.models import CountrydleQuestion
-        await session.execute(
-            update(CountrydleQuestion)
-            .where(
-                CountrydleQuestion.id.in_(sync_data.questions), 
-                CountrydleQuestion.user_id == None,
-                CountrydleQuestion.day_id == day_country.id
-            )
-            .values(user_id=user.id)
-        )
-
-    # 4. Create guesses
-    for guess in sync_data.guesses:
-        is_correct = False
-        if guess.country_id is not None:
-            is_correct = guess.country_id == day_country.country_id
-            
-        guess_create = GuessCreate(
-            guess=guess.guess,
-            country_id=guess.country_id,
-            day_id=day_country.id,
-            user_id=user.id,
-            answer=is_correct,
-        )
-        await CountrydleGuessRepository(session).add_guess(guess_create)
-
-    # 5. Update state
-    state.remaining_questions = sync_data.state.remaining_questions
-    state.remaining_guesses = sync_data.state.remaining_guesses
-    state.questions_asked = sync_data.state.questions_asked
-    state.guesses_made = sync_data.state.guesses_made
-    state.is_game_over = sync_data.state.is_game_over
-    state.won = sync_data.state.won
-    
-    if state.won:
-        state.points = await CountrydleStateRepository(session).calc_points(state)
-        
-    if state.is_game_over:
-        from db.repositories.user import UserRepository
-        await UserRepository(session).update_points(user.id, state)
-
-    await CountrydleStateRepository(session).update_countrydle_state(state)
-    
-    return await get_state(user, session)
-
+    # Imported here, since the bulk /sync is built on these routers
+    from sync import sync_game
 
-@router.get("/end/state", response_model=CountrydleEndStateResponse)
-async def get_end_state(
-    user: User = Depends(get_current_or_guest_user),
-    session: AsyncSession = Depends(get_db),
-):
-    day_country = await CountrydleRepository(session).get_today_country()
-    state = await CountrydleStateRepository(session).get_state(
-        user,
-        day_country,
-        max_questions=COUNTRYDLE_CONFIG.max_questions,
-        max_guesses=COUNTRYDLE_CONFIG.max_guesses,
-    )
-    guesses = await CountrydleGuessRepository(session).get_user_day_guesses(
-        user, day_country
-    )
-    questions = await CountrydleQuestionsRepository(session).get_user_day_questions(
-        user, day_country
-    )
+    # The outcome is worked out from the guesses, never taken from the client
+    await sync_game("countrydle", sync_data, user, session)
+    response = await get_state(user, session)
+    await session.commit()
+    return response
 
-    if not state.is_game_over:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The target country is only available after the game is over.",
-        )
 
-    country = await CountryRepository(session).get(day_country.country_id)
+def end_state_response(user: User, day_country, state) -> CountrydleEndStateResponse:
     return CountrydleEndStateResponse(
         user=user,
         date=str(day_country.date),
-        country=country,
+        country=day_country.country,
         state=CountrydleEndStateSchema.model_validate(state),
-        guesses=guesses,
-        questions=questions,
+        guesses=state.guesses,
+        questions=state.questions,
     )
 
 
-@router.get(
-    "/state", response_model=Union[CountrydleStateResponse, CountrydleEndStateResponse]
-)
-async def get_state(
-    user: User | None = Depends(get_current_or_guest_user),
+@router.get("/end/state", response_model=CountrydleEndStateResponse)
+async def get_end_state(
+    request: Request,
+    user: User = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_country = await CountrydleRepository(session).get_today_country()
-    if not day_country:
-        day_country = await CountrydleRepository(session).generate_new_day_country()
+    day_country = await daily_targets.get_today("countrydle", session)
 
-    if user is None:
-        return CountrydleStateResponse(
-            user=None,
-            date=str(day_country.date),
-            state=CountrydleStateSchema(
-                remaining_questions=COUNTRYDLE_CONFIG.max_questions,
-                remaining_guesses=COUNTRYDLE_CONFIG.max_guesses,
-                questions_asked=0,
-                guesses_made=0,
-                is_game_over=False,
-                won=False,
-            ),
-            guesses=[],
-            questions=[],
-            country=None,
-        )
+    async def build():
+        state = None
+        if user is not None:
+            state = await CountrydleStateRepository(session).load_state(user, day_country)
+        if state is None or not state.is_game_over:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The target country is only available after the game is over.",
+            )
+        return state, end_state_response(user, day_country, state)
 
-    state = await CountrydleStateRepository(session).get_state(
+    if user is None:
+        return (await build())[1]
+    return await state_cache.respond(
+        request,
+        "countrydle",
+        "end/state",
         user,
         day_country,
-        max_questions=COUNTRYDLE_CONFIG.max_questions,
-        max_guesses=COUNTRYDLE_CONFIG.max_guesses,
+        CountrydleStateRepository(session),
+        build,
     )
 
-    if state and state.is_game_over:
-        return await get_end_state(user, session)
 
-    guesses = await CountrydleGuessRepository(session).get_user_day_guesses(
-        user, day_country
-    )
-    questions = await CountrydleQuestionsRepository(session).get_user_day_questions(
-        user, day_country
-    )
+async def state_response(user: User, day_country, session: AsyncSession):
+    """Loads the user's state, starting the game if need be, with the response for it."""
+    state = await CountrydleStateRepository(session).load_state(user, day_country)
 
     if state is None:
         new_state = await CountrydleStateRepository(session).add_countrydle_state(
@@ -227,7 +119,8 @@ async def get_state(
             max_questions=COUNTRYDLE_CONFIG.max_questions,
             max_guesses=COUNTRYDLE_CONFIG.max_guesses,
         )
-        return CountrydleStateResponse(
+        await session.commit()
+        return new_state, CountrydleStateResponse(
             user=user,
             date=str(day_country.date),
             state=CountrydleStateSchema.model_validate(new_state),
@@ -236,32 +129,86 @@ async def get_state(
             country=None,
         )
 
+    if state.is_game_over:
+        return state, end_state_response(user, day_country, state)
+
     questions_display = [
         (
             QuestionDisplay.model_validate(question)
             if question.valid
             else InvalidQuestionDisplay.model_validate(question)
         )
-        for question in questions
+        for question in state.questions
     ]
 
     response_state = CountrydleStateSchema.model_validate(state)
 
-    return CountrydleStateResponse(
+    return state, CountrydleStateResponse(
         user=user,
         date=str(day_country.date),
         state=response_state,
-        guesses=guesses,
+        guesses=state.guesses,
         questions=questions_display,
         country=None,
     )
 
 
+async def get_state(
+    user: User | None, session: AsyncSession
+) -> Union[CountrydleStateResponse, CountrydleEndStateResponse]:
+    """What GET /state answers, without the validators; the sync endpoints answer with it too."""
+    day_country = await daily_targets.get_today("countrydle", session)
+
+    if user is None:
+        return CountrydleStateResponse(
+            user=None,
+            date=str(day_country.date),
+            state=CountrydleStateSchema(
+                remaining_questions=COUNTRYDLE_CONFIG.max_questions,
+                remaining_guesses=COUNTRYDLE_CONFIG.max_guesses,
+                questions_asked=0,
+                guesses_made=0,
+                is_game_over=False,
+                won=False,
+            ),
+            guesses=[],
+            questions=[],
+            country=None,
+        )
+
+    _, response = await state_response(user, day_country, session)
+    return response
+
+
+@router.get(
+    "/state", response_model=Union[CountrydleStateResponse, CountrydleEndStateResponse]
+)
+async def read_state(
+    request: Request,
+    user: User | None = Depends(get_current_or_guest_user),
+    session: AsyncSession = Depends(get_db),
+):
+    if user is None:
+        return await get_state(user, session)
+
+    day_country = await daily_targets.get_today("countrydle", session)
+    return await state_cache.respond(
+        request,
+        "countrydle",
+        "state",
+        user,
+        day_country,
+        CountrydleStateRepository(session),
+        lambda: state_response(user, day_country, session),
+    )
+
+
 @router.get("/countries", response_model=list[CountryDisplay])
 async def get_countries(
+    request: Request,
     session: AsyncSession = Depends(get_db),
 ):
-    return await CountryRepository(session).get_all_countries()
+    return await catalogs.respond(request, "countrydle", session)
 
 
 @router.post("/question", response_model=Union[QuestionDisplay, InvalidQuestionDisplay])
@@ -270,9 +217,7 @@ async def ask_question(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    daily_country = await CountrydleRepository(session).get_today_country()
-    if not daily_country:
-        daily_country = await CountrydleRepository(session).generate_new_day_country()
+    daily_country = await daily_targets.get_today("countrydle", session)
 
     if user is None:
         enh_question = await gutils.enhance_question(question.question)
@@ -291,6 +236,7 @@ async def ask_question(
             new_quest = await CountrydleQuestionsRepository(session).create_question(
                 question_create
             )
+            await session.commit()
             return InvalidQuestionDisplay.model_validate(new_quest)
 
         question_create, question_vector = await gutils.ask_question(
@@ -303,6 +249,7 @@ async def ask_question(
         new_quest = await CountrydleQuestionsRepository(session).create_question(
             question_create
         )
+        await session.commit()
 
         if question_vector:
             await add_question_to_qdrant(
@@ -316,62 +263,54 @@ async def ask_question(
 
         return QuestionDisplay.model_validate(new_quest)
 
-    state = await CountrydleStateRepository(session).get_player_countrydle_state(
-        user,
-        daily_country,
-        max_questions=COUNTRYDLE_CONFIG.max_questions,
-        max_guesses=COUNTRYDLE_CONFIG.max_guesses,
-    )
-
-    # Use Game Logic
-    current_game_state = db_state_to_game_state(state)
-
-    if not game_rules.can_ask_question(current_game_state):
+    state_repository = CountrydleStateRepository(session)
+    if await state_repository.reserve_question(user, daily_country, game_rules) is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User has no more questions left or game is over!",
         )
+    # Committed before the LLM is called, so a concurrent request cannot take
+    # the same question while this one waits for the answer
+    await session.commit()
 
-    enh_question = await gutils.enhance_question(question.question)
-    if not enh_question.valid:
-        question_create = QuestionCreate(
-            user_id=user.id,
-            day_id=daily_country.id,
-            original_question=enh_question.original_question,
-            valid=enh_question.valid,
-            question=enh_question.question,
-            answer=None,
-            explanation=enh_question.explanation,
-            context=None,
-        )
-        new_quest = await CountrydleQuestionsRepository(session).create_question(
-            question_create
-        )
+    try:
+        enh_question = await gutils.enhance_question(question.question)
+        if not enh_question.valid:
+            question_create = QuestionCreate(
+                user_id=user.id,
+                day_id=daily_country.id,
+                original_question=enh_question.original_question,
+                valid=enh_question.valid,
+                question=enh_question.question,
+                answer=None,
+                explanation=enh_question.explanation,
+                context=None,
+            )
+            new_quest = await CountrydleQuestionsRepository(session).create_question(
+                question_create
+            )
+            await state_repository.bump_version(user, daily_country)
+            await session.commit()
 
-        # Update Logic State
-        try:
-            new_game_state = game_rules.process_question(current_game_state)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            return InvalidQuestionDisplay.model_validate(new_quest)
 
-        state.remaining_questions = (
-            COUNTRYDLE_CONFIG.max_questions - new_game_state.questions_used
+        question_create, question_vector = await gutils.ask_question(
+            question=enh_question,
+            day_country=daily_country,
+            user=user,
+            session=session,
         )
-        state.questions_asked += 1
-        state = await CountrydleStateRepository(session).update_countrydle_state(state)
-
-        return InvalidQuestionDisplay.model_validate(new_quest)
 
-    question_create, question_vector = await gutils.ask_question(
-        question=enh_question,
-        day_country=daily_country,
-        user=user,
-        session=session,
-    )
-
-    new_quest = await CountrydleQuestionsRepository(session).create_question(
-        question_create
-    )
+        new_quest = await CountrydleQuestionsRepository(session).create_question(
+            question_create
+        )
+        await state_repository.bump_version(user, daily_country)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        await state_repository.release_question(user, daily_country)
+        await session.commit()
+        raise
 
     await add_question_to_qdrant(
         new_quest,
@@ -381,31 +320,44 @@ async def ask_question(
         collection_name="countries_questions",
     )
 
-    # Update Logic State
-    try:
-        new_game_state = game_rules.process_question(current_game_state)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return QuestionDisplay.model_validate(new_quest)
 
-    state.remaining_questions = (
-        COUNTRYDLE_CONFIG.max_questions - new_game_state.questions_used
-    )
-    state.questions_asked += 1
-    state = await CountrydleStateRepository(session).update_countrydle_state(state)
 
-    return QuestionDisplay.model_validate(new_quest)
+@router.get("/question/{question_id}/context", response_model=QuestionContext)
+async def get_question_context(
+    question_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    day_country = await daily_targets.get_today("countrydle", session)
+    state = await CountrydleStateRepository(session).load_state(user, day_country)
+
+    # The context describes the target, so it stays hidden until the game is over
+    if state is None or not state.is_game_over:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Question context is only available after the game is over.",
+        )
+
+    question = next((q for q in state.questions if q.id == question_id), None)
+    if question is None:
+        raise HTTPException(status_code=404, detail="Question not found.")
+
+    return await question_context.get_context("countrydle", question, session)
 
 
 @router.get("/reveal", response_model=CountryDisplay)
 async def reveal_country(
+    request: Request,
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_country = await CountrydleRepository(session).get_today_country()
-    if not day_country:
-        raise HTTPException(status_code=404, detail="No game today")
-        
-    if user is not None:
+    day_country = await daily_targets.get_today("countrydle", session)
+
+    if user is None:
+        return day_country.country
+
+    async def build():
         state = await CountrydleStateRepository(session).get_state(
             user,
             day_country,
@@ -417,9 +369,18 @@ async def reveal_country(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Cannot reveal country before game is over.",
             )
-            
-    country = await CountryRepository(session).get(day_country.country_id)
-    return country
+        return state, CountryDisplay.model_validate(day_country.country)
+
+    return await state_cache.respond(
+        request,
+        "countrydle",
+        "reveal",
+        user,
+        day_country,
+        CountrydleStateRepository(session),
+        build,
+    )
+
 
 @router.post("/guess", response_model=GuessDisplay)
 async def make_guess(
@@ -427,9 +388,7 @@ async def make_guess(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    daily_country = await CountrydleRepository(session).get_today_country()
-    if not daily_country:
-        daily_country = await CountrydleRepository(session).generate_new_day_country()
+    daily_country = await daily_targets.get_today("countrydle", session)
 
     if user is None:
         is_correct = False
@@ -445,28 +404,22 @@ async def make_guess(
             guessed_at=datetime.now()
         )
 
-    state = await CountrydleStateRepository(session).get_player_countrydle_state(
-        user,
-        daily_country,
-        max_questions=COUNTRYDLE_CONFIG.max_questions,
-        max_guesses=COUNTRYDLE_CONFIG.max_guesses,
-    )
+    # Check if guess is correct
+    is_correct = False
 
-    # Use Game Logic
-    current_game_state = db_state_to_game_state(state)
+    if guess.country_id is not None:
+        is_correct = guess.country_id == daily_country.country_id
 
-    if not game_rules.can_make_guess(current_game_state):
+    state_repository = CountrydleStateRepository(session)
+    state = await state_repository.record_guess(
+        user, daily_country, game_rules, is_correct
+    )
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User has no more guesses left or game is over!",
         )
 
-    # Check if guess is correct
-    is_correct = False
-
-    if guess.country_id is not None:
-        is_correct = guess.country_id == daily_country.country_id
-
     # Create Guess entry
     guess_create = GuessCreate(
         guess=guess.guess,
@@ -478,7 +431,8 @@ async def make_guess(
 
     new_guess = await CountrydleGuessRepository(session).add_guess(guess_create)
 
-    # Update State using Repository logic (handles points, game over, etc.)
-    await CountrydleStateRepository(session).guess_made(state, new_guess)
+    # Points and leaderboard, if the guess ended the game
+    await state_repository.guess_made(state, new_guess)
+    await session.commit()
 
     return GuessDisplay.model_validate(new_guess)
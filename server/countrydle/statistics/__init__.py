@@ -1,14 +1,28 @@
 import logging
-from db import get_db
+from datetime import date
+from db import get_read_db
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from schemas.countrydle import CountrydleHistory, LeaderboardEntry, UserStatistics
-from db.repositories.countrydle import CountrydleRepository, CountrydleStateRepository
+from schemas.countrydle import (
+    CountrydleHistory,
+    LeaderboardEntry,
+    LeaderboardRank,
+    UserStatistics,
+)
+from schemas.statistics import GameHistoryEntry
+from db.repositories.countrydle import CountrydleRepository
+from db.repositories.leaderboard import LeaderboardRepository
+from db.repositories.statistics import (
+    HISTORY_LIMIT,
+    MAX_HISTORY_LIMIT,
+    ProfileStatisticsRepository,
+)
 from db.models.user import User
 from db.repositories.user import UserRepository
 from users.utils import get_current_user
+from utils import daily_targets, history
 
 
 load_dotenv()
@@ -17,31 +31,51 @@ router = APIRouter(prefix="/statistics")
 
 
 @router.get("/history", response_model=CountrydleHistory)
-async def gey_history(session: AsyncSession = Depends(get_db)):
-    daily_countries = await CountrydleRepository(session).get_countrydle_history()
-    countries_count = await CountrydleRepository(session).get_countries_count()
-    return CountrydleHistory(
-        daily_countries=daily_countries,
-        countries_count=countries_count,
-    )
+async def gey_history(
+    request: Request,
+    before: date | None = Query(None, description="Only days before this date"),
+    limit: int = Query(history.HISTORY_PAGE_SIZE, ge=1, le=history.MAX_HISTORY_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_db),
+):
+    page = await history.get_page("countrydle", session, before, limit)
+    content = b'{"countries_count":%s,"daily_countries":%s}' % (page.summary, page.days)
+    return history.respond(request, page.etag, content)
 
 
 @router.get("/leaderboard", response_model=list[LeaderboardEntry])
-async def get_leaderboard(session: AsyncSession = Depends(get_db)):
-    leaderboard = await CountrydleRepository(session).get_leaderboard()
-    return leaderboard
+async def get_leaderboard(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await LeaderboardRepository(session).get_leaderboard(
+        "countrydle", limit, offset
+    )
 
 
-@router.get("/history/me")
-async def gey_history(
-    user: User = Depends(get_current_user), session: AsyncSession = Depends(get_db)
+@router.get("/leaderboard/me", response_model=LeaderboardRank)
+async def get_my_rank(
+    user: User = Depends(get_current_user), session: AsyncSession = Depends(get_read_db)
 ):
-    data = await CountrydleStateRepository(session).get_player_countrydle_states(user)
-    return data
+    return await LeaderboardRepository(session).get_rank("countrydle", user)
+
+
+@router.get("/history/me", response_model=list[GameHistoryEntry])
+async def get_my_history(
+    before: int | None = Query(None, description="Day id of the last entry already loaded"),
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=MAX_HISTORY_LIMIT),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await ProfileStatisticsRepository(session).get_history(
+        "countrydle", user, before, limit
+    )
 
 
 @router.get("/users/{username}", response_model=UserStatistics)
-async def get_user_statistics(username: str, session: AsyncSession = Depends(get_db)):
+async def get_user_statistics(username: str, session: AsyncSession = Depends(get_read_db)):
     user = await UserRepository(session).get_user(username)
-    profile = await CountrydleRepository(session).get_user_statistics(user)
+    profile = await CountrydleRepository(session).get_user_statistics(
+        user, daily_targets.game_today()
+    )
     return profile
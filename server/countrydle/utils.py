@@ -6,7 +6,11 @@ from openai import OpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Country, CountrydleDay, User
-from qdrant.utils import get_fragments_matching_question
+from qdrant.utils import (
+    CONTEXT_SEPARATOR,
+    fragment_refs,
+    get_fragments_matching_question,
+)
 import qdrant
 from schemas.country import DayCountryDisplay
 from schemas.countrydle import QuestionCreate, QuestionEnhanced
@@ -107,7 +111,7 @@ async def ask_question(
     fragments, question_vector = await get_fragments_matching_question(
         question.question, "country_id", day_country.country_id, "countries", session, limit=qdrant.COUNTRYDLE_CONTEXT_LIMIT
     )
-    context = "\n[ ... ]\n".join(fragment.text for fragment in fragments)
+    context = CONTEXT_SEPARATOR.join(fragment.text for fragment in fragments)
     country: Country = await CountryRepository(session).get(day_country.country_id)
 
     system_prompt = f"""
@@ -158,6 +162,7 @@ You are the 'Game Master' for Countrydle. Your task is to answer a True/False qu
         print(answer)
         raise
 
+    refs = fragment_refs(fragments)
     question_create = QuestionCreate(
         user_id=user.id if user else None,
         day_id=day_country.id,
@@ -166,7 +171,9 @@ You are the 'Game Master' for Countrydle. Your task is to answer a True/False qu
         question=question.question,
         answer=answer_dict.get("answer"),
         explanation=answer_dict.get("explanation") or "No explanation provided.",
-        context=context,
+        # The fragments already live in Postgres, so only point at them
+        context=context if refs is None else None,
+        context_fragments=refs,
     )
 
     return question_create, question_vector
@@ -1,20 +1,62 @@
 import os
 
 from dotenv import load_dotenv
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from db.replica import ReplicaMonitor
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_async_engine(DATABASE_URL)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Optional streaming replica for statistics, leaderboards and profiles
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+# Seconds of replication lag tolerated before reads go back to the primary
+MAX_REPLICA_LAG = float(os.getenv("MAX_REPLICA_LAG", 30))
+read_engine = None
+ReadSessionLocal = None
+replica = None
+if READ_DATABASE_URL:
+    read_engine = create_async_engine(
+        READ_DATABASE_URL,
+        pool_pre_ping=True,
+        execution_options={"postgresql_readonly": True},
+    )
+    ReadSessionLocal = sessionmaker(
+        read_engine, class_=AsyncSession, expire_on_commit=False
+    )
+    replica = ReplicaMonitor(read_engine, MAX_REPLICA_LAG)
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
 
+async def get_read_db():
+    """Session for reads that may lag the primary by up to MAX_REPLICA_LAG seconds.
+
+    Falls back to the primary when no replica is configured or it is down or
+    too far behind.
+    """
+    if replica is None or not await replica.usable():
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+
+    async with ReadSessionLocal() as session:
+        session.info["replica"] = True
+        try:
+            yield session
+        except (OSError, DBAPIError) as e:
+            if isinstance(e, OSError) or e.connection_invalidated:
+                replica.mark_down()
+            raise
+
+
 def get_engine():
     return engine
@@ -11,4 +11,7 @@ from .fragment import CountryFragment, PowiatFragment, WojewodztwoFragment, USSt
 
 from .user import User, Permission, UserPermission, AccountUpdate, UserPoints
 from .guess import CountrydleGuess
-from .email import SentEmail
+from .email import OutboxEmail
+from .leaderboard import UserGameScore
+from .idempotency_key import IdempotencyKey
+from .rate_limit_bucket import RateLimitBucket
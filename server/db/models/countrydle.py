@@ -6,10 +6,12 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     and_,
+    text,
 )
 from sqlalchemy.orm import relationship, foreign
 from sqlalchemy.sql import func
@@ -25,13 +27,24 @@ class CountrydleDay(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     country_id = Column(Integer, ForeignKey("countries.id"))
-    date = Column(Date, nullable=False, default=func.now())
+    date = Column(Date, nullable=False, unique=True, default=func.now())
 
     country = relationship("Country")
 
 
 class CountrydleState(Base):
     __tablename__ = "countrydle_states"
+    __table_args__ = (
+        Index("ix_countrydle_states_user_id_day_id", "user_id", "day_id", unique=True),
+        # Covers a player's finished games, newest first, for the history pages
+        Index(
+            "ix_countrydle_states_history",
+            "user_id",
+            "day_id",
+            postgresql_include=["won", "points", "guesses_made"],
+            postgresql_where=text("is_game_over"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -43,6 +56,32 @@ class CountrydleState(Base):
     is_game_over = Column(Boolean, nullable=False, default=False)
     won = Column(Boolean, nullable=False, default=False)
     points = Column(Integer, nullable=False, default=0)
+    # Bumped by every change to the row, for the ETags of the state endpoints
+    version = Column(
+        Integer, nullable=False, default=0, server_default="0", onupdate=text("version + 1")
+    )
+    updated_at = Column(
+        DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+
+    # Fetches the new version with RETURNING instead of expiring it
+    __mapper_args__ = {"eager_defaults": True}
 
     user = relationship("User")
     day = relationship("CountrydleDay")
+
+    # Same (user, day) pair, so the whole game loads with the state in one query
+    guesses = relationship(
+        "CountrydleGuess",
+        primaryjoin="and_(foreign(CountrydleGuess.user_id) == CountrydleState.user_id, "
+        "foreign(CountrydleGuess.day_id) == CountrydleState.day_id)",
+        order_by="CountrydleGuess.id",
+        viewonly=True,
+    )
+    questions = relationship(
+        "CountrydleQuestion",
+        primaryjoin="and_(foreign(CountrydleQuestion.user_id) == CountrydleState.user_id, "
+        "foreign(CountrydleQuestion.day_id) == CountrydleState.day_id)",
+        order_by="CountrydleQuestion.id",
+        viewonly=True,
+    )
@@ -1,36 +1,33 @@
-from passlib.context import CryptContext
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import (
-    Boolean,
-    Column,
-    Date,
-    DateTime,
-    ForeignKey,
-    Integer,
-    String,
-    Text,
-    and_,
-)
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, text
 from sqlalchemy.sql import func
 
 from db.base import Base
 
 
-class SentEmail(Base):
-    __tablename__ = "sent_emails"
+class OutboxEmail(Base):
+    """An email waiting for the outbox worker, or the record of its delivery."""
+
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # The worker only ever looks for queued emails that are due
+        Index(
+            "ix_email_outbox_due",
+            "next_attempt_at",
+            postgresql_where=text("status = 'queued'"),
+        ),
+    )
 
-    # Define the columns in the table
     id = Column(Integer, primary_key=True, index=True)
-    recipient = Column(String(255), nullable=False)  # Email of the recipient
-    subject = Column(String(255), nullable=False)  # Email subject
-    body = Column(Text, nullable=False)  # Email body
-    status = Column(
-        String(50), nullable=False, default="sent"
-    )  # Status (e.g., sent, failed)
-    created_at = Column(
-        DateTime, default=func.now()
-    )  # Timestamp of when the email was sent
+    sender = Column(String(255), nullable=False)
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)  # Rendered HTML
+    status = Column(String(50), nullable=False, default="queued")  # queued, sent or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+    last_error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
 
     def __repr__(self):
-        return f"<SentEmail(id={self.id}, recipient='{self.recipient}', subject='{self.subject}')>"
+        return f"<OutboxEmail(id={self.id}, recipient='{self.recipient}', status='{self.status}')>"
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, DateTime, Index, Integer, LargeBinary, String
+from sqlalchemy.sql import func
+
+from db.base import Base
+
+
+class IdempotencyKey(Base):
+    """A request made with an Idempotency-Key header, and its response once done."""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_created_at", "created_at"),)
+
+    scope = Column(String(255), primary_key=True)  # Who sent it, see utils/idempotency.py
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # Of the method, path and body
+    status_code = Column(Integer, nullable=True)  # None while the request runs
+    content_type = Column(String(255), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+    def __repr__(self):
+        return f"<IdempotencyKey(scope='{self.scope}', key='{self.key}', status={self.status_code})>"
@@ -0,0 +1,40 @@
+from sqlalchemy import (
+    Column,
+    Date,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
+from sqlalchemy.orm import relationship
+
+from db.base import Base
+
+
+class UserGameScore(Base):
+    """Running totals of a player's finished games, updated when a game ends."""
+
+    __tablename__ = "user_game_scores"
+
+    game = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    points = Column(Integer, default=0, nullable=False)
+    wins = Column(Integer, default=0, nullable=False)
+    games_played = Column(Integer, default=0, nullable=False)
+    streak = Column(Integer, default=0, nullable=False)
+    longest_streak = Column(Integer, default=0, nullable=False)
+    last_played = Column(Date, nullable=True)
+
+    user = relationship("User")
+
+    __table_args__ = (
+        # Leaderboard order, so top-N reads and rank counts walk the index
+        Index(
+            "ix_user_game_scores_ranking",
+            game,
+            points.desc(),
+            wins.desc(),
+            streak.desc(),
+            user_id,
+        ),
+    )
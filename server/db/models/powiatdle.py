@@ -4,14 +4,18 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from db.base import Base
+from db.partitions import partitioned_by_day
 
 
 class PowiatdleDay(Base):
@@ -19,13 +23,23 @@ class PowiatdleDay(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     powiat_id = Column(Integer, ForeignKey("powiaty.id"))
-    date = Column(Date, nullable=False, default=func.now())
+    date = Column(Date, nullable=False, unique=True, default=func.now())
 
     powiat = relationship("Powiat")
 
 
 class PowiatdleState(Base):
     __tablename__ = "powiatdle_states"
+    __table_args__ = (
+        Index("ix_powiatdle_states_user_id_day_id", "user_id", "day_id", unique=True),
+        Index(
+            "ix_powiatdle_states_history",
+            "user_id",
+            "day_id",
+            postgresql_include=["won", "points", "guesses_made"],
+            postgresql_where=text("is_game_over"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -37,13 +51,41 @@ class PowiatdleState(Base):
     is_game_over = Column(Boolean, nullable=False, default=False)
     won = Column(Boolean, nullable=False, default=False)
     points = Column(Integer, nullable=False, default=0)
+    # Bumped by every change to the row, for the ETags of the state endpoints
+    version = Column(
+        Integer, nullable=False, default=0, server_default="0", onupdate=text("version + 1")
+    )
+    updated_at = Column(
+        DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+
+    # Fetches the new version with RETURNING instead of expiring it
+    __mapper_args__ = {"eager_defaults": True}
 
     user = relationship("User")
     day = relationship("PowiatdleDay")
 
+    guesses = relationship(
+        "PowiatdleGuess",
+        primaryjoin="and_(foreign(PowiatdleGuess.user_id) == PowiatdleState.user_id, "
+        "foreign(PowiatdleGuess.day_id) == PowiatdleState.day_id)",
+        order_by="PowiatdleGuess.guessed_at",
+        viewonly=True,
+    )
+    questions = relationship(
+        "PowiatdleQuestion",
+        primaryjoin="and_(foreign(PowiatdleQuestion.user_id) == PowiatdleState.user_id, "
+        "foreign(PowiatdleQuestion.day_id) == PowiatdleState.day_id)",
+        order_by="PowiatdleQuestion.asked_at",
+        viewonly=True,
+    )
+
 
 class PowiatdleGuess(Base):
     __tablename__ = "powiatdle_guesses"
+    __table_args__ = (
+        Index("ix_powiatdle_guesses_user_id_day_id", "user_id", "day_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -58,13 +100,21 @@ class PowiatdleGuess(Base):
     powiat = relationship("Powiat")
 
 
+@partitioned_by_day
 class PowiatdleQuestion(Base):
     __tablename__ = "powiatdle_questions"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_powiatdle_questions_user_id_day_id", "user_id", "day_id"),
+        {"postgresql_partition_by": "RANGE (day_date)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # Partition key, filled from the day on insert
+    day_date = Column(Date, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     day_id = Column(Integer, ForeignKey("powiatdle_days.id"))
     context = Column(String)
+    context_fragments = Column(JSONB)
     original_question = Column(String, nullable=False)
     question = Column(String)
     valid = Column(Boolean, nullable=False)
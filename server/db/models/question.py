@@ -6,24 +6,37 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     and_,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from db.base import Base
+from db.partitions import partitioned_by_day
 
 
+@partitioned_by_day
 class CountrydleQuestion(Base):
     __tablename__ = "countrydle_questions"
+    __table_args__ = (
+        Index("ix_countrydle_questions_user_id_day_id", "user_id", "day_id"),
+        {"postgresql_partition_by": "RANGE (day_date)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # Partition key, filled from the day on insert
+    day_date = Column(Date, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     day_id = Column(Integer, ForeignKey("countrydle_days.id"))
+    # Only for fragments that cannot be referenced by id
     context = Column(String)
+    # [{"id": fragment id, "score": similarity}], in the order given to the model
+    context_fragments = Column(JSONB)
     original_question = Column(String, nullable=False)
     question = Column(String)
     valid = Column(Boolean, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime, Float, Index, String
+from sqlalchemy.sql import func
+
+from db.base import Base
+
+
+class RateLimitBucket(Base):
+    """Tokens left to a client for one class of endpoints, shared by all workers."""
+
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = (Index("ix_rate_limit_buckets_updated_at", "updated_at"),)
+
+    key = Column(String(255), primary_key=True)  # See utils/rate_limit.py
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=func.now())
+
+    def __repr__(self):
+        return f"<RateLimitBucket(key='{self.key}', tokens={self.tokens})>"
@@ -4,13 +4,17 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from db.base import Base
+from db.partitions import partitioned_by_day
 
 
 class USStatedleDay(Base):
@@ -18,13 +22,23 @@ class USStatedleDay(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     us_state_id = Column(Integer, ForeignKey("us_states.id"))
-    date = Column(Date, nullable=False, default=func.now())
+    date = Column(Date, nullable=False, unique=True, default=func.now())
 
     us_state = relationship("USState")
 
 
 class USStatedleState(Base):
     __tablename__ = "us_statedle_states"
+    __table_args__ = (
+        Index("ix_us_statedle_states_user_id_day_id", "user_id", "day_id", unique=True),
+        Index(
+            "ix_us_statedle_states_history",
+            "user_id",
+            "day_id",
+            postgresql_include=["won", "points", "guesses_made"],
+            postgresql_where=text("is_game_over"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -36,13 +50,41 @@ class USStatedleState(Base):
     is_game_over = Column(Boolean, nullable=False, default=False)
     won = Column(Boolean, nullable=False, default=False)
     points = Column(Integer, nullable=False, default=0)
+    # Bumped by every change to the row, for the ETags of the state endpoints
+    version = Column(
+        Integer, nullable=False, default=0, server_default="0", onupdate=text("version + 1")
+    )
+    updated_at = Column(
+        DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+
+    # Fetches the new version with RETURNING instead of expiring it
+    __mapper_args__ = {"eager_defaults": True}
 
     user = relationship("User")
     day = relationship("USStatedleDay")
 
+    guesses = relationship(
+        "USStatedleGuess",
+        primaryjoin="and_(foreign(USStatedleGuess.user_id) == USStatedleState.user_id, "
+        "foreign(USStatedleGuess.day_id) == USStatedleState.day_id)",
+        order_by="USStatedleGuess.guessed_at",
+        viewonly=True,
+    )
+    questions = relationship(
+        "USStatedleQuestion",
+        primaryjoin="and_(foreign(USStatedleQuestion.user_id) == USStatedleState.user_id, "
+        "foreign(USStatedleQuestion.day_id) == USStatedleState.day_id)",
+        order_by="USStatedleQuestion.asked_at",
+        viewonly=True,
+    )
+
 
 class USStatedleGuess(Base):
     __tablename__ = "us_statedle_guesses"
+    __table_args__ = (
+        Index("ix_us_statedle_guesses_user_id_day_id", "user_id", "day_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -57,13 +99,21 @@ class USStatedleGuess(Base):
     us_state = relationship("USState")
 
 
+@partitioned_by_day
 class USStatedleQuestion(Base):
     __tablename__ = "us_statedle_questions"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_us_statedle_questions_user_id_day_id", "user_id", "day_id"),
+        {"postgresql_partition_by": "RANGE (day_date)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # Partition key, filled from the day on insert
+    day_date = Column(Date, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     day_id = Column(Integer, ForeignKey("us_statedle_days.id"))
     context = Column(String)
+    context_fragments = Column(JSONB)
     original_question = Column(String, nullable=False)
     question = Column(String)
     valid = Column(Boolean, nullable=False)
@@ -1,4 +1,3 @@
-from passlib.context import CryptContext
 from pgvector.sqlalchemy import Vector
 from sqlalchemy import (
     Boolean,
@@ -15,8 +14,7 @@ from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from db.base import Base
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from db.passwords import pwd_context
 
 
 class User(Base):
@@ -43,6 +41,7 @@ class User(Base):
     def permission_names(self):
         return [permission.name for permission in self.permissions]
 
+    # Blocking; request handlers go through db.passwords instead
     @staticmethod
     def verify_password(plain_password, hashed_password):
         return pwd_context.verify(plain_password, hashed_password)
@@ -4,13 +4,17 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from db.base import Base
+from db.partitions import partitioned_by_day
 
 
 class WojewodztwodleDay(Base):
@@ -18,13 +22,23 @@ class WojewodztwodleDay(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     wojewodztwo_id = Column(Integer, ForeignKey("wojewodztwa.id"))
-    date = Column(Date, nullable=False, default=func.now())
+    date = Column(Date, nullable=False, unique=True, default=func.now())
 
     wojewodztwo = relationship("Wojewodztwo")
 
 
 class WojewodztwodleState(Base):
     __tablename__ = "wojewodztwodle_states"
+    __table_args__ = (
+        Index("ix_wojewodztwodle_states_user_id_day_id", "user_id", "day_id", unique=True),
+        Index(
+            "ix_wojewodztwodle_states_history",
+            "user_id",
+            "day_id",
+            postgresql_include=["won", "points", "guesses_made"],
+            postgresql_where=text("is_game_over"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -36,13 +50,41 @@ class WojewodztwodleState(Base):
     is_game_over = Column(Boolean, nullable=False, default=False)
     won = Column(Boolean, nullable=False, default=False)
     points = Column(Integer, nullable=False, default=0)
+    # Bumped by every change to the row, for the ETags of the state endpoints
+    version = Column(
+        Integer, nullable=False, default=0, server_default="0", onupdate=text("version + 1")
+    )
+    updated_at = Column(
+        DateTime, nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+
+    # Fetches the new version with RETURNING instead of expiring it
+    __mapper_args__ = {"eager_defaults": True}
 
     user = relationship("User")
     day = relationship("WojewodztwodleDay")
 
+    guesses = relationship(
+        "WojewodztwodleGuess",
+        primaryjoin="and_(foreign(WojewodztwodleGuess.user_id) == WojewodztwodleState.user_id, "
+        "foreign(WojewodztwodleGuess.day_id) == WojewodztwodleState.day_id)",
+        order_by="WojewodztwodleGuess.guessed_at",
+        viewonly=True,
+    )
+    questions = relationship(
+        "WojewodztwodleQuestion",
+        primaryjoin="and_(foreign(WojewodztwodleQuestion.user_id) == WojewodztwodleState.user_id, "
+        "foreign(WojewodztwodleQuestion.day_id) == WojewodztwodleState.day_id)",
+        order_by="WojewodztwodleQuestion.asked_at",
+        viewonly=True,
+    )
+
 
 class WojewodztwodleGuess(Base):
     __tablename__ = "wojewodztwodle_guesses"
+    __table_args__ = (
+        Index("ix_wojewodztwodle_guesses_user_id_day_id", "user_id", "day_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -57,13 +99,21 @@ class WojewodztwodleGuess(Base):
     wojewodztwo = relationship("Wojewodztwo")
 
 
+@partitioned_by_day
 class WojewodztwodleQuestion(Base):
     __tablename__ = "wojewodztwodle_questions"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_wojewodztwodle_questions_user_id_day_id", "user_id", "day_id"),
+        {"postgresql_partition_by": "RANGE (day_date)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # Partition key, filled from the day on insert
+    day_date = Column(Date, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     day_id = Column(Integer, ForeignKey("wojewodztwodle_days.id"))
     context = Column(String)
+    context_fragments = Column(JSONB)
     original_question = Column(String, nullable=False)
     question = Column(String)
     valid = Column(Boolean, nullable=False)
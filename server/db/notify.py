@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import DATABASE_URL
+
+RECONNECT_DELAY = 5
+
+
+async def notify(session: AsyncSession, channel: str, payload: str = "") -> None:
+    """Queues a NOTIFY on the session's transaction; it is delivered on commit."""
+    await session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": payload},
+    )
+
+
+class PgListener:
+    """Keeps one dedicated asyncpg connection that LISTENs on registered channels.
+
+    Every worker runs its own listener, so a NOTIFY sent by any process
+    (web worker, scheduler, population script) reaches all of them.
+    """
+
+    def __init__(self, url: str | None):
+        self.url = url.replace("+asyncpg", "") if url else None
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._conn: asyncpg.Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._stopped = True
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    def _dispatch(self, connection, pid, channel: str, payload: str) -> None:
+        for callback in self._callbacks.get(channel, []):
+            try:
+                callback(payload)
+            except Exception:
+                logging.exception(f"Listener callback for '{channel}' failed")
+
+    def _on_termination(self, connection) -> None:
+        self._conn = None
+        if not self._stopped:
+            logging.warning("Notification listener connection lost, reconnecting...")
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _connect(self) -> None:
+        conn = await asyncpg.connect(self.url)
+        for channel in self._callbacks:
+            await conn.add_listener(channel, self._dispatch)
+        conn.add_termination_listener(self._on_termination)
+        self._conn = conn
+
+    async def _reconnect(self) -> None:
+        while not self._stopped and self._conn is None:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                await self._connect()
+                # Anything published while we were away is lost, so let every
+                # subscriber drop its state
+                for channel in self._callbacks:
+                    self._dispatch(None, None, channel, "")
+            except Exception as e:
+                logging.warning(f"Notification listener reconnect failed: {e}")
+
+    async def start(self) -> None:
+        if not self.url or not self._callbacks:
+            return
+        self._stopped = False
+        try:
+            await self._connect()
+        except Exception as e:
+            logging.warning(f"Notification listener unavailable: {e}")
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def stop(self) -> None:
+        self._stopped = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+
+listener = PgListener(DATABASE_URL)
@@ -0,0 +1,191 @@
+"""Monthly range partitions for the per-day question tables.
+
+Question rows carry the date of their game day in `day_date`, and the tables
+are partitioned by it, so queries for one day only touch that month's
+partition. A daily job creates partitions ahead of time and moves those older
+than QUESTION_HOT_MONTHS into an unpartitioned `<table>_archive` table, whose
+`context` is stored compressed. Rows no monthly partition covers land in the
+DEFAULT partition until the job gives them one.
+"""
+
+import os
+import re
+from datetime import date
+
+from sqlalchemy import DDL, Column, ForeignKey, Index, Table, event, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from db.base import Base
+
+# Months, counting the current one, kept in partitions of the live table
+HOT_MONTHS = int(os.getenv("QUESTION_HOT_MONTHS", 3))
+# Partitions created ahead of the current month
+MONTHS_AHEAD = 1
+
+# lz4 is faster than the default pglz, but only when the server is built with it
+COMPRESS_ARCHIVE = [
+    """
+    DO $$
+    BEGIN
+        ALTER TABLE %(table)s ALTER COLUMN context SET COMPRESSION lz4;
+    EXCEPTION WHEN feature_not_supported THEN NULL;
+    END $$
+    """,
+    # Compresses or moves out of line every context longer than a few lines
+    "ALTER TABLE %(table)s SET (toast_tuple_target = 128)",
+]
+
+PARTITIONED: list[Table] = []
+ARCHIVES: dict[str, Table] = {}
+
+
+def partitioned_by_day(model):
+    """Class decorator for a question model declared with
+    `postgresql_partition_by: "RANGE (day_date)"`.
+
+    Adds the DEFAULT partition and the archive table to the metadata, and
+    fills `day_date` from the row's day on insert.
+    """
+    table = model.__table__
+    event.listen(
+        table,
+        "after_create",
+        DDL("CREATE TABLE %(table)s_default PARTITION OF %(table)s DEFAULT"),
+    )
+
+    archive = Table(
+        f"{table.name}_archive",
+        Base.metadata,
+        *(
+            Column(
+                column.name,
+                column.type,
+                *(ForeignKey(fk.target_fullname) for fk in column.foreign_keys),
+                primary_key=column.primary_key,
+                nullable=column.nullable,
+                autoincrement=False,
+            )
+            for column in table.columns
+        ),
+        Index(f"ix_{table.name}_archive_user_id", "user_id"),
+    )
+    for statement in COMPRESS_ARCHIVE:
+        event.listen(archive, "after_create", DDL(statement))
+
+    @event.listens_for(model, "before_insert")
+    def fill_day_date(mapper, connection, target):
+        if target.day_date is None:
+            day = mapper.relationships["day"].mapper.class_
+            target.day_date = (
+                select(day.date).where(day.id == target.day_id).scalar_subquery()
+            )
+
+    PARTITIONED.append(table)
+    ARCHIVES[table.name] = archive
+    return model
+
+
+def archive_of(model) -> Table:
+    return ARCHIVES[model.__tablename__]
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """First day of the month `months` after (or before) the one of `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: Table, month: date) -> str:
+    return f"{table.name}_{month:%Y_%m}"
+
+
+def is_partition(name: str) -> bool:
+    """Whether `name` is a monthly or DEFAULT partition of a partitioned table.
+
+    They exist only in the database, so migrations must leave them alone.
+    """
+    return any(
+        re.fullmatch(rf"{re.escape(table.name)}_(\d{{4}}_\d{{2}}|default)", name)
+        for table in PARTITIONED
+    )
+
+
+async def ensure_partitions(
+    conn: AsyncConnection, table: Table, today: date, ahead: int = MONTHS_AHEAD
+) -> list[str]:
+    """Creates the partitions from this month up to `ahead` months later.
+
+    Rows that landed in the DEFAULT partition are moved into the new one.
+    """
+    created = []
+    for offset in range(ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        name = partition_name(table, start)
+        if await conn.scalar(text("SELECT to_regclass(:name)"), {"name": name}):
+            continue
+
+        bounds = {"start": start, "end": end}
+        await conn.execute(
+            text(f"CREATE TABLE {name} (LIKE {table.name} INCLUDING DEFAULTS)")
+        )
+        await conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table.name}_default "
+                "WHERE day_date >= :start AND day_date < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds,
+        )
+        await conn.execute(
+            text(
+                f"ALTER TABLE {table.name} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        )
+        created.append(name)
+    return created
+
+
+async def archive_partitions(
+    conn: AsyncConnection, table: Table, today: date, hot_months: int = HOT_MONTHS
+) -> list[str]:
+    """Moves the rows of months before the hot ones into the archive table.
+
+    Whole partitions are detached, copied and dropped, so the live table never
+    pays for deleting them row by row.
+    """
+    cutoff = month_start(today, 1 - hot_months)
+    archive = ARCHIVES[table.name]
+    columns = ", ".join(column.name for column in archive.columns)
+
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": table.name},
+    )
+    archived = []
+    for name in result.scalars():
+        if name == f"{table.name}_default":
+            continue
+        year, month = map(int, name.removeprefix(f"{table.name}_").split("_"))
+        if date(year, month, 1) >= cutoff:
+            continue
+
+        await conn.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+        await conn.execute(
+            text(f"INSERT INTO {archive.name} ({columns}) SELECT {columns} FROM {name}")
+        )
+        await conn.execute(text(f"DROP TABLE {name}"))
+        archived.append(name)
+
+    await conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {table.name}_default WHERE day_date < :cutoff "
+            f"RETURNING {columns}) INSERT INTO {archive.name} ({columns}) "
+            f"SELECT {columns} FROM moved"
+        ),
+        {"cutoff": cutoff},
+    )
+    return archived
@@ -0,0 +1,47 @@
+"""bcrypt hashing on a small thread pool instead of the event loop.
+
+A hash or verification takes a few hundred milliseconds of CPU. The bcrypt
+library releases the GIL while it works, so running it on threads keeps the
+loop serving other requests, and the pool size caps how many cores a burst
+of logins can take.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# Hashes made with another cost are replaced the next time their owner logs in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 1))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def hash(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify(password: str, hashed_password: str | None) -> bool:
+    if hashed_password is None:
+        return False
+    return await _run(pwd_context.verify, password, hashed_password)
+
+
+async def verify_and_update(
+    password: str, hashed_password: str | None
+) -> tuple[bool, str | None]:
+    """Like `verify`, also returning a new hash when the stored one is outdated."""
+    if hashed_password is None:
+        return False, None
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
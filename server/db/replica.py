@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Seconds behind the primary; zero when every received change is replayed, and
+# on a server that is not a standby at all
+LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReplicaMonitor:
+    """Tracks whether the read replica is reachable and caught up.
+
+    The replica is checked at most once every `check_interval` seconds; in
+    between, the last answer is reused.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_lag: float,
+        check_interval: float = 5,
+        timeout: float = 2,
+    ):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.lag: float | None = None
+        self.fallbacks = 0
+        self._usable = False
+        self._checked_at: float | None = None
+
+    async def usable(self) -> bool:
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._usable = await self._check()
+            self._checked_at = now
+
+        if not self._usable:
+            self.fallbacks += 1
+        return self._usable
+
+    def mark_down(self) -> None:
+        """Sends reads to the primary until the next check succeeds."""
+        self._usable = False
+        self._checked_at = time.monotonic()
+
+    async def _check(self) -> bool:
+        try:
+            async with asyncio.timeout(self.timeout):
+                async with self.engine.connect() as conn:
+                    self.lag = float(await conn.scalar(LAG_QUERY))
+        except Exception as e:
+            logging.warning(f"Read replica unavailable, reading from the primary: {e!r}")
+            self.lag = None
+            return False
+
+        if self.lag > self.max_lag:
+            logging.warning(
+                f"Read replica is {self.lag:.0f}s behind, reading from the primary"
+            )
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {"usable": self._usable, "lag": self.lag, "fallbacks": self.fallbacks}
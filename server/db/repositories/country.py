@@ -16,7 +16,7 @@ class CountryRepository:
         return result.scalars().first()
 
     async def get_all_countries(self) -> List[Country]:
-        result = await self.session.execute(select(Country))
+        result = await self.session.execute(select(Country).order_by(Country.id))
 
         return list(result.scalars().all())
 
@@ -1,21 +1,23 @@
 from datetime import date
-import random
 from typing import List
 from pydantic import BaseModel
-from sqlalchemy import Integer, and_, case, cast, func, select
-from sqlalchemy.orm import joinedload, aliased, contains_eager
+from sqlalchemy import Integer, and_, case, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Country, CountrydleState, CountrydleDay, User
-from db.repositories.country import CountryRepository
 from db.models import CountrydleGuess
+from db.repositories.leaderboard import LeaderboardRepository
 from db.repositories.user import UserRepository
 from db.models.user import UserPoints
-from schemas.countrydle import LeaderboardEntry, UserStatistics
-from schemas.statistics import GameStatistics, GameHistoryEntry
+from schemas.countrydle import UserStatistics
 from db.models.question import CountrydleQuestion
 from db.repositories.question import CountrydleQuestionsRepository
 from db.repositories.guess import CountrydleGuessRepository
+from db.repositories.statistics import HISTORY_LIMIT
+from db.repositories.game_state import StateTransitions
 
 MAX_GUESSES = 3
 MAX_QUESTIONS = 10
@@ -40,20 +42,20 @@ class CountrydleRepository:
 
         return result.scalars().first()
 
-    async def get_today_country(self) -> CountrydleDay | None:
+    async def get_today_country(self, today: date) -> CountrydleDay | None:
         result = await self.session.execute(
             select(CountrydleDay)
-            .where(CountrydleDay.date == date.today())
-            .order_by(CountrydleDay.id.desc())
+            .options(joinedload(CountrydleDay.country))
+            .where(CountrydleDay.date == today)
         )
 
         return result.scalars().first()
 
-    async def get_today_country_sync(self) -> CountrydleDay | None:
+    async def get_today_country_sync(self, today: date) -> CountrydleDay | None:
         # This is for debugging purposes if needed, but we should use async
         result = await self.session.execute(
             select(CountrydleDay)
-            .where(CountrydleDay.date == date.today())
+            .where(CountrydleDay.date == today)
             .order_by(CountrydleDay.id.desc())
         )
         return result.scalars().first()
@@ -65,135 +67,37 @@ class CountrydleRepository:
 
         return result.scalars().first()
 
-    async def create_day_country(self, country: Country) -> CountrydleDay:
-        new_entry = CountrydleDay(country_id=country.id)
-
-        self.session.add(new_entry)
-
-        try:
-            await self.session.commit()  # Commit the transaction
-            await self.session.refresh(new_entry)  # Refresh the instance to get the ID
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
-
-        return new_entry
-
-    async def create_day_country_with_date(
-        self, country: Country, day_date: date
-    ) -> CountrydleDay:
-        new_entry = CountrydleDay(country_id=country.id, date=day_date)
+    async def generate_new_day_country(self, day_date: date) -> bool:
+        """Draws a random country for `day_date`.
 
-        self.session.add(new_entry)
-
-        try:
-            await self.session.commit()  # Commit the transaction
-            await self.session.refresh(new_entry)  # Refresh the instance to get the ID
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
-
-        return new_entry
-
-    async def generate_new_day_country(
-        self, day_date: date | None = None
-    ) -> CountrydleDay:
-        countries = await CountryRepository(self.session).get_all_countries()
-        if not countries:
+        Returns False if the day already exists. Does not commit.
+        """
+        if await self.session.scalar(select(Country.id).limit(1)) is None:
             raise ValueError("No countries in database!")
 
-        country = random.choice(countries)
-
-        if not day_date:
-            new_country = await self.create_day_country(country)
-        else:
-            new_country = await self.create_day_country_with_date(country, day_date)
-
-        return new_country
+        result = await self.session.execute(
+            insert(CountrydleDay)
+            .from_select(
+                ["country_id", "date"],
+                select(Country.id, literal(day_date)).order_by(func.random()).limit(1),
+            )
+            .on_conflict_do_nothing(index_elements=["date"])
+            .returning(CountrydleDay.id)
+        )
+        return result.scalar_one_or_none() is not None
 
-    async def get_countrydle_history(self):
+    async def get_countrydle_history(self, today: date) -> List[CountrydleDay]:
         result = await self.session.execute(
             select(CountrydleDay)
             .options(joinedload(CountrydleDay.country))
-            .where(CountrydleDay.date < date.today())
+            .where(CountrydleDay.date < today)
             .order_by(CountrydleDay.date.desc())
         )
 
         return result.scalars().all()
 
-    async def get_countries_count(self):
-        dc = aliased(CountrydleDay)
-        stmt = (
-            select(
-                Country.id,
-                Country.name,
-                func.count(dc.id).label("count"),
-                func.max(dc.date).label("last"),
-            )
-            .outerjoin(dc, Country.id == dc.country_id)
-            .where(dc.date < date.today())
-            .group_by(Country.id, Country.name)
-            .order_by(
-                func.count(dc.id).desc(), func.max(dc.date).desc(), Country.name.asc()
-            )
-        )
-
-        result = await self.session.execute(stmt)
-
-        countries_with_count = result.all()
-
-        return countries_with_count
-
-    async def get_leaderboard(self):
-        cs = aliased(CountrydleState)
-        up = aliased(UserPoints)
-        stmt = (
-            select(
-                User.id,
-                User.username,
-                func.coalesce(up.points, 0).label("points"),
-                func.coalesce(func.sum(cs.won.cast(Integer)), 0).label("wins"),
-                func.coalesce(up.streak, 0).label("streak"),
-            )
-            .outerjoin(up, User.id == up.user_id)
-            .outerjoin(cs, User.id == cs.user_id)
-            .where(
-                and_(
-                    User.username.not_like("test_%"),
-                    User.username.not_like("pytest_%"),
-                    User.username.not_like("guess_c_%"),
-                    User.username.not_like("ask_q_%"),
-                )
-            )
-            .group_by(
-                User.id,
-                User.username,
-                up.points,
-                up.streak,
-            )
-            .order_by(
-                func.coalesce(up.points, 0).desc(),
-                func.coalesce(func.sum(cs.won.cast(Integer)), 0).desc(),
-                func.coalesce(up.streak, 0).desc(),
-            )
-        )
-
-        result = await self.session.execute(stmt)
-
-        leaderboard = [
-            LeaderboardEntry(
-                id=row.id,
-                username=row.username,
-                points=row.points,
-                streak=row.streak,
-                wins=row.wins,
-            )
-            for row in result.all()
-        ]
-
-        return leaderboard
-
-    async def get_user_statistics(self, user: User) -> UserStatistics:
+    async def get_user_statistics(self, user: User, today: date) -> UserStatistics:
+        """Countrydle statistics of `user`, with the target of `today` (the game day) hidden."""
         up = await UserRepository(self.session).get_user_points(user.id)
         result = await self.session.execute(
             select(
@@ -220,7 +124,7 @@ class CountrydleRepository:
 
         history = await CountrydleStateRepository(
             self.session
-        ).get_player_countrydle_states(user, show_today=False)
+        ).get_player_countrydle_states(user, hide_day=today)
 
         profile = UserStatistics(
             user=user,
@@ -238,60 +142,11 @@ class CountrydleRepository:
 
         return profile
 
-    async def get_game_statistics(self, user: User) -> GameStatistics:
-        up = await UserRepository(self.session).get_user_points(user.id)
-
-        # Calculate wins and games played
-        stmt = select(
-            func.coalesce(func.sum(cast(CountrydleState.won, Integer)), 0).label(
-                "wins"
-            ),
-            func.count(CountrydleState.id).label("games_played"),
-        ).where(CountrydleState.user_id == user.id)
-        result = await self.session.execute(stmt)
-        row = result.first()
-
-        wins = row.wins if row else 0
-        games_played = row.games_played if row else 0
-        points = up.points if up else 0
-        streak = up.streak if up else 0
-
-        # Get history
-        history_stmt = (
-            select(CountrydleState)
-            .options(joinedload(CountrydleState.day).joinedload(CountrydleDay.country))
-            .where(
-                and_(
-                    CountrydleState.user_id == user.id,
-                    CountrydleState.is_game_over == True,
-                )
-            )
-            .order_by(CountrydleState.id.desc())
-        )
-        history_result = await self.session.execute(history_stmt)
-        history_states = history_result.scalars().all()
-
-        history_entries = [
-            GameHistoryEntry(
-                date=str(state.day.date),
-                won=state.won,
-                points=state.points,
-                attempts=state.guesses_made,
-                target_name=state.day.country.name if state.won else "???",
-            )
-            for state in history_states
-        ]
-
-        return GameStatistics(
-            points=points,
-            wins=wins,
-            games_played=games_played,
-            streak=streak,
-            history=history_entries,
-        )
-
+class CountrydleStateRepository(StateTransitions):
+    model = CountrydleState
+    guess_model = CountrydleGuess
+    question_model = CountrydleQuestion
 
-class CountrydleStateRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
@@ -311,26 +166,14 @@ class CountrydleStateRepository:
     async def guess_made(
         self, state: CountrydleState, guess: CountrydleGuess
     ) -> CountrydleState:
-        state.guesses_made += 1
-        state.remaining_guesses -= 1
-
-        if not state.remaining_guesses:
-            state.is_game_over = True
-            state.won = False
-
-        if guess.answer:
-            state.is_game_over = True
-            state.won = True
-
-        points = 0
+        """Awards the points once `record_guess` has settled the game."""
         if state.won:
             points = await self.calc_points(state)
             state.points = points
 
         if state.is_game_over:
             await UserRepository(self.session).update_points(state.user_id, state)
-
-        await self.session.commit()
+            await LeaderboardRepository(self.session).record_game("countrydle", state)
 
         return state
 
@@ -357,29 +200,27 @@ class CountrydleStateRepository:
         return state
 
     async def get_player_countrydle_states(
-        self, user: User, show_today: bool = True
+        self, user: User, hide_day: date | None = None, limit: int = HISTORY_LIMIT
     ) -> List[CountrydleState]:
+        """Finished games of `user`, newest first, without the target of `hide_day`."""
         result = await self.session.execute(
             select(CountrydleState)
-            .options(
-                joinedload(CountrydleState.user),
-                joinedload(CountrydleState.day),
-                joinedload(CountrydleState.day, CountrydleDay.country),
-            )
+            .options(joinedload(CountrydleState.day).joinedload(CountrydleDay.country))
             .where(
                 and_(
                     CountrydleState.user_id == user.id,
                     CountrydleState.is_game_over,
                 )
             )
-            .order_by(CountrydleState.id.desc())
+            .order_by(CountrydleState.day_id.desc())
+            .limit(limit)
         )
 
         states = result.scalars().all()
 
-        if not show_today:
+        if hide_day is not None:
             for state in states:
-                if state.day.date == date.today():
+                if state.day.date == hide_day:
                     state.day.country = None
 
         return states
@@ -401,14 +242,12 @@ class CountrydleStateRepository:
             guesses_made=0,
         )
 
-        self.session.add(new_entry)
-
         try:
-            await self.session.commit()  # Commit the transaction
-            await self.session.refresh(new_entry)  # Refresh the instance to get the ID
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
+            async with self.session.begin_nested():
+                self.session.add(new_entry)
+        except IntegrityError:
+            # A concurrent request created the state first
+            return await self.get_state(user, day)
 
         return new_entry
 
@@ -434,14 +273,27 @@ class CountrydleStateRepository:
 
         return state
 
-    async def update_countrydle_state(self, state: CountrydleState):
-        await self.session.merge(state)
+    async def load_state(
+        self, user: User, day: CountrydleDay
+    ) -> CountrydleState | None:
+        """Loads the state with its guesses and questions in a single query."""
+        result = await self.session.execute(
+            select(CountrydleState)
+            .options(
+                joinedload(CountrydleState.guesses),
+                # The day's date lets Postgres skip every other questions partition
+                joinedload(
+                    CountrydleState.questions.and_(
+                        CountrydleQuestion.day_date == day.date
+                    )
+                ),
+            )
+            .where(CountrydleState.user_id == user.id, CountrydleState.day_id == day.id)
+        )
 
-        try:
-            await self.session.commit()
-            await self.session.refresh(state)
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
+        return result.unique().scalar_one_or_none()
+
+    async def update_countrydle_state(self, state: CountrydleState):
+        self.session.add(state)
 
         return state
@@ -1,27 +1,65 @@
-from fastapi import HTTPException
-from sqlalchemy import and_, or_, select
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import SentEmail
+from db.models import OutboxEmail
+from db.notify import notify
 from schemas.email import EmailCreate
 
+# Notified whenever an email is queued, so the outbox worker wakes up
+OUTBOX_CHANNEL = "email_outbox"
+
 
 class EmailRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get(self, emid) -> SentEmail | None:
-        result = await self.session.execute(select(SentEmail).where(SentEmail.id == emid))
+    async def get(self, emid) -> OutboxEmail | None:
+        result = await self.session.execute(select(OutboxEmail).where(OutboxEmail.id == emid))
 
         return result.scalars().first()
-    
 
-    async def add_email(self, email: EmailCreate) -> SentEmail:
-        new_sentemail = SentEmail(
-            **email.model_dump()
+    async def enqueue(self, email: EmailCreate) -> OutboxEmail:
+        """Queues an email for the outbox worker. Does not commit."""
+        queued = OutboxEmail(**email.model_dump())
+        self.session.add(queued)
+        await notify(self.session, OUTBOX_CHANNEL)
+
+        return queued
+
+    async def claim_due(self, limit: int) -> List[OutboxEmail]:
+        """Locks up to `limit` due emails until the transaction ends.
+
+        SKIP LOCKED lets several workers drain the outbox without sending
+        anything twice.
+        """
+        result = await self.session.execute(
+            select(OutboxEmail)
+            .where(
+                OutboxEmail.status == "queued",
+                OutboxEmail.next_attempt_at <= datetime.now(),
+            )
+            .order_by(OutboxEmail.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
         )
-        self.session.add(new_sentemail)
-        await self.session.commit()
-        await self.session.refresh(new_sentemail)
+        return result.scalars().all()
+
+    @staticmethod
+    def mark_sent(email: OutboxEmail) -> None:
+        email.status = "sent"
+        email.attempts += 1
+        email.sent_at = datetime.now()
+        email.last_error = None
 
-        return new_sentemail
\ No newline at end of file
+    @staticmethod
+    def mark_failed(email: OutboxEmail, error: str, retry_at: datetime | None) -> None:
+        """Schedules another attempt, or gives up when `retry_at` is None."""
+        email.attempts += 1
+        email.last_error = error
+        if retry_at is None:
+            email.status = "failed"
+        else:
+            email.next_attempt_at = retry_at
@@ -0,0 +1,18 @@
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class FragmentRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_texts(self, model, ids: List[int]) -> Dict[int, str]:
+        """Texts of the given fragments of `model`, e.g. CountryFragment, by id."""
+        if not ids:
+            return {}
+        result = await self.session.execute(
+            select(model.id, model.text).where(model.id.in_(ids))
+        )
+        return dict(result.all())
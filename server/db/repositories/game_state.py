@@ -0,0 +1,234 @@
+"""Question and guess transitions shared by the games' state repositories.
+
+Each transition is a single conditional UPDATE ... RETURNING, so the check
+and the change happen in one statement. Two requests racing for the last
+question or guess are serialized by the row lock and the second one simply
+matches no row, instead of both passing a check made on stale state.
+"""
+
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models.user import User
+from game_logic import GameRules
+
+
+class StateTransitions:
+    """Mixin for a state repository.
+
+    `model` is the game's state model, `guess_model` and `question_model` the
+    models of its guesses and questions.
+    """
+
+    model = None
+    guess_model = None
+    question_model = None
+    session: AsyncSession
+
+    async def reserve_question(self, user: User, day, rules: GameRules):
+        """Takes one of the user's questions for the day.
+
+        Returns the updated state, or None if no question is left or the game
+        is over. Does not commit.
+        """
+        return await self._transition(
+            user,
+            day,
+            rules,
+            {
+                "remaining_questions": self.model.remaining_questions - 1,
+                "questions_asked": self.model.questions_asked + 1,
+            },
+            self.model.remaining_questions > 0,
+        )
+
+    async def release_question(self, user: User, day):
+        """Gives back a question reserved for an answer that failed.
+
+        Does not commit.
+        """
+        return await self.session.scalar(
+            update(self.model)
+            .where(
+                self.model.user_id == user.id,
+                self.model.day_id == day.id,
+                self.model.questions_asked > 0,
+                ~self.model.is_game_over,
+            )
+            .values(
+                remaining_questions=self.model.remaining_questions + 1,
+                questions_asked=self.model.questions_asked - 1,
+            )
+            .returning(self.model)
+            .execution_options(populate_existing=True)
+        )
+
+    async def record_guess(self, user: User, day, rules: GameRules, correct: bool):
+        """Uses one of the user's guesses and settles the outcome.
+
+        Returns the updated state, or None if no guess is left or the game is
+        over. Points are left to the caller. Does not commit.
+        """
+        remaining = self.model.remaining_guesses
+        return await self._transition(
+            user,
+            day,
+            rules,
+            {
+                "remaining_guesses": remaining - 1,
+                "guesses_made": self.model.guesses_made + 1,
+                "won": correct,
+                # SET sees the row as it was, so the last guess has 1 remaining
+                "is_game_over": True if correct else remaining <= 1,
+            },
+            remaining > 0,
+        )
+
+    async def bump_version(self, user: User, day) -> None:
+        """Marks the state changed, for a question added to it without a transition.
+
+        Conditional GETs would otherwise keep answering 304 without the
+        question. Does not commit.
+        """
+        await self.session.execute(
+            update(self.model)
+            .where(self.model.user_id == user.id, self.model.day_id == day.id)
+            .values(version=self.model.version + 1)
+        )
+
+    async def get_version(self, user: User, day):
+        """Returns the version, updated_at and is_game_over of the state, if any."""
+        result = await self.session.execute(
+            select(self.model.version, self.model.updated_at, self.model.is_game_over).where(
+                self.model.user_id == user.id, self.model.day_id == day.id
+            )
+        )
+        return result.one_or_none()
+
+    async def has_progress(self, user: User, day) -> bool:
+        """Whether the user asked or guessed anything on `day` yet."""
+        progress = await self.session.scalar(
+            select(self.model.questions_asked + self.model.guesses_made).where(
+                self.model.user_id == user.id, self.model.day_id == day.id
+            )
+        )
+        return bool(progress)
+
+    async def sync_guest_progress(
+        self,
+        user: User,
+        day,
+        rules: GameRules,
+        question_ids: list[int],
+        guesses: list[dict],
+    ):
+        """Moves what the user played on `day` as a guest onto their state.
+
+        Progress already on the server wins, so a state with any question or
+        guess is left alone and None is returned. Otherwise the guest's
+        questions are claimed with one UPDATE, `guesses` are inserted with one
+        INSERT, and the counters follow from what was actually claimed and
+        guessed. Points are left to the caller. Does not commit.
+        """
+        # Upserted so the row comes back, locked, whether or not it existed
+        statement = insert(self.model).values(
+            user_id=user.id,
+            day_id=day.id,
+            remaining_questions=rules.config.max_questions,
+            remaining_guesses=rules.config.max_guesses,
+            questions_asked=0,
+            guesses_made=0,
+            is_game_over=False,
+            won=False,
+            points=0,
+        )
+        state = await self.session.scalar(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "day_id"],
+                set_={"user_id": statement.excluded.user_id},
+            )
+            .returning(self.model)
+            .execution_options(populate_existing=True)
+        )
+        if state.questions_asked or state.guesses_made:
+            return None
+
+        claimed = 0
+        if question_ids:
+            question = self.question_model
+            result = await self.session.execute(
+                update(question)
+                .where(
+                    question.id.in_(question_ids),
+                    question.user_id.is_(None),
+                    question.day_id == day.id,
+                    # Lets Postgres skip every other questions partition
+                    question.day_date == day.date,
+                )
+                .values(user_id=user.id)
+                .returning(question.id)
+                .execution_options(synchronize_session=False)
+            )
+            claimed = len(result.all())
+
+        if guesses:
+            columns = self.guess_model.__table__.columns.keys()
+            await self.session.execute(
+                insert(self.guess_model),
+                [
+                    {"user_id": user.id, "day_id": day.id}
+                    | {key: value for key, value in guess.items() if key in columns}
+                    for guess in guesses
+                ],
+            )
+
+        state.questions_asked = claimed
+        state.remaining_questions = max(rules.config.max_questions - claimed, 0)
+        state.guesses_made = len(guesses)
+        state.remaining_guesses = rules.config.max_guesses - len(guesses)
+        state.won = any(guess["answer"] for guess in guesses)
+        state.is_game_over = state.won or state.remaining_guesses <= 0
+        return state
+
+    async def _transition(self, user: User, day, rules: GameRules, values: dict, allowed):
+        statement = (
+            update(self.model)
+            .where(
+                self.model.user_id == user.id,
+                self.model.day_id == day.id,
+                ~self.model.is_game_over,
+                allowed,
+            )
+            .values(**values)
+            .returning(self.model)
+            .execution_options(populate_existing=True)
+        )
+        state = await self.session.scalar(statement)
+        if state is None and await self._start(user, day, rules):
+            state = await self.session.scalar(statement)
+        return state
+
+    async def _start(self, user: User, day, rules: GameRules) -> Optional[int]:
+        """Creates the user's state for the day if it is missing.
+
+        Returns its id, or None if it already existed.
+        """
+        return await self.session.scalar(
+            insert(self.model)
+            .values(
+                user_id=user.id,
+                day_id=day.id,
+                remaining_questions=rules.config.max_questions,
+                remaining_guesses=rules.config.max_guesses,
+                questions_asked=0,
+                guesses_made=0,
+                is_game_over=False,
+                won=False,
+                points=0,
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "day_id"])
+            .returning(self.model.id)
+        )
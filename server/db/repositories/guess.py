@@ -22,13 +22,6 @@ class CountrydleGuessRepository:
 
         self.session.add(new_entry)
 
-        try:
-            await self.session.commit()  # Commit the transaction
-            await self.session.refresh(new_entry)  # Refresh the instance to get the ID
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
-
         return new_entry
 
     async def get_user_day_guesses(self, user: User, day: CountrydleDay) -> List[CountrydleGuess]:
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import IdempotencyKey
+from db.notify import notify
+
+# Notified with "<scope> <key>" when a request finishes or gives its key up,
+# so retries waiting for it look again
+IDEMPOTENCY_CHANNEL = "idempotency_keys"
+
+
+class IdempotencyRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def claim(
+        self, scope: str, key: str, fingerprint: str, ttl: int, lock_timeout: int
+    ) -> bool:
+        """Takes the key for a request about to run. Does not commit.
+
+        Returns False if the key is taken, unless it is older than `ttl`
+        seconds, or its request has been running for over `lock_timeout`
+        seconds and most likely died with its process.
+        """
+        stale = or_(
+            IdempotencyKey.created_at < func.now() - timedelta(seconds=ttl),
+            IdempotencyKey.status_code.is_(None)
+            & (IdempotencyKey.created_at < func.now() - timedelta(seconds=lock_timeout)),
+        )
+        result = await self.session.execute(
+            insert(IdempotencyKey)
+            .values(scope=scope, key=key, fingerprint=fingerprint, created_at=func.now())
+            .on_conflict_do_update(
+                index_elements=["scope", "key"],
+                set_={
+                    "fingerprint": fingerprint,
+                    "status_code": None,
+                    "content_type": None,
+                    "body": None,
+                    "created_at": func.now(),
+                },
+                where=stale,
+            )
+            .returning(IdempotencyKey.key)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def get(self, scope: str, key: str) -> IdempotencyKey | None:
+        return await self.session.scalar(
+            select(IdempotencyKey).where(
+                IdempotencyKey.scope == scope, IdempotencyKey.key == key
+            )
+        )
+
+    async def complete(
+        self, scope: str, key: str, status_code: int, content_type: str | None, body: bytes
+    ) -> None:
+        """Stores the response for retries to replay. Does not commit."""
+        await self.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            .values(status_code=status_code, content_type=content_type, body=body)
+        )
+        await notify(self.session, IDEMPOTENCY_CHANNEL, f"{scope} {key}")
+
+    async def release(self, scope: str, key: str) -> None:
+        """Gives the key up after its request failed. Does not commit."""
+        await self.session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status_code.is_(None),
+            )
+        )
+        await notify(self.session, IDEMPOTENCY_CHANNEL, f"{scope} {key}")
@@ -0,0 +1,170 @@
+from datetime import date
+from typing import List
+
+from sqlalchemy import and_, case, func, literal, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (
+    CountrydleDay,
+    PowiatdleDay,
+    USStatedleDay,
+    User,
+    UserGameScore,
+    WojewodztwodleDay,
+)
+from db.notify import notify
+from schemas.countrydle import LeaderboardEntry, LeaderboardRank
+
+# Accounts created by tests and load scripts never show up on leaderboards.
+# LIKE patterns, so the underscores are escaped: "tester" is a real player.
+HIDDEN_USERNAME_PATTERNS = [r"test\_%", r"pytest\_%", r"guess\_c\_%", r"ask\_q\_%"]
+
+# Notified with the user id whenever one of their games finishes
+PROFILE_CHANNEL = "profile_stats"
+
+GAME_DAYS = {
+    "countrydle": CountrydleDay,
+    "powiatdle": PowiatdleDay,
+    "us_statedle": USStatedleDay,
+    "wojewodztwodle": WojewodztwodleDay,
+}
+
+
+class LeaderboardRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def record_game(self, game: str, state) -> None:
+        """Adds a finished game to the player's totals in one atomic upsert.
+
+        `state` is any of the *State models. Does not commit; the profile
+        change notification goes out with the transaction.
+        """
+        day = GAME_DAYS[game]
+        won = 1 if state.won else 0
+        played_on = select(day.date).where(day.id == state.day_id).scalar_subquery()
+
+        stmt = insert(UserGameScore).from_select(
+            [
+                "game",
+                "user_id",
+                "points",
+                "wins",
+                "games_played",
+                "streak",
+                "longest_streak",
+                "last_played",
+            ],
+            select(
+                literal(game),
+                User.id,
+                literal(state.points or 0),
+                literal(won),
+                literal(1),
+                literal(won),
+                literal(won),
+                played_on,
+            ).where(
+                User.id == state.user_id,
+                or_(
+                    User.username.is_(None),
+                    and_(*(User.username.not_like(p) for p in HIDDEN_USERNAME_PATTERNS)),
+                ),
+            ),
+        )
+        streak = case((stmt.excluded.wins > 0, UserGameScore.streak + 1), else_=0)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserGameScore.game, UserGameScore.user_id],
+            set_={
+                "points": UserGameScore.points + stmt.excluded.points,
+                "wins": UserGameScore.wins + stmt.excluded.wins,
+                "games_played": UserGameScore.games_played + 1,
+                "streak": streak,
+                "longest_streak": func.greatest(UserGameScore.longest_streak, streak),
+                "last_played": func.greatest(
+                    UserGameScore.last_played, stmt.excluded.last_played
+                ),
+            },
+        )
+        await self.session.execute(stmt)
+        await notify(self.session, PROFILE_CHANNEL, str(state.user_id))
+
+    async def get_leaderboard(
+        self, game: str, limit: int = 100, offset: int = 0
+    ) -> List[LeaderboardEntry]:
+        result = await self.session.execute(
+            select(
+                User.id,
+                User.username,
+                UserGameScore.points,
+                UserGameScore.wins,
+                UserGameScore.streak,
+            )
+            .join(User, User.id == UserGameScore.user_id)
+            .where(UserGameScore.game == game, User.username.is_not(None))
+            .order_by(
+                UserGameScore.points.desc(),
+                UserGameScore.wins.desc(),
+                UserGameScore.streak.desc(),
+                UserGameScore.user_id,
+            )
+            .limit(limit)
+            .offset(offset)
+        )
+
+        return [
+            LeaderboardEntry(
+                id=row.id,
+                username=row.username,
+                points=row.points,
+                streak=row.streak,
+                wins=row.wins,
+            )
+            for row in result.all()
+        ]
+
+    async def get_rank(self, game: str, user: User) -> LeaderboardRank:
+        score = await self.session.get(UserGameScore, (game, user.id))
+        if score is None or user.username is None:
+            return LeaderboardRank(rank=None, entry=None)
+
+        # Players strictly ahead, found with a range scan on the ranking index. The
+        # scan visits every one of them, so the cost grows with the rank: cheap near
+        # the top, a walk over most of the table for the last player
+        ahead = await self.session.scalar(
+            select(func.count())
+            .select_from(UserGameScore)
+            .join(User, User.id == UserGameScore.user_id)
+            .where(
+                UserGameScore.game == game,
+                User.username.is_not(None),
+                tuple_(UserGameScore.points, UserGameScore.wins, UserGameScore.streak)
+                > tuple_(score.points, score.wins, score.streak),
+            )
+        )
+
+        return LeaderboardRank(
+            rank=ahead + 1,
+            entry=LeaderboardEntry(
+                id=user.id,
+                username=user.username,
+                points=score.points,
+                streak=score.streak,
+                wins=score.wins,
+            ),
+        )
+
+    async def reset_stale_streaks(self, last_day: date) -> None:
+        """Ends the streak of everyone who did not finish a game on `last_day`."""
+        await self.session.execute(
+            update(UserGameScore)
+            .where(
+                UserGameScore.streak > 0,
+                or_(
+                    UserGameScore.last_played.is_(None),
+                    UserGameScore.last_played < last_day,
+                ),
+            )
+            .values(streak=0)
+        )
@@ -1,5 +1,8 @@
+from datetime import date
 from typing import List, Optional
-from sqlalchemy import select, func, and_, cast, Integer, desc
+from sqlalchemy import select, func, and_, cast, Integer, desc, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.powiat import Powiat
@@ -10,9 +13,8 @@ from db.models.powiatdle import (
     PowiatdleQuestion,
 )
 from db.models.user import User
+from db.repositories.game_state import StateTransitions
 from schemas.powiatdle import PowiatGuessCreate, PowiatQuestionCreate
-from schemas.countrydle import LeaderboardEntry
-from schemas.statistics import GameStatistics, GameHistoryEntry
 
 
 class PowiatRepository:
@@ -20,7 +22,7 @@ class PowiatRepository:
         self.session = session
 
     async def get_all(self) -> List[Powiat]:
-        result = await self.session.execute(select(Powiat))
+        result = await self.session.execute(select(Powiat).order_by(Powiat.id))
         return list(result.scalars().all())
 
     async def get(self, powiat_id: int) -> Optional[Powiat]:
@@ -38,42 +40,54 @@ class PowiatdleDayRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_today_powiat(self) -> Optional[PowiatdleDay]:
-        today = func.current_date()
+    async def get_today_powiat(self, today: date) -> Optional[PowiatdleDay]:
         result = await self.session.execute(
-            select(PowiatdleDay).where(PowiatdleDay.date == today)
+            select(PowiatdleDay)
+            .options(joinedload(PowiatdleDay.powiat))
+            .where(PowiatdleDay.date == today)
         )
         return result.scalar_one_or_none()
 
-    async def generate_new_day_powiat(self) -> PowiatdleDay:
-        # Get a random powiat
+    async def get_day_powiat_by_date(self, day_date: date) -> Optional[PowiatdleDay]:
         result = await self.session.execute(
-            select(Powiat).order_by(func.random()).limit(1)
+            select(PowiatdleDay).where(PowiatdleDay.date == day_date)
         )
-        powiat = result.scalar_one_or_none()
+        return result.scalar_one_or_none()
 
-        if not powiat:
-            raise Exception("No powiaty found in database!")
+    async def generate_new_day_powiat(self, day_date: date) -> bool:
+        """Draws a random powiat for `day_date`.
 
-        new_day = PowiatdleDay(powiat_id=powiat.id)
-        self.session.add(new_day)
-        await self.session.commit()
-        await self.session.refresh(new_day)
-        return new_day
+        Returns False if the day already exists. Does not commit.
+        """
+        if await self.session.scalar(select(Powiat.id).limit(1)) is None:
+            raise Exception("No powiaty found in database!")
 
-    async def get_history(self) -> List[PowiatdleDay]:
-        from datetime import date
+        result = await self.session.execute(
+            insert(PowiatdleDay)
+            .from_select(
+                ["powiat_id", "date"],
+                select(Powiat.id, literal(day_date)).order_by(func.random()).limit(1),
+            )
+            .on_conflict_do_nothing(index_elements=["date"])
+            .returning(PowiatdleDay.id)
+        )
+        return result.scalar_one_or_none() is not None
 
+    async def get_history(self, today: date) -> List[PowiatdleDay]:
         result = await self.session.execute(
             select(PowiatdleDay)
             .options(joinedload(PowiatdleDay.powiat))
-            .where(PowiatdleDay.date < date.today())
+            .where(PowiatdleDay.date < today)
             .order_by(PowiatdleDay.date.desc())
         )
         return result.scalars().all()
 
 
-class PowiatdleStateRepository:
+class PowiatdleStateRepository(StateTransitions):
+    model = PowiatdleState
+    guess_model = PowiatdleGuess
+    question_model = PowiatdleQuestion
+
     def __init__(self, session: AsyncSession):
         self.session = session
 
@@ -87,6 +101,24 @@ class PowiatdleStateRepository:
         )
         return result.scalar_one_or_none()
 
+    async def load_state(
+        self, user: User, day: PowiatdleDay
+    ) -> Optional[PowiatdleState]:
+        """Loads the state with its guesses and questions in a single query."""
+        result = await self.session.execute(
+            select(PowiatdleState)
+            .options(
+                joinedload(PowiatdleState.guesses),
+                joinedload(
+                    PowiatdleState.questions.and_(PowiatdleQuestion.day_date == day.date)
+                ),
+            )
+            .where(
+                and_(PowiatdleState.user_id == user.id, PowiatdleState.day_id == day.id)
+            )
+        )
+        return result.unique().scalar_one_or_none()
+
     async def create_state(
         self,
         user: User,
@@ -100,15 +132,16 @@ class PowiatdleStateRepository:
             remaining_questions=max_questions,
             remaining_guesses=max_guesses,
         )
-        self.session.add(new_state)
-        await self.session.commit()
-        await self.session.refresh(new_state)
+        try:
+            async with self.session.begin_nested():
+                self.session.add(new_state)
+        except IntegrityError:
+            # A concurrent request created the state first
+            return await self.get_state(user, day)
         return new_state
 
     async def update_state(self, state: PowiatdleState) -> PowiatdleState:
         self.session.add(state)
-        await self.session.commit()
-        await self.session.refresh(state)
         return state
 
     async def calc_points(self, state: PowiatdleState) -> int:
@@ -118,93 +151,6 @@ class PowiatdleStateRepository:
         difficulty_bonus = 500
         return question_points + guess_points + difficulty_bonus
 
-    async def get_leaderboard(self) -> List[LeaderboardEntry]:
-        stmt = (
-            select(
-                User.id,
-                User.username,
-                func.coalesce(func.sum(PowiatdleState.points), 0).label("points"),
-                func.coalesce(func.sum(cast(PowiatdleState.won, Integer)), 0).label(
-                    "wins"
-                ),
-            )
-            .join(User, User.id == PowiatdleState.user_id)
-            .where(
-                and_(
-                    User.username.not_like("test_%"),
-                    User.username.not_like("pytest_%"),
-                    User.username.not_like("guess_c_%"),
-                    User.username.not_like("ask_q_%"),
-                )
-            )
-            .group_by(User.id, User.username)
-            .order_by(desc("points"), desc("wins"))
-        )
-
-        result = await self.session.execute(stmt)
-
-        return [
-            LeaderboardEntry(
-                id=row.id,
-                username=row.username,
-                points=row.points,
-                wins=row.wins,
-                streak=0,  # Streak not implemented yet for sub-games
-            )
-            for row in result.all()
-        ]
-
-    async def get_user_statistics(self, user: User) -> GameStatistics:
-        # Calculate total points and wins
-        stmt = select(
-            func.coalesce(func.sum(PowiatdleState.points), 0).label("points"),
-            func.coalesce(func.sum(cast(PowiatdleState.won, Integer)), 0).label("wins"),
-            func.count(PowiatdleState.id).label("games_played"),
-        ).where(PowiatdleState.user_id == user.id)
-        result = await self.session.execute(stmt)
-        row = result.first()
-
-        points = row.points if row else 0
-        wins = row.wins if row else 0
-        games_played = row.games_played if row else 0
-
-        # Get history
-        history_stmt = (
-            select(PowiatdleState)
-            .options(joinedload(PowiatdleState.day).joinedload(PowiatdleDay.powiat))
-            .where(
-                and_(
-                    PowiatdleState.user_id == user.id,
-                    PowiatdleState.is_game_over == True,
-                )
-            )
-            .order_by(PowiatdleState.id.desc())
-        )
-        history_result = await self.session.execute(history_stmt)
-        history_states = history_result.scalars().all()
-
-        from datetime import date
-
-        history_entries = [
-            GameHistoryEntry(
-                date=str(state.day.date),
-                won=state.won,
-                points=state.points,
-                attempts=state.guesses_made,
-                target_name=state.day.powiat.nazwa if state.won else "???",
-            )
-            for state in history_states
-        ]
-
-        return GameStatistics(
-            points=points,
-            wins=wins,
-            games_played=games_played,
-            streak=0,  # TODO: Implement streak
-            history=history_entries,
-        )
-
-
 class PowiatdleGuessRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -212,8 +158,6 @@ class PowiatdleGuessRepository:
     async def add_guess(self, guess_create: PowiatGuessCreate) -> PowiatdleGuess:
         new_guess = PowiatdleGuess(**guess_create.model_dump())
         self.session.add(new_guess)
-        await self.session.commit()
-        await self.session.refresh(new_guess)
         return new_guess
 
     async def get_user_day_guesses(
@@ -242,8 +186,6 @@ class PowiatdleQuestionRepository:
         data.pop("required_info", None)
         new_question = PowiatdleQuestion(**data)
         self.session.add(new_question)
-        await self.session.commit()
-        await self.session.refresh(new_question)
         return new_question
 
 
@@ -256,6 +198,7 @@ class PowiatdleQuestionRepository:
                 and_(
                     PowiatdleQuestion.user_id == user.id,
                     PowiatdleQuestion.day_id == day.id,
+                    PowiatdleQuestion.day_date == day.date,
                 )
             )
             .order_by(PowiatdleQuestion.asked_at.asc())
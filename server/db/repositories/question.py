@@ -1,8 +1,9 @@
 from typing import List
-from sqlalchemy import Integer, and_, func, select
+from sqlalchemy import Integer, func, select, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import CountrydleDay, CountrydleQuestion, User
+from db.partitions import archive_of
 from schemas.countrydle import (
     QuestionCreate,
 )
@@ -26,14 +27,6 @@ class CountrydleQuestionsRepository:
 
         self.session.add(new_entry)
 
-
-        try:
-            await self.session.commit()  # Commit the transaction
-            await self.session.refresh(new_entry)  # Refresh the instance to get the ID
-        except Exception as ex:
-            await self.session.rollback()
-            raise ex
-
         return new_entry
 
     async def get_user_day_questions(
@@ -41,20 +34,31 @@ class CountrydleQuestionsRepository:
     ) -> List[CountrydleQuestion]:
         questions_result = await self.session.execute(
             select(CountrydleQuestion)
-            .where(CountrydleQuestion.user_id == user.id, CountrydleQuestion.day_id == day.id)
+            .where(
+                CountrydleQuestion.user_id == user.id,
+                CountrydleQuestion.day_id == day.id,
+                CountrydleQuestion.day_date == day.date,
+            )
             .order_by(CountrydleQuestion.id.asc())
         )
         return questions_result.scalars().all()
 
     async def get_user_question_statistics(self, user: User) -> List[CountrydleQuestion]:
+        archive = archive_of(CountrydleQuestion)
+        questions = union_all(
+            select(CountrydleQuestion.answer).where(
+                CountrydleQuestion.user_id == user.id, CountrydleQuestion.valid == True
+            ),
+            select(archive.c.answer).where(
+                archive.c.user_id == user.id, archive.c.valid == True
+            ),
+        ).subquery()
 
         questions_result = await self.session.execute(
             select(
-                func.count(CountrydleQuestion.id).label("count"),
-                func.sum(CountrydleQuestion.answer.cast(Integer)).label("correct"),
-                func.sum((CountrydleQuestion.answer == False).cast(Integer)).label("incorrect"),
-            ).where(and_(CountrydleQuestion.user_id == user.id, CountrydleQuestion.valid == True))
+                func.count().label("count"),
+                func.sum(questions.c.answer.cast(Integer)).label("correct"),
+                func.sum((questions.c.answer == False).cast(Integer)).label("incorrect"),
+            )
         )
-        row = questions_result.first()
-        print(row)
-        return row
+        return questions_result.first()
@@ -0,0 +1,40 @@
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import RateLimitBucket
+
+
+class RateLimitRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def take(self, key: str, burst: int, rate: float) -> float:
+        """Takes a token from the bucket `key`, refilled at `rate` tokens a second.
+
+        Returns 0 if a token was taken, otherwise the seconds until one is
+        available. A single upsert, so workers racing for the last token are
+        serialized by its row lock. Does not commit.
+        """
+        bucket = RateLimitBucket.__table__
+        elapsed = func.extract("epoch", func.now() - bucket.c.updated_at)
+        available = func.least(burst, bucket.c.tokens + elapsed * rate)
+        allowed = available >= 1
+        statement = insert(RateLimitBucket).values(
+            key=key, tokens=burst - 1, updated_at=func.now()
+        )
+        result = await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["key"],
+                set_={
+                    "tokens": case((allowed, available - 1), else_=bucket.c.tokens),
+                    "updated_at": case((allowed, func.now()), else_=bucket.c.updated_at),
+                },
+            ).returning(
+                # Only a taken token moves updated_at to this transaction's now()
+                RateLimitBucket.updated_at == func.now(),
+                available,
+            )
+        )
+        taken, tokens = result.one()
+        return 0.0 if taken else (1 - tokens) / rate
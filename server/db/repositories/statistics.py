@@ -0,0 +1,133 @@
+from typing import List
+
+from sqlalchemy import case, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (
+    Country,
+    CountrydleDay,
+    CountrydleState,
+    Powiat,
+    PowiatdleDay,
+    PowiatdleState,
+    USState,
+    USStatedleDay,
+    USStatedleState,
+    User,
+    UserGameScore,
+    Wojewodztwo,
+    WojewodztwodleDay,
+    WojewodztwodleState,
+)
+from schemas.statistics import GameHistoryEntry, GameStatistics, UserProfileStatistics
+
+# Most recent finished games listed per game on a profile, and per history page
+HISTORY_LIMIT = 30
+MAX_HISTORY_LIMIT = 100
+
+# game -> (state, day, day column holding the target, target name column)
+GAME_TABLES = {
+    "countrydle": (CountrydleState, CountrydleDay, CountrydleDay.country_id, Country.name),
+    "powiatdle": (PowiatdleState, PowiatdleDay, PowiatdleDay.powiat_id, Powiat.nazwa),
+    "us_statedle": (USStatedleState, USStatedleDay, USStatedleDay.us_state_id, USState.name),
+    "wojewodztwodle": (
+        WojewodztwodleState,
+        WojewodztwodleDay,
+        WojewodztwodleDay.wojewodztwo_id,
+        Wojewodztwo.nazwa,
+    ),
+}
+
+
+class ProfileStatisticsRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_profile(
+        self, user: User, history_limit: int = HISTORY_LIMIT
+    ) -> UserProfileStatistics:
+        """Builds a user's statistics for every game in two queries.
+
+        Totals come from user_game_scores, history from one UNION ALL over the
+        four games, capped at the `history_limit` latest games each.
+        """
+        scores = await self.session.execute(
+            select(UserGameScore).where(UserGameScore.user_id == user.id)
+        )
+        scores = {score.game: score for score in scores.scalars()}
+
+        history = {game: [] for game in GAME_TABLES}
+        result = await self.session.execute(
+            union_all(
+                *(
+                    self._history_query(game, user).limit(history_limit)
+                    for game in GAME_TABLES
+                )
+            )
+        )
+        for row in sorted(result, key=lambda row: row.date, reverse=True):
+            history[row.game].append(self._history_entry(row))
+
+        games = {}
+        for game in GAME_TABLES:
+            score = scores.get(game)
+            games[game] = GameStatistics(
+                points=score.points if score else 0,
+                wins=score.wins if score else 0,
+                games_played=score.games_played if score else 0,
+                streak=score.streak if score else 0,
+                history=history[game],
+            )
+
+        return UserProfileStatistics(user=user, **games)
+
+    async def get_history(
+        self,
+        game: str,
+        user: User,
+        before: int | None = None,
+        limit: int = HISTORY_LIMIT,
+    ) -> List[GameHistoryEntry]:
+        """Returns a page of the user's finished `game` games, newest first.
+
+        `before` is the day id of the last entry on the previous page. Day ids
+        grow with the date, so paging by id follows the calendar.
+        """
+        query = self._history_query(game, user)
+        if before is not None:
+            query = query.where(GAME_TABLES[game][0].day_id < before)
+
+        result = await self.session.execute(query.limit(limit))
+        return [self._history_entry(row) for row in result]
+
+    def _history_query(self, game: str, user: User):
+        # Ordered and filtered so ix_<game>_states_history covers the state rows;
+        # only the page's days and targets are looked up
+        state, day, target_id, target_name = GAME_TABLES[game]
+        target = target_name.class_
+        return (
+            select(
+                literal(game).label("game"),
+                state.day_id,
+                day.date,
+                state.won,
+                state.points,
+                state.guesses_made.label("attempts"),
+                case((state.won, target_name), else_="???").label("target_name"),
+            )
+            .join(day, day.id == state.day_id)
+            .outerjoin(target, target.id == target_id)
+            .where(state.user_id == user.id, state.is_game_over)
+            .order_by(state.day_id.desc())
+        )
+
+    @staticmethod
+    def _history_entry(row) -> GameHistoryEntry:
+        return GameHistoryEntry(
+            day_id=row.day_id,
+            date=str(row.date),
+            won=row.won,
+            points=row.points,
+            attempts=row.attempts,
+            target_name=row.target_name,
+        )
@@ -9,7 +9,7 @@ class USStateRepository:
         self.session = session
 
     async def get_all(self) -> List[USState]:
-        result = await self.session.execute(select(USState))
+        result = await self.session.execute(select(USState).order_by(USState.id))
         return list(result.scalars().all())
 
     async def get(self, state_id: int) -> Optional[USState]:
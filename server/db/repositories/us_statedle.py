@@ -1,5 +1,8 @@
+from datetime import date
 from typing import List, Optional
-from sqlalchemy import select, func, and_, cast, Integer, desc
+from sqlalchemy import select, func, and_, cast, Integer, desc, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.us_state import USState
@@ -10,51 +13,62 @@ from db.models.us_statedle import (
     USStatedleQuestion,
 )
 from db.models.user import User
+from db.repositories.game_state import StateTransitions
 from schemas.us_statedle import USStateGuessCreate, USStateQuestionCreate
-from schemas.countrydle import LeaderboardEntry
-from schemas.statistics import GameStatistics, GameHistoryEntry
 
 
 class USStatedleDayRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_today_us_state(self) -> Optional[USStatedleDay]:
-        today = func.current_date()
+    async def get_today_us_state(self, today: date) -> Optional[USStatedleDay]:
         result = await self.session.execute(
-            select(USStatedleDay).where(USStatedleDay.date == today)
+            select(USStatedleDay)
+            .options(joinedload(USStatedleDay.us_state))
+            .where(USStatedleDay.date == today)
         )
         return result.scalar_one_or_none()
 
-    async def generate_new_day_us_state(self) -> USStatedleDay:
-        # Get a random us_state
+    async def get_day_us_state_by_date(self, day_date: date) -> Optional[USStatedleDay]:
         result = await self.session.execute(
-            select(USState).order_by(func.random()).limit(1)
+            select(USStatedleDay).where(USStatedleDay.date == day_date)
         )
-        us_state = result.scalar_one_or_none()
+        return result.scalar_one_or_none()
 
-        if not us_state:
-            raise Exception("No US states found in database!")
+    async def generate_new_day_us_state(self, day_date: date) -> bool:
+        """Draws a random us_state for `day_date`.
 
-        new_day = USStatedleDay(us_state_id=us_state.id)
-        self.session.add(new_day)
-        await self.session.commit()
-        await self.session.refresh(new_day)
-        return new_day
+        Returns False if the day already exists. Does not commit.
+        """
+        if await self.session.scalar(select(USState.id).limit(1)) is None:
+            raise Exception("No US states found in database!")
 
-    async def get_history(self) -> List[USStatedleDay]:
-        from datetime import date
+        result = await self.session.execute(
+            insert(USStatedleDay)
+            .from_select(
+                ["us_state_id", "date"],
+                select(USState.id, literal(day_date)).order_by(func.random()).limit(1),
+            )
+            .on_conflict_do_nothing(index_elements=["date"])
+            .returning(USStatedleDay.id)
+        )
+        return result.scalar_one_or_none() is not None
 
+    async def get_history(self, today: date) -> List[USStatedleDay]:
         result = await self.session.execute(
             select(USStatedleDay)
             .options(joinedload(USStatedleDay.us_state))
-            .where(USStatedleDay.date < date.today())
+            .where(USStatedleDay.date < today)
             .order_by(USStatedleDay.date.desc())
         )
         return result.scalars().all()
 
 
-class USStatedleStateRepository:
+class USStatedleStateRepository(StateTransitions):
+    model = USStatedleState
+    guess_model = USStatedleGuess
+    question_model = USStatedleQuestion
+
     def __init__(self, session: AsyncSession):
         self.session = session
 
@@ -70,6 +84,24 @@ class USStatedleStateRepository:
         )
         return result.scalar_one_or_none()
 
+    async def load_state(
+        self, user: User, day: USStatedleDay
+    ) -> Optional[USStatedleState]:
+        """Loads the state with its guesses and questions in a single query."""
+        result = await self.session.execute(
+            select(USStatedleState)
+            .options(
+                joinedload(USStatedleState.guesses),
+                joinedload(
+                    USStatedleState.questions.and_(USStatedleQuestion.day_date == day.date)
+                ),
+            )
+            .where(
+                and_(USStatedleState.user_id == user.id, USStatedleState.day_id == day.id)
+            )
+        )
+        return result.unique().scalar_one_or_none()
+
     async def create_state(
         self,
         user: User,
@@ -83,15 +115,16 @@ class USStatedleStateRepository:
             remaining_questions=max_questions,
             remaining_guesses=max_guesses,
         )
-        self.session.add(new_state)
-        await self.session.commit()
-        await self.session.refresh(new_state)
+        try:
+            async with self.session.begin_nested():
+                self.session.add(new_state)
+        except IntegrityError:
+            # A concurrent request created the state first
+            return await self.get_state(user, day)
         return new_state
 
     async def update_state(self, state: USStatedleState) -> USStatedleState:
         self.session.add(state)
-        await self.session.commit()
-        await self.session.refresh(state)
         return state
 
     async def calc_points(self, state: USStatedleState) -> int:
@@ -101,95 +134,6 @@ class USStatedleStateRepository:
         difficulty_bonus = 200
         return question_points + guess_points + difficulty_bonus
 
-    async def get_leaderboard(self) -> List[LeaderboardEntry]:
-        stmt = (
-            select(
-                User.id,
-                User.username,
-                func.coalesce(func.sum(USStatedleState.points), 0).label("points"),
-                func.coalesce(func.sum(cast(USStatedleState.won, Integer)), 0).label(
-                    "wins"
-                ),
-            )
-            .join(User, User.id == USStatedleState.user_id)
-            .where(
-                and_(
-                    User.username.not_like("test_%"),
-                    User.username.not_like("pytest_%"),
-                    User.username.not_like("guess_c_%"),
-                    User.username.not_like("ask_q_%"),
-                )
-            )
-            .group_by(User.id, User.username)
-            .order_by(desc("points"), desc("wins"))
-        )
-
-        result = await self.session.execute(stmt)
-
-        return [
-            LeaderboardEntry(
-                id=row.id,
-                username=row.username,
-                points=row.points,
-                wins=row.wins,
-                streak=0,  # Streak not implemented yet for sub-games
-            )
-            for row in result.all()
-        ]
-
-    async def get_user_statistics(self, user: User) -> GameStatistics:
-        # Calculate total points and wins
-        stmt = select(
-            func.coalesce(func.sum(USStatedleState.points), 0).label("points"),
-            func.coalesce(func.sum(cast(USStatedleState.won, Integer)), 0).label(
-                "wins"
-            ),
-            func.count(USStatedleState.id).label("games_played"),
-        ).where(USStatedleState.user_id == user.id)
-        result = await self.session.execute(stmt)
-        row = result.first()
-
-        points = row.points if row else 0
-        wins = row.wins if row else 0
-        games_played = row.games_played if row else 0
-
-        # Get history
-        history_stmt = (
-            select(USStatedleState)
-            .options(joinedload(USStatedleState.day).joinedload(USStatedleDay.us_state))
-            .where(
-                and_(
-                    USStatedleState.user_id == user.id,
-                    USStatedleState.is_game_over == True,
-                )
-            )
-            .order_by(USStatedleState.id.desc())
-        )
-        history_result = await self.session.execute(history_stmt)
-        history_states = history_result.scalars().all()
-
-        from datetime import date
-
-        history_entries = [
-            GameHistoryEntry(
-                date=str(state.day.date),
-                won=state.won,
-                points=state.points,
-                attempts=state.guesses_made,
-                target_name=state.day.us_state.name if state.won else "???",
-            )
-            for state in history_states
-        ]
-
-        return GameStatistics(
-            points=points,
-            wins=wins,
-            games_played=games_played,
-            streak=0,  # TODO: Implement streak
-            history=history_entries,
-        )
-
-
 class USStatedleGuessRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -197,8 +141,6 @@ class USStatedleGuessRepository:
     async def add_guess(self, guess_create: USStateGuessCreate) -> USStatedleGuess:
         new_guess = USStatedleGuess(**guess_create.model_dump())
         self.session.add(new_guess)
-        await self.session.commit()
-        await self.session.refresh(new_guess)
         return new_guess
 
     async def get_user_day_guesses(
@@ -229,8 +171,6 @@ class USStatedleQuestionRepository:
         data.pop("required_info", None)
         new_question = USStatedleQuestion(**data)
         self.session.add(new_question)
-        await self.session.commit()
-        await self.session.refresh(new_question)
         return new_question
 
 
@@ -243,6 +183,7 @@ class USStatedleQuestionRepository:
                 and_(
                     USStatedleQuestion.user_id == user.id,
                     USStatedleQuestion.day_id == day.id,
+                    USStatedleQuestion.day_date == day.date,
                 )
             )
             .order_by(USStatedleQuestion.asked_at.asc())
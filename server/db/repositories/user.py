@@ -1,23 +1,25 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import re
 from fastapi import HTTPException
-from sqlalchemy import and_, or_, select
+from sqlalchemy import and_, case, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from db import passwords
 from db.models import Permission, User, AccountUpdate
 from schemas.user import UserCreate, UserUpdate
-from db.models.countrydle import CountrydleState
+from db.models.countrydle import CountrydleDay, CountrydleState
 from db.models.user import UserPoints
+from db.notify import notify
+
+# Notified with the user id whenever their credentials or profile change
+USER_CHANNEL = "users"
 
 
 class UserRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    @staticmethod
-    def verify_password(password, db_password):
-        return User.verify_password(password, db_password)
-
     async def get(self, uid) -> User | None:
         result = await self.session.execute(select(User).where(User.id == uid))
 
@@ -90,7 +92,7 @@ class UserRepository:
         if user_in_db:
             raise HTTPException(status_code=400, detail="Email already taken!")
 
-        hashed_password = User.hash_password(user.password)
+        hashed_password = await passwords.hash(user.password)
         new_user = User(
             username=user.username, email=user.email, hashed_password=hashed_password, verified=True
         )
@@ -120,6 +122,7 @@ class UserRepository:
 
         user = result.scalar_one()
         user.verified = True
+        await notify(self.session, USER_CHANNEL, str(user.id))
         await self.session.commit()
 
         return user
@@ -139,14 +142,65 @@ class UserRepository:
         return user_points
 
     async def update_points(self, user_id: int, state: CountrydleState):
-        user_points = await self.get_user_points(user_id)
-        if not user_points:
-            user_points = await self.add_user_points(user_id)
+        """Adds a finished game to the user's points in one atomic upsert. Does not commit."""
+        points = state.points or 0
+        if not state.won:
+            stmt = insert(UserPoints).values(user_id=user_id, points=points, streak=0)
+            await self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[UserPoints.user_id],
+                    set_={"points": UserPoints.points + points, "streak": 0},
+                )
+            )
+            return
 
-        user_points.streak = user_points.streak + 1 if state.won else 0
-        user_points.points += state.points
+        played_on = (
+            select(CountrydleDay.date)
+            .where(CountrydleDay.id == state.day_id)
+            .scalar_subquery()
+        )
+        # SET expressions see the old row, so the streak being extended started
+        # `streak` days before this game
+        streak = UserPoints.streak + 1
+        is_longest = streak > UserPoints.longest_streak
+        stmt = insert(UserPoints).values(
+            user_id=user_id,
+            points=points,
+            streak=1,
+            longest_streak=1,
+            longest_streak_start=played_on,
+        )
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[UserPoints.user_id],
+                set_={
+                    "points": UserPoints.points + points,
+                    "streak": streak,
+                    "longest_streak": case((is_longest, streak), else_=UserPoints.longest_streak),
+                    "longest_streak_start": case(
+                        (is_longest, played_on - UserPoints.streak),
+                        else_=UserPoints.longest_streak_start,
+                    ),
+                },
+            )
+        )
 
-        await self.session.commit()
+    async def reset_stale_streaks(self, last_day: date) -> None:
+        """Ends the Countrydle streak of everyone who did not finish `last_day`'s game."""
+        finished = (
+            select(CountrydleState.id)
+            .join(CountrydleDay, CountrydleDay.id == CountrydleState.day_id)
+            .where(
+                CountrydleState.user_id == UserPoints.user_id,
+                CountrydleState.is_game_over,
+                CountrydleDay.date == last_day,
+            )
+        )
+        await self.session.execute(
+            update(UserPoints)
+            .where(UserPoints.streak > 0, ~finished.exists())
+            .values(streak=0)
+        )
 
     async def get_last_user_update(self, user_id: int) -> AccountUpdate | None:
         since = datetime.now() - timedelta(days=30)
@@ -199,6 +253,7 @@ class UserRepository:
 
         self.session.add(user)
         self.session.add(new_update)
+        await notify(self.session, USER_CHANNEL, str(user_id))
 
         await self.session.commit()
         await self.session.refresh(user)
@@ -207,10 +262,16 @@ class UserRepository:
         return user
 
 
+    async def rehash_password(self, user: User, hashed_password: str) -> None:
+        """Stores a hash of the same password made with the current cost. Does not commit."""
+        user.hashed_password = hashed_password
+        await notify(self.session, USER_CHANNEL, str(user.id))
+
     async def change_password(self, user_id: int, password: str) -> User:
         user = await self.get(user_id)
-        new_hashed_password = User.hash_password(password)
+        new_hashed_password = await passwords.hash(password)
         user.hashed_password = new_hashed_password
+        await notify(self.session, USER_CHANNEL, str(user_id))
 
         await self.session.commit()
         await self.session.refresh(user)
@@ -9,7 +9,7 @@ class WojewodztwoRepository:
         self.session = session
 
     async def get_all(self) -> List[Wojewodztwo]:
-        result = await self.session.execute(select(Wojewodztwo))
+        result = await self.session.execute(select(Wojewodztwo).order_by(Wojewodztwo.id))
         return list(result.scalars().all())
 
     async def get(self, wojewodztwo_id: int) -> Optional[Wojewodztwo]:
@@ -1,5 +1,8 @@
+from datetime import date
 from typing import List, Optional
-from sqlalchemy import select, func, and_, cast, Integer, desc
+from sqlalchemy import select, func, and_, cast, Integer, desc, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.wojewodztwo import Wojewodztwo
@@ -10,51 +13,62 @@ from db.models.wojewodztwodle import (
     WojewodztwodleQuestion,
 )
 from db.models.user import User
+from db.repositories.game_state import StateTransitions
 from schemas.wojewodztwodle import WojewodztwoGuessCreate, WojewodztwoQuestionCreate
-from schemas.countrydle import LeaderboardEntry
-from schemas.statistics import GameStatistics, GameHistoryEntry
 
 
 class WojewodztwodleDayRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_today_wojewodztwo(self) -> Optional[WojewodztwodleDay]:
-        today = func.current_date()
+    async def get_today_wojewodztwo(self, today: date) -> Optional[WojewodztwodleDay]:
         result = await self.session.execute(
-            select(WojewodztwodleDay).where(WojewodztwodleDay.date == today)
+            select(WojewodztwodleDay)
+            .options(joinedload(WojewodztwodleDay.wojewodztwo))
+            .where(WojewodztwodleDay.date == today)
         )
         return result.scalar_one_or_none()
 
-    async def generate_new_day_wojewodztwo(self) -> WojewodztwodleDay:
-        # Get a random wojewodztwo
+    async def get_day_wojewodztwo_by_date(self, day_date: date) -> Optional[WojewodztwodleDay]:
         result = await self.session.execute(
-            select(Wojewodztwo).order_by(func.random()).limit(1)
+            select(WojewodztwodleDay).where(WojewodztwodleDay.date == day_date)
         )
-        wojewodztwo = result.scalar_one_or_none()
+        return result.scalar_one_or_none()
 
-        if not wojewodztwo:
-            raise Exception("No wojewodztwa found in database!")
+    async def generate_new_day_wojewodztwo(self, day_date: date) -> bool:
+        """Draws a random wojewodztwo for `day_date`.
 
-        new_day = WojewodztwodleDay(wojewodztwo_id=wojewodztwo.id)
-        self.session.add(new_day)
-        await self.session.commit()
-        await self.session.refresh(new_day)
-        return new_day
+        Returns False if the day already exists. Does not commit.
+        """
+        if await self.session.scalar(select(Wojewodztwo.id).limit(1)) is None:
+            raise Exception("No wojewodztwa found in database!")
 
-    async def get_history(self) -> List[WojewodztwodleDay]:
-        from datetime import date
+        result = await self.session.execute(
+            insert(WojewodztwodleDay)
+            .from_select(
+                ["wojewodztwo_id", "date"],
+                select(Wojewodztwo.id, literal(day_date)).order_by(func.random()).limit(1),
+            )
+            .on_conflict_do_nothing(index_elements=["date"])
+            .returning(WojewodztwodleDay.id)
+        )
+        return result.scalar_one_or_none() is not None
 
+    async def get_history(self, today: date) -> List[WojewodztwodleDay]:
         result = await self.session.execute(
             select(WojewodztwodleDay)
             .options(joinedload(WojewodztwodleDay.wojewodztwo))
-            .where(WojewodztwodleDay.date < date.today())
+            .where(WojewodztwodleDay.date < today)
             .order_by(WojewodztwodleDay.date.desc())
         )
         return result.scalars().all()
 
 
-class WojewodztwodleStateRepository:
+class WojewodztwodleStateRepository(StateTransitions):
+    model = WojewodztwodleState
+    guess_model = WojewodztwodleGuess
+    question_model = WojewodztwodleQuestion
+
     def __init__(self, session: AsyncSession):
         self.session = session
 
@@ -71,6 +85,24 @@ class WojewodztwodleStateRepository:
         )
         return result.scalar_one_or_none()
 
+    async def load_state(
+        self, user: User, day: WojewodztwodleDay
+    ) -> Optional[WojewodztwodleState]:
+        """Loads the state with its guesses and questions in a single query."""
+        result = await self.session.execute(
+            select(WojewodztwodleState)
+            .options(
+                joinedload(WojewodztwodleState.guesses),
+                joinedload(
+                    WojewodztwodleState.questions.and_(WojewodztwodleQuestion.day_date == day.date)
+                ),
+            )
+            .where(
+                and_(WojewodztwodleState.user_id == user.id, WojewodztwodleState.day_id == day.id)
+            )
+        )
+        return result.unique().scalar_one_or_none()
+
     async def create_state(
         self,
         user: User,
@@ -84,15 +116,16 @@ class WojewodztwodleStateRepository:
             remaining_questions=max_questions,
             remaining_guesses=max_guesses,
         )
-        self.session.add(new_state)
-        await self.session.commit()
-        await self.session.refresh(new_state)
+        try:
+            async with self.session.begin_nested():
+                self.session.add(new_state)
+        except IntegrityError:
+            # A concurrent request created the state first
+            return await self.get_state(user, day)
         return new_state
 
     async def update_state(self, state: WojewodztwodleState) -> WojewodztwodleState:
         self.session.add(state)
-        await self.session.commit()
-        await self.session.refresh(state)
         return state
 
     async def calc_points(self, state: WojewodztwodleState) -> int:
@@ -101,99 +134,6 @@ class WojewodztwodleStateRepository:
         guess_points = 100 * (state.remaining_guesses + 1)
         return question_points + guess_points
 
-    async def get_leaderboard(self) -> List[LeaderboardEntry]:
-        stmt = (
-            select(
-                User.id,
-                User.username,
-                func.coalesce(func.sum(WojewodztwodleState.points), 0).label("points"),
-                func.coalesce(
-                    func.sum(cast(WojewodztwodleState.won, Integer)), 0
-                ).label("wins"),
-            )
-            .join(User, User.id == WojewodztwodleState.user_id)
-            .where(
-                and_(
-                    User.username.not_like("test_%"),
-                    User.username.not_like("pytest_%"),
-                    User.username.not_like("guess_c_%"),
-                    User.username.not_like("ask_q_%"),
-                )
-            )
-            .group_by(User.id, User.username)
-            .order_by(desc("points"), desc("wins"))
-        )
-
-        result = await self.session.execute(stmt)
-
-        return [
-            LeaderboardEntry(
-                id=row.id,
-                username=row.username,
-                points=row.points,
-                wins=row.wins,
-                streak=0,  # Streak not implemented yet for sub-games
-            )
-            for row in result.all()
-        ]
-
-    async def get_user_statistics(self, user: User) -> GameStatistics:
-        # Calculate total points and wins
-        stmt = select(
-            func.coalesce(func.sum(WojewodztwodleState.points), 0).label("points"),
-            func.coalesce(func.sum(cast(WojewodztwodleState.won, Integer)), 0).label(
-                "wins"
-            ),
-            func.count(WojewodztwodleState.id).label("games_played"),
-        ).where(WojewodztwodleState.user_id == user.id)
-        result = await self.session.execute(stmt)
-        row = result.first()
-
-        points = row.points if row else 0
-        wins = row.wins if row else 0
-        games_played = row.games_played if row else 0
-
-        # Get history
-        history_stmt = (
-            select(WojewodztwodleState)
-            .options(
-                joinedload(WojewodztwodleState.day).joinedload(
-                    WojewodztwodleDay.wojewodztwo
-                )
-            )
-            .where(
-                and_(
-                    WojewodztwodleState.user_id == user.id,
-                    WojewodztwodleState.is_game_over == True,
-                )
-            )
-            .order_by(WojewodztwodleState.id.desc())
-        )
-        history_result = await self.session.execute(history_stmt)
-        history_states = history_result.scalars().all()
-
-        from datetime import date
-
-        history_entries = [
-            GameHistoryEntry(
-                date=str(state.day.date),
-                won=state.won,
-                points=state.points,
-                attempts=state.guesses_made,
-                target_name=state.day.wojewodztwo.nazwa if state.won else "???",
-            )
-            for state in history_states
-        ]
-
-        return GameStatistics(
-            points=points,
-            wins=wins,
-            games_played=games_played,
-            streak=0,  # TODO: Implement streak
-            history=history_entries,
-        )
-
-
 class WojewodztwodleGuessRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -203,8 +143,6 @@ class WojewodztwodleGuessRepository:
     ) -> WojewodztwodleGuess:
         new_guess = WojewodztwodleGuess(**guess_create.model_dump())
         self.session.add(new_guess)
-        await self.session.commit()
-        await self.session.refresh(new_guess)
         return new_guess
 
     async def get_user_day_guesses(
@@ -236,8 +174,6 @@ class WojewodztwodleQuestionRepository:
         data.pop("required_info", None)
         new_question = WojewodztwodleQuestion(**data)
         self.session.add(new_question)
-        await self.session.commit()
-        await self.session.refresh(new_question)
         return new_question
 
 
@@ -250,6 +186,7 @@ class WojewodztwodleQuestionRepository:
                 and_(
                     WojewodztwodleQuestion.user_id == user.id,
                     WojewodztwodleQuestion.day_id == day.id,
+                    WojewodztwodleQuestion.day_date == day.date,
                 )
             )
             .order_by(WojewodztwodleQuestion.asked_at.asc())
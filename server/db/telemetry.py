@@ -0,0 +1,156 @@
+"""Per-request database telemetry.
+
+Cursor events on every engine are recorded into the telemetry of the request
+being handled, found through a context variable. Finished requests are
+aggregated per route for /metrics.
+"""
+
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Adds X-DB-* headers to every response
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+SLOWEST_KEPT = 3
+# The same statement this many times in one request is most likely an N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 10))
+
+
+@dataclass
+class RequestTelemetry:
+    queries: int = 0
+    commits: int = 0
+    db_time: float = 0.0
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+    statements: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+        if len(self.slowest) < SLOWEST_KEPT or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+    def repeated(self) -> dict[str, int]:
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= N_PLUS_ONE_THRESHOLD
+        }
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-DB-Queries": str(self.queries),
+            "X-DB-Commits": str(self.commits),
+            "X-DB-Time-Ms": f"{self.db_time * 1000:.1f}",
+        }
+        if self.slowest:
+            elapsed, statement = self.slowest[0]
+            headers["X-DB-Slowest"] = f"{elapsed * 1000:.1f}ms {' '.join(statement.split())[:200]}"
+        return headers
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    queries: int = 0
+    commits: int = 0
+    db_time: float = 0.0
+    max_queries: int = 0
+    n_plus_one: int = 0
+
+
+_current: ContextVar[RequestTelemetry | None] = ContextVar("db_telemetry", default=None)
+_routes: dict[str, RouteStats] = {}
+_watchers: list[list[tuple[str, RequestTelemetry]]] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.record(statement, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _on_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+@event.listens_for(Engine, "commit")
+def _on_commit(conn):
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.commits += 1
+
+
+@contextmanager
+def track():
+    """Records the statements run by the current task until the block exits."""
+    telemetry = RequestTelemetry()
+    token = _current.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current.reset(token)
+
+
+def record(route: str, telemetry: RequestTelemetry) -> None:
+    stats = _routes.setdefault(route, RouteStats())
+    stats.requests += 1
+    stats.queries += telemetry.queries
+    stats.commits += telemetry.commits
+    stats.db_time += telemetry.db_time
+    stats.max_queries = max(stats.max_queries, telemetry.queries)
+
+    repeated = telemetry.repeated()
+    if repeated:
+        stats.n_plus_one += 1
+        for statement, count in repeated.items():
+            logging.warning(f"{route} ran a statement {count} times (N+1?): {statement}")
+
+    for watcher in _watchers:
+        watcher.append((route, telemetry))
+
+
+@contextmanager
+def watch():
+    """Collects (route, telemetry) of every request finished inside the block."""
+    finished: list[tuple[str, RequestTelemetry]] = []
+    _watchers.append(finished)
+    try:
+        yield finished
+    finally:
+        _watchers.remove(finished)
+
+
+def stats() -> dict:
+    return {
+        route: {
+            "requests": s.requests,
+            "queries": s.queries,
+            "avg_queries": round(s.queries / s.requests, 2),
+            "max_queries": s.max_queries,
+            "commits": s.commits,
+            "db_time_ms": round(s.db_time * 1000, 1),
+            "avg_db_time_ms": round(s.db_time * 1000 / s.requests, 2),
+            "n_plus_one": s.n_plus_one,
+        }
+        for route, s in _routes.items()
+    }
@@ -6,7 +6,11 @@ from openai import OpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Powiat, PowiatdleDay, User
-from qdrant.utils import get_fragments_matching_question
+from qdrant.utils import (
+    CONTEXT_SEPARATOR,
+    fragment_refs,
+    get_fragments_matching_question,
+)
 import qdrant
 from schemas.powiatdle import PowiatQuestionCreate, PowiatQuestionEnhanced
 from db.repositories.powiatdle import PowiatRepository
@@ -102,7 +106,7 @@ async def ask_question(
     fragments, question_vector = await get_fragments_matching_question(
         question.question, "powiat_id", day_powiat.powiat_id, "powiaty", session, limit=qdrant.POWIATDLE_CONTEXT_LIMIT
     )
-    context = "\n[ ... ]\n".join(fragment.text for fragment in fragments)
+    context = CONTEXT_SEPARATOR.join(fragment.text for fragment in fragments)
     powiat: Powiat = await PowiatRepository(session).get(day_powiat.powiat_id)
 
     system_prompt = f"""
@@ -153,6 +157,7 @@ Jesteś 'Mistrzem Gry' w Powiatdle. Twoim zadaniem jest odpowiedzieć na pytanie
         print(answer)
         raise
 
+    refs = fragment_refs(fragments)
     question_create = PowiatQuestionCreate(
         user_id=user.id if user else None,
         day_id=day_powiat.id,
@@ -161,7 +166,8 @@ Jesteś 'Mistrzem Gry' w Powiatdle. Twoim zadaniem jest odpowiedzieć na pytanie
         question=question.question,
         answer=answer_dict.get("answer"),
         explanation=answer_dict.get("explanation") or "Brak wyjaśnienia.",
-        context=context,
+        context=context if refs is None else None,
+        context_fragments=refs,
     )
 
     return question_create, question_vector
@@ -23,9 +23,27 @@ from qdrant_client.models import PointStruct
 from .vectorize import get_embedding, get_bulk_embedding
 
 
+CONTEXT_SEPARATOR = "\n[ ... ]\n"
+
+
 @dataclass
 class Fragment:
     text: str
+    # Point id, which is the id of the fragment row in Postgres
+    id: int | None = None
+    # Similarity to the question; neighbours fetched for continuity have none
+    score: float | None = None
+
+
+def fragment_refs(fragments: List[Fragment]) -> list[dict] | None:
+    """What a question stores instead of the context text.
+
+    None when a fragment cannot be traced back to its row, e.g. in collections
+    synced with random UUIDs, in which case the text has to be kept.
+    """
+    if any(fragment.id is None for fragment in fragments):
+        return None
+    return [{"id": fragment.id, "score": fragment.score} for fragment in fragments]
 
 
 def split_document(content: str) -> List[Document]:
@@ -130,12 +148,19 @@ async def get_fragments_matching_question(
         # but we keep them as is or sort by string value
         valid_points.sort(key=lambda x: str(x.id))
 
+    scores = {point.id: point.score for point in points}
     fragments = []
     for point in valid_points:
         if point.payload:
             text = point.payload.get("fragment_text")
             if text:
-                fragments.append(Fragment(text=text))
+                fragments.append(
+                    Fragment(
+                        text=text,
+                        id=point.id if isinstance(point.id, int) else None,
+                        score=scores.get(point.id),
+                    )
+                )
 
     return fragments, query_vector
 
@@ -5,6 +5,7 @@ from pydantic import BaseModel, ConfigDict, Field
 
 from schemas.user import ProfileDisplay, UserDisplay
 from schemas.country import CountryCount, CountryDisplay, DayCountryDisplay
+from schemas.fragment import ContextFragment
 
 
 class QuestionBase(BaseModel):
@@ -28,6 +29,7 @@ class QuestionCreate(QuestionEnhanced):
     user_id: int | None
     day_id: int
     context: str | None
+    context_fragments: List[ContextFragment] | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -164,6 +166,11 @@ class LeaderboardEntry(BaseModel):
     wins: int
 
 
+class LeaderboardRank(BaseModel):
+    rank: int | None  # None until the player finishes a game
+    entry: LeaderboardEntry | None
+
+
 class UserState(BaseModel):
     remaining_questions: int
     remaining_guesses: int
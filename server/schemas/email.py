@@ -3,6 +3,7 @@ from pydantic import BaseModel, EmailStr, ConfigDict
 
 
 class EmailCreate(BaseModel):
+    sender: EmailStr
     recipient: EmailStr  # Ensures valid email address
     subject: str
     body: str
@@ -12,5 +13,8 @@ class EmailCreate(BaseModel):
         
 class EmailModel(EmailCreate):
     id: int
-    status: str  # E.g., 'sent', 'failed'
+    status: str  # queued, sent or failed
+    attempts: int
+    last_error: str | None
+    sent_at: datetime.datetime | None
     created_at: datetime.datetime
\ No newline at end of file
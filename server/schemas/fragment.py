@@ -0,0 +1,14 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ContextFragment(BaseModel):
+    id: int
+    score: Optional[float] = None
+
+
+class QuestionContext(BaseModel):
+    question_id: int
+    context: Optional[str]
+    fragments: List[ContextFragment]
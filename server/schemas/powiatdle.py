@@ -2,6 +2,7 @@ from datetime import date, datetime
 from typing import List, Optional, Union
 from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from schemas.user import UserDisplay
+from schemas.fragment import ContextFragment
 
 
 class PowiatDisplay(BaseModel):
@@ -60,6 +61,7 @@ class PowiatQuestionCreate(BaseModel):
     answer: Optional[bool]
     explanation: str
     context: Optional[str]
+    context_fragments: Optional[List[ContextFragment]] = None
     intent: Optional[str] = None
     required_info: Optional[str] = None
 
@@ -3,6 +3,7 @@ from typing import List
 from schemas.user import ProfileDisplay
 
 class GameHistoryEntry(BaseModel):
+    day_id: int
     date: str
     won: bool
     points: int
@@ -0,0 +1,45 @@
+from typing import Optional, Union
+
+from pydantic import BaseModel
+
+from schemas.countrydle import (
+    CountrydleEndStateResponse,
+    CountrydleStateResponse,
+    CountrydleSyncSchema,
+)
+from schemas.powiatdle import (
+    PowiatdleEndStateResponse,
+    PowiatdleStateResponse,
+    PowiatdleSyncSchema,
+)
+from schemas.us_statedle import (
+    USStatedleEndStateResponse,
+    USStatedleStateResponse,
+    USStatedleSyncSchema,
+)
+from schemas.wojewodztwodle import (
+    WojewodztwodleEndStateResponse,
+    WojewodztwodleStateResponse,
+    WojewodztwodleSyncSchema,
+)
+
+
+class GuestProgressSync(BaseModel):
+    """What a guest played, for each game they played."""
+
+    countrydle: Optional[CountrydleSyncSchema] = None
+    powiatdle: Optional[PowiatdleSyncSchema] = None
+    us_statedle: Optional[USStatedleSyncSchema] = None
+    wojewodztwodle: Optional[WojewodztwodleSyncSchema] = None
+
+
+class GuestProgressSyncResponse(BaseModel):
+    """Today's state of each game that was synced, and why the others were not."""
+
+    countrydle: Optional[Union[CountrydleStateResponse, CountrydleEndStateResponse]] = None
+    powiatdle: Optional[Union[PowiatdleStateResponse, PowiatdleEndStateResponse]] = None
+    us_statedle: Optional[Union[USStatedleStateResponse, USStatedleEndStateResponse]] = None
+    wojewodztwodle: Optional[
+        Union[WojewodztwodleStateResponse, WojewodztwodleEndStateResponse]
+    ] = None
+    errors: dict[str, str] = {}
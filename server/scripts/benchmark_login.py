@@ -0,0 +1,83 @@
+"""Measures how a burst of logins delays unrelated requests.
+
+Usage:
+    python scripts/benchmark_login.py [logins]
+
+Checks `logins` passwords at once, first inline on the event loop as the
+handlers used to, then through db.passwords, while a client keeps calling
+/version. Only the password check of a login is run, so no database is needed.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from db import passwords
+
+PASSWORD = "Password123!"
+
+
+async def inline(hashed: str) -> None:
+    passwords.pwd_context.verify(PASSWORD, hashed)
+
+
+async def offloaded(hashed: str) -> None:
+    await passwords.verify(PASSWORD, hashed)
+
+
+async def burst(client: AsyncClient, check, hashed: str, logins: int) -> list[float]:
+    done = asyncio.Event()
+    latencies = []
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/version")
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    async def login():
+        await asyncio.sleep(0)  # Let the probe start first
+        await check(hashed)
+
+    probing = asyncio.create_task(probe())
+    await asyncio.gather(*(login() for _ in range(logins)))
+    done.set()
+    await probing
+    return latencies
+
+
+def report(name: str, latencies: list[float], elapsed: float) -> None:
+    ms = sorted(latency * 1000 for latency in latencies)
+    p95 = ms[int(len(ms) * 0.95)] if len(ms) > 1 else ms[-1]
+    print(
+        f"{name:>10}: burst {elapsed:.2f}s, {len(ms)} probe requests, "
+        f"p50 {statistics.median(ms):.1f} ms, p95 {p95:.1f} ms, max {ms[-1]:.1f} ms"
+    )
+
+
+async def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    hashed = passwords.pwd_context.hash(PASSWORD)
+    print(
+        f"{logins} logins, bcrypt cost {passwords.BCRYPT_ROUNDS}, "
+        f"{passwords.PASSWORD_HASH_WORKERS} hashing thread(s)"
+    )
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        await client.get("/version")
+        for name, check in (("inline", inline), ("offloaded", offloaded)):
+            started = time.perf_counter()
+            latencies = await burst(client, check, hashed, logins)
+            report(name, latencies, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
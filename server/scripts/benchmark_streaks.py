@@ -0,0 +1,144 @@
+"""Times the nightly streak reset against a large synthetic player base.
+
+Usage:
+    BENCHMARK_DATABASE_URL=postgresql+asyncpg://... python scripts/benchmark_streaks.py [users]
+
+The database is wiped and recreated, so never point this at real data.
+Every reset runs in a transaction that is rolled back, so all runs see the
+same rows.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.base import Base
+from db.models import *  # noqa: F403
+from db.models.user import UserPoints
+from db.repositories.leaderboard import LeaderboardRepository
+from db.repositories.user import UserRepository
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+YESTERDAY = date.today() - timedelta(days=1)
+RUNS = 5
+# The old job issued these two lookups for every verified user
+LEGACY_SAMPLE = 2000
+
+
+async def seed(engine, users: int):
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, verified) "
+                "SELECT g, 'player' || g, 'player' || g || '@example.com', true "
+                "FROM generate_series(1, :users) g"
+            ),
+            {"users": users},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO user_points (user_id, points, streak, longest_streak) "
+                "SELECT g, g % 5000, CASE WHEN g % 4 < 2 THEN g % 7 ELSE 0 END, g % 11 "
+                "FROM generate_series(1, :users) g"
+            ),
+            {"users": users},
+        )
+        for game in GAMES:
+            await conn.execute(
+                text(f"INSERT INTO {game}_days (id, date) VALUES (1, :day)"),
+                {"day": YESTERDAY},
+            )
+            # Every other player has a game yesterday, two thirds of them finished
+            await conn.execute(
+                text(
+                    f"INSERT INTO {game}_states (user_id, day_id, remaining_questions, "
+                    "remaining_guesses, questions_asked, guesses_made, is_game_over, "
+                    "won, points) SELECT g, 1, 0, 0, 0, 0, g % 3 > 0, g % 3 = 1, 0 "
+                    "FROM generate_series(1, :users, 2) g"
+                ),
+                {"users": users},
+            )
+            await conn.execute(
+                text(
+                    "INSERT INTO user_game_scores (game, user_id, points, wins, "
+                    "games_played, streak, longest_streak, last_played) "
+                    "SELECT :game, g, g % 5000, g % 50, g % 80, "
+                    "CASE WHEN g % 4 < 2 THEN g % 7 ELSE 0 END, g % 11, "
+                    "CAST(:day AS date) - (g % 4) FROM generate_series(1, :users) g"
+                ),
+                {"game": game, "users": users, "day": YESTERDAY},
+            )
+        await conn.execute(text("ANALYZE"))
+
+
+async def legacy_per_user(engine) -> float:
+    async with AsyncSession(engine) as session:
+        start = time.perf_counter()
+        for user_id in range(1, LEGACY_SAMPLE + 1):
+            await session.get(UserPoints, user_id)
+            await session.execute(
+                text(
+                    "SELECT * FROM countrydle_states "
+                    "WHERE user_id = :user_id AND day_id = 1"
+                ),
+                {"user_id": user_id},
+            )
+        elapsed = time.perf_counter() - start
+        await session.rollback()
+    return elapsed
+
+
+async def reset(engine) -> float:
+    async with AsyncSession(engine) as session:
+        start = time.perf_counter()
+        await UserRepository(session).reset_stale_streaks(YESTERDAY)
+        await LeaderboardRepository(session).reset_stale_streaks(YESTERDAY)
+        await session.flush()
+        elapsed = time.perf_counter() - start
+        await session.rollback()
+    return elapsed
+
+
+async def main(users: int):
+    url = os.getenv("BENCHMARK_DATABASE_URL")
+    if not url:
+        sys.exit("Set BENCHMARK_DATABASE_URL to a scratch database.")
+
+    engine = create_async_engine(url)
+    print(f"Seeding {users} users...")
+    await seed(engine, users)
+
+    async with AsyncSession(engine) as session:
+        kept = await session.scalar(
+            select(func.count()).select_from(UserPoints).where(UserPoints.streak > 0)
+        )
+    print(f"{kept} countrydle streaks, {len(GAMES) * users} game scores")
+
+    legacy = await legacy_per_user(engine)
+    print(
+        f"Per-user lookups: {legacy * 1000:.0f} ms for {LEGACY_SAMPLE} users, "
+        f"~{legacy / LEGACY_SAMPLE * users:.1f} s for {users} (before any writes)"
+    )
+
+    timings = [await reset(engine) for _ in range(RUNS)]
+    print(
+        f"Set-based reset: best {min(timings) * 1000:.0f} ms, "
+        f"worst {max(timings) * 1000:.0f} ms over {RUNS} runs"
+    )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,31 @@
+"""Sends queued emails outside the web server.
+
+Usage:
+    EMAIL_OUTBOX_WORKER=false uvicorn app:app ...   # web workers stop sending
+    python scripts/email_worker.py
+
+Any number of these can run next to each other.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.notify import listener
+from utils import email
+
+
+async def main():
+    await listener.start()
+    try:
+        await email.run_worker()
+    finally:
+        await listener.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
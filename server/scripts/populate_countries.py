@@ -20,6 +20,7 @@ from db import AsyncSessionLocal
 import qdrant.utils as qutils
 from db.models import Country, CountryFragment
 from db.repositories.country import CountryRepository
+from utils import catalogs
 
 
 async def populate_countries(session: AsyncSession):
@@ -105,6 +106,10 @@ async def populate_countries(session: AsyncSession):
 
         await session.commit()
 
+    # Running workers serve the catalog from memory until told it changed
+    await catalogs.publish(session, "countrydle")
+    await session.commit()
+
     print("Countries population finished.")
 
 
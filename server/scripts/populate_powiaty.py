@@ -21,6 +21,7 @@ import qdrant.utils as qutils
 from db.models.powiat import Powiat
 from db.models.fragment import PowiatFragment
 from db.repositories.powiatdle import PowiatRepository
+from utils import catalogs
 
 
 async def populate_powiaty(session: AsyncSession):
@@ -94,6 +95,10 @@ async def populate_powiaty(session: AsyncSession):
 
         await session.commit()
 
+    # Running workers serve the catalog from memory until told it changed
+    await catalogs.publish(session, "powiatdle")
+    await session.commit()
+
     print("Powiaty population finished.")
 
 
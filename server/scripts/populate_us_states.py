@@ -24,6 +24,7 @@ import qdrant.utils as qutils
 from db.models.us_state import USState
 from db.models.fragment import USStateFragment
 from db.repositories.us_state import USStateRepository
+from utils import catalogs
 
 
 async def populate_us_states(session: AsyncSession):
@@ -120,6 +121,10 @@ async def populate_us_states(session: AsyncSession):
                 max_retries=3
             )
 
+    # Running workers serve the catalog from memory until told it changed
+    await catalogs.publish(session, "us_statedle")
+    await session.commit()
+
     print("US States population finished.")
 
 
@@ -21,6 +21,7 @@ import qdrant.utils as qutils
 from db.models.wojewodztwo import Wojewodztwo
 from db.models.fragment import WojewodztwoFragment
 from db.repositories.wojewodztwo import WojewodztwoRepository
+from utils import catalogs
 
 
 async def populate_wojewodztwa(session: AsyncSession):
@@ -94,6 +95,10 @@ async def populate_wojewodztwa(session: AsyncSession):
 
         await session.commit()
 
+    # Running workers serve the catalog from memory until told it changed
+    await catalogs.publish(session, "wojewodztwodle")
+    await session.commit()
+
     print("Wojewodztwa population finished.")
 
 
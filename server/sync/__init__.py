@@ -0,0 +1,157 @@
+"""One request that moves a guest's progress in every game onto their account.
+
+After signing in the client used to call each game's /sync in turn, four round
+trips that each looked the state up, updated the questions and inserted the
+guesses one by one. Here every game takes one state upsert, one UPDATE for its
+questions and one INSERT for its guesses, and everything is committed at once.
+Each game is validated on its own, so a game the server rejects is reported in
+`errors` while the others are still synced.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import countrydle
+import powiatdle
+import us_statedle
+import wojewodztwodle
+from db import get_db
+from db.models import User
+from db.repositories.countrydle import CountrydleRepository, CountrydleStateRepository
+from db.repositories.leaderboard import LeaderboardRepository
+from db.repositories.powiatdle import PowiatdleDayRepository, PowiatdleStateRepository
+from db.repositories.us_statedle import USStatedleDayRepository, USStatedleStateRepository
+from db.repositories.user import UserRepository
+from db.repositories.wojewodztwodle import (
+    WojewodztwodleDayRepository,
+    WojewodztwodleStateRepository,
+)
+from game_logic import GameRules
+from schemas.sync import GuestProgressSync, GuestProgressSyncResponse
+from users.utils import get_current_user
+from utils import daily_targets
+
+router = APIRouter()
+
+# The one reason given for any rejected progress
+INVALID_PROGRESS = "Invalid guest progress."
+
+
+@dataclass(frozen=True)
+class SyncedGame:
+    rules: GameRules
+    states: type
+    day: Callable[[AsyncSession, date], Awaitable[Any]]
+    # The game's GET /state handler, which gives the response for the game
+    state_response: Callable[[User, AsyncSession], Awaitable[Any]]
+
+
+SYNCED_GAMES: dict[str, SyncedGame] = {
+    "countrydle": SyncedGame(
+        rules=countrydle.game_rules,
+        states=CountrydleStateRepository,
+        day=lambda s, d: CountrydleRepository(s).get_day_country_by_date(d),
+        state_response=countrydle.get_state,
+    ),
+    "powiatdle": SyncedGame(
+        rules=powiatdle.game_rules,
+        states=PowiatdleStateRepository,
+        day=lambda s, d: PowiatdleDayRepository(s).get_day_powiat_by_date(d),
+        state_response=powiatdle.get_state,
+    ),
+    "us_statedle": SyncedGame(
+        rules=us_statedle.game_rules,
+        states=USStatedleStateRepository,
+        day=lambda s, d: USStatedleDayRepository(s).get_day_us_state_by_date(d),
+        state_response=us_statedle.get_state,
+    ),
+    "wojewodztwodle": SyncedGame(
+        rules=wojewodztwodle.game_rules,
+        states=WojewodztwodleStateRepository,
+        day=lambda s, d: WojewodztwodleDayRepository(s).get_day_wojewodztwo_by_date(d),
+        state_response=wojewodztwodle.get_state,
+    ),
+}
+
+
+async def sync_game(game: str, progress, user: User, session: AsyncSession) -> None:
+    """Adds the guest's progress in `game` to the session.
+
+    Raises HTTPException before writing anything if the progress is rejected.
+    The error never depends on the guesses being right, so it cannot be used
+    to find the day's target.
+    """
+    spec = SYNCED_GAMES[game]
+    config = spec.rules.config
+    try:
+        game_date = datetime.strptime(progress.date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=INVALID_PROGRESS)
+    # A guest may sign in after midnight, but never plays a day ahead or days back
+    today = daily_targets.game_today()
+    if game_date not in (today, today - timedelta(days=1)):
+        raise HTTPException(status_code=422, detail=INVALID_PROGRESS)
+
+    day = await spec.day(session, game_date)
+    if not day:
+        raise HTTPException(status_code=404, detail="Game for this date not found.")
+
+    repository = spec.states(session)
+    if await repository.has_progress(user, day):
+        return  # Progress already on the server wins
+
+    question_ids = list(dict.fromkeys(progress.questions))
+    if len(question_ids) > config.max_questions or len(progress.guesses) > config.max_guesses:
+        raise HTTPException(status_code=422, detail=INVALID_PROGRESS)
+
+    target_id = f"{daily_targets.GAMES[game].target}_id"
+    guesses = []
+    for guess in progress.guesses:
+        guessed = getattr(guess, target_id)
+        correct = guessed is not None and guessed == getattr(day, target_id)
+        guesses.append({"guess": guess.guess, target_id: guessed, "answer": correct})
+        if correct:
+            break  # The game ended there, whatever the client sent after it
+
+    state = await repository.sync_guest_progress(
+        user, day, spec.rules, question_ids, guesses
+    )
+    if state is None:
+        return  # Progress reached the server meanwhile
+
+    if state.won:
+        state.points = await repository.calc_points(state)
+    if state.is_game_over:
+        if game == "countrydle":
+            await UserRepository(session).update_points(user.id, state)
+        await LeaderboardRepository(session).record_game(game, state)
+
+
+@router.post("/sync", response_model=GuestProgressSyncResponse)
+async def sync_guest_progress(
+    progress: GuestProgressSync,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    games, errors = [], {}
+    for game in SYNCED_GAMES:
+        if getattr(progress, game) is None:
+            continue
+        try:
+            await sync_game(game, getattr(progress, game), user, session)
+        except HTTPException as e:
+            # The other games still sync; the client learns which one to drop
+            errors[game] = e.detail
+            continue
+        games.append(game)
+
+    # Every write above is in the session before any of the handlers can commit
+    response = {
+        game: await SYNCED_GAMES[game].state_response(user, session) for game in games
+    }
+    await session.commit()
+    return {**response, "errors": errors}
@@ -1,21 +1,157 @@
 import pytest
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from app import app
+from db import get_db, telemetry
+from db.base import Base
+from utils import auth_cache, catalogs, daily_targets, history, profile_stats, rate_limit, state_cache
 import os
 
 # Use the existing database for tests (or a separate test DB if configured)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Disposable database for tests that need real Postgres, e.g. the one from
+# docker-compose.test-db-only.yml. Its schema is dropped and recreated.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# Second disposable database standing in for a read replica. Any Postgres
+# works; it only needs the same schema, which is recreated like the one above.
+TEST_READ_DATABASE_URL = os.getenv("TEST_READ_DATABASE_URL")
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(queries=None, commits=None): fail the test if any request "
+        "it makes runs more statements or commits than that",
+    )
+    config.addinivalue_line(
+        "markers",
+        "truncate(*tables): the tables pg_app empties after the test, users by default",
+    )
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+
+    budget = dict(zip(("queries", "commits"), marker.args), **marker.kwargs)
+    with telemetry.watch() as finished:
+        result = yield
+
+    for route, db in finished:
+        for metric, limit in budget.items():
+            if limit is not None and getattr(db, metric) > limit:
+                slowest = "\n".join(statement for _, statement in db.slowest)
+                pytest.fail(
+                    f"{route} ran {getattr(db, metric)} {metric}, over its budget of "
+                    f"{limit}. Slowest statements:\n{slowest}"
+                )
+    return result
 
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
 
+@pytest.fixture(scope="session")
+async def pg_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+@pytest.fixture(scope="session")
+async def pg_read_engine():
+    if not TEST_READ_DATABASE_URL:
+        pytest.skip("TEST_READ_DATABASE_URL is not set")
+
+    engine = create_async_engine(TEST_READ_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+@pytest.fixture
+async def pg_app(pg_engine, request):
+    """Serves the app from TEST_DATABASE_URL, then empties the tables the test's
+    `truncate` marker names."""
+    async def override_get_db():
+        async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield
+    app.dependency_overrides = {}
+
+    marker = request.node.get_closest_marker("truncate")
+    tables = ", ".join(marker.args) if marker else "users"
+    async with pg_engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+@pytest.fixture(autouse=True)
+def clear_daily_targets():
+    # Tests patch the repositories per test, so never serve a target cached by another one
+    daily_targets.invalidate()
+    yield
+    daily_targets.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_history():
+    history.invalidate()
+    yield
+    history.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_catalogs():
+    catalogs.invalidate()
+    yield
+    catalogs.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_profile_stats():
+    profile_stats.invalidate()
+    yield
+    profile_stats.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_auth_cache():
+    auth_cache.invalidate()
+    yield
+    auth_cache.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_state_cache():
+    # Identities restart with every truncated table, so ids come back for other games
+    state_cache.invalidate()
+    yield
+    state_cache.invalidate()
+
+@pytest.fixture(autouse=True)
+def clear_rate_limits():
+    # Every test client comes from the same address
+    rate_limit.invalidate()
+    yield
+    rate_limit.invalidate()
+
 @pytest.fixture(scope="session")
 async def async_client():
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
 
+@pytest.fixture
+async def client():
+    # Its own cookie jar, so tokens set by a login never leak into other tests
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
 @pytest.fixture(scope="session")
 async def token(async_client):
     # Register a user for testing
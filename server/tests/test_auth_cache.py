@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import telemetry
+from db.models import User
+from db.notify import listener
+from db.repositories.user import USER_CHANNEL, UserRepository
+from users.utils import create_access_token, user_claims
+from utils import auth_cache
+
+
+@pytest.fixture
+async def player(pg_engine, pg_app):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        player = User(
+            username="player",
+            email="player@example.com",
+            hashed_password=User.hash_password("Password123!"),
+            verified=True,
+        )
+        session.add(player)
+        await session.commit()
+
+    return player
+
+
+def signed_in(token: str) -> dict:
+    return {"Cookie": f"access_token={token}"}
+
+
+@pytest.mark.anyio
+async def test_fresh_token_needs_no_lookup_or_signing(client, player):
+    token = create_access_token(data=user_claims(player))
+
+    with telemetry.watch() as finished:
+        first = await client.get("/users/me", headers=signed_in(token))
+        second = await client.get("/users/me", headers=signed_in(token))
+
+    assert first.json()["username"] == second.json()["username"] == "player"
+    assert [db.queries for _, db in finished] == [1, 0]
+    assert "set-cookie" not in first.headers and "set-cookie" not in second.headers
+
+
+@pytest.mark.anyio
+async def test_token_without_user_id_is_upgraded(client, player):
+    token = create_access_token(data={"sub": player.email})
+
+    response = await client.get("/users/me", headers=signed_in(token))
+
+    assert response.status_code == 200
+    assert response.cookies["access_token"] != token
+
+
+@pytest.mark.anyio
+async def test_password_change_voids_older_tokens(client, player):
+    token = create_access_token(data=user_claims(player))
+    await client.get("/users/me", headers=signed_in(token))
+
+    changed = await client.post(
+        "/users/change/password",
+        json={"password": "NewPassword1!"},
+        headers=signed_in(token),
+    )
+    old = await client.get("/users/me", headers=signed_in(token))
+    new = await client.get(
+        "/users/me", headers=signed_in(changed.cookies["access_token"])
+    )
+
+    assert changed.status_code == 200
+    assert old.status_code == 401
+    assert new.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_account_read_before_a_change_is_not_cached():
+    usernames = ["old", "new"]
+
+    async def read(user_id):
+        username = usernames.pop(0)
+        if username == "old":
+            # The account is renamed while this worker is still reading it
+            listener._dispatch(None, 0, USER_CHANNEL, str(user_id))
+        return SimpleNamespace(
+            id=user_id, username=username, email="player@example.com",
+            verified=True, hashed_password=None,
+        )
+
+    with patch.object(UserRepository, "get", side_effect=read):
+        assert (await auth_cache.get_user(7, None)).username == "old"
+        # What the first request read was never cached
+        assert (await auth_cache.get_user(7, None)).username == "new"
+        assert (await auth_cache.get_user(7, None)).username == "new"
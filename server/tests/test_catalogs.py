@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from utils import catalogs
+
+
+def make_powiaty(*names):
+    return [SimpleNamespace(id=n, nazwa=name) for n, name in enumerate(names, start=1)]
+
+
+@pytest.mark.anyio
+async def test_catalog_served_from_memory(async_client):
+    with patch(
+        "db.repositories.powiatdle.PowiatRepository.get_all",
+        new_callable=AsyncMock,
+        return_value=make_powiaty("krakowski", "tatrzański"),
+    ) as mock_all:
+        first = await async_client.get("/powiatdle/powiaty")
+        second = await async_client.get("/powiatdle/powiaty")
+        unchanged = await async_client.get(
+            "/powiatdle/powiaty", headers={"If-None-Match": first.headers["etag"]}
+        )
+
+    assert mock_all.await_count == 1
+    assert first.json() == [{"id": 1, "nazwa": "krakowski"}, {"id": 2, "nazwa": "tatrzański"}]
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert first.headers["cache-control"] == f"public, max-age={catalogs.CATALOG_MAX_AGE}"
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+
+@pytest.mark.anyio
+async def test_population_invalidates_catalog(async_client):
+    with patch(
+        "db.repositories.us_state.USStateRepository.get_all",
+        new_callable=AsyncMock,
+        return_value=[SimpleNamespace(id=1, name="Texas", code="TX")],
+    ) as mock_all:
+        first = await async_client.get("/us_statedle/states")
+
+        # What a population script's NOTIFY does in every worker
+        mock_all.return_value.append(SimpleNamespace(id=2, name="Ohio", code="OH"))
+        catalogs._on_notify("us_statedle")
+        second = await async_client.get(
+            "/us_statedle/states", headers={"If-None-Match": first.headers["etag"]}
+        )
+
+    assert mock_all.await_count == 2
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+    assert [s["code"] for s in second.json()] == ["TX", "OH"]
+
+
+@pytest.mark.anyio
+async def test_notify_only_drops_its_catalog(async_client):
+    countries = [SimpleNamespace(id=1, name="Chile", official_name="Republic of Chile")]
+    with (
+        patch(
+            "db.repositories.country.CountryRepository.get_all_countries",
+            new_callable=AsyncMock,
+            return_value=countries,
+        ) as mock_countries,
+        patch(
+            "db.repositories.wojewodztwo.WojewodztwoRepository.get_all",
+            new_callable=AsyncMock,
+            return_value=[SimpleNamespace(id=1, nazwa="małopolskie")],
+        ) as mock_wojewodztwa,
+    ):
+        await async_client.get("/countrydle/countries")
+        await async_client.get("/wojewodztwodle/wojewodztwa")
+        catalogs._on_notify("wojewodztwodle")
+        await async_client.get("/countrydle/countries")
+        await async_client.get("/wojewodztwodle/wojewodztwa")
+        # A listener reconnect drops them all
+        catalogs._on_notify("")
+        await async_client.get("/countrydle/countries")
+
+    assert mock_countries.await_count == 2
+    assert mock_wojewodztwa.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_notify_during_refresh_is_not_lost(async_client):
+    rows = [SimpleNamespace(id=1, nazwa="małopolskie")]
+
+    async def load():
+        entries = list(rows)
+        # Population finishes while this worker is still reading
+        rows.append(SimpleNamespace(id=2, nazwa="śląskie"))
+        catalogs._on_notify("wojewodztwodle")
+        return entries
+
+    with patch(
+        "db.repositories.wojewodztwo.WojewodztwoRepository.get_all",
+        new_callable=AsyncMock,
+        side_effect=load,
+    ):
+        first = await async_client.get("/wojewodztwodle/wojewodztwa")
+        second = await async_client.get("/wojewodztwodle/wojewodztwa")
+
+    assert len(first.json()) == 1
+    # What the first request read was never cached
+    assert len(second.json()) == 2
@@ -0,0 +1,170 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from utils import daily_targets
+from utils.cache import TTLCache
+
+
+def make_day(day_date):
+    day = MagicMock()
+    day.id = 1
+    day.date = day_date
+    return day
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, expires_at=0)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "invalidations": 0}
+
+
+def test_ttl_cache_maxsize():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+
+
+def test_next_rollover_is_next_midnight():
+    rollover = daily_targets.next_rollover()
+    assert rollover.date() == daily_targets.game_today() + timedelta(days=1)
+    assert (rollover.hour, rollover.minute, rollover.second) == (0, 0, 0)
+
+
+def test_jobs_run_at_game_midnight(monkeypatch):
+    import utils
+
+    monkeypatch.setattr(daily_targets, "GAME_TIMEZONE", "Pacific/Kiritimati")
+
+    trigger = utils.at(0, 0)
+    now = datetime.now(trigger.timezone)
+    assert trigger.get_next_fire_time(None, now) == daily_targets.next_rollover()
+
+
+@pytest.mark.anyio
+async def test_today_target_is_cached():
+    session = MagicMock()
+    day = make_day(daily_targets.game_today())
+
+    with patch(
+        "db.repositories.countrydle.CountrydleRepository.get_today_country",
+        new_callable=AsyncMock,
+        return_value=day,
+    ) as mock_get_today:
+        assert await daily_targets.get_today("countrydle", session) is day
+        assert await daily_targets.get_today("countrydle", session) is day
+
+    assert mock_get_today.await_count == 1
+    session.expunge.assert_any_call(day)
+
+
+@pytest.mark.anyio
+async def test_stale_target_is_not_cached():
+    session = MagicMock()
+    day = make_day(date(2023, 1, 1))
+
+    with patch(
+        "db.repositories.powiatdle.PowiatdleDayRepository.get_today_powiat",
+        new_callable=AsyncMock,
+        return_value=day,
+    ) as mock_get_today:
+        await daily_targets.get_today("powiatdle", session)
+        await daily_targets.get_today("powiatdle", session)
+
+    assert mock_get_today.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_notification_invalidates_game():
+    session = MagicMock()
+    day = make_day(daily_targets.game_today())
+
+    with patch(
+        "db.repositories.countrydle.CountrydleRepository.get_today_country",
+        new_callable=AsyncMock,
+        return_value=day,
+    ) as mock_get_today:
+        await daily_targets.get_today("countrydle", session)
+        daily_targets._on_notify("countrydle")
+        await daily_targets.get_today("countrydle", session)
+
+    assert mock_get_today.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_missing_day_is_not_generated_on_request():
+    session = MagicMock()
+
+    with (
+        patch(
+            "db.repositories.us_statedle.USStatedleDayRepository.get_today_us_state",
+            new_callable=AsyncMock,
+            return_value=None,
+        ),
+        patch(
+            "db.repositories.us_statedle.USStatedleDayRepository.generate_new_day_us_state",
+            new_callable=AsyncMock,
+        ) as mock_generate,
+    ):
+        with pytest.raises(HTTPException) as exc:
+            await daily_targets.get_today("us_statedle", session)
+
+    assert exc.value.status_code == 503
+    assert not mock_generate.called
+
+
+@pytest.mark.anyio
+async def test_generate_days_ahead():
+    session = MagicMock()
+    session.execute = AsyncMock()
+    session.commit = AsyncMock()
+    today = daily_targets.game_today()
+
+    with (
+        patch(
+            "db.repositories.wojewodztwodle.WojewodztwodleDayRepository.generate_new_day_wojewodztwo",
+            new_callable=AsyncMock,
+            side_effect=lambda day_date: day_date != today,
+        ) as mock_generate,
+        patch("utils.daily_targets.notify", new_callable=AsyncMock) as mock_notify,
+    ):
+        created = await daily_targets.generate_days("wojewodztwodle", session, 2)
+
+    assert [call.args[0] for call in mock_generate.await_args_list] == [
+        today,
+        today + timedelta(days=1),
+        today + timedelta(days=2),
+    ]
+    assert created == [today + timedelta(days=1), today + timedelta(days=2)]
+    assert not mock_notify.called
+    session.commit.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_profile_hides_the_game_days_target():
+    from db.repositories.countrydle import CountrydleStateRepository
+
+    today = daily_targets.game_today()
+    states = [
+        MagicMock(day=MagicMock(date=day_date, country="target"))
+        for day_date in (today, today - timedelta(days=1))
+    ]
+    session = MagicMock()
+    session.execute = AsyncMock(return_value=MagicMock())
+    session.execute.return_value.scalars.return_value.all.return_value = states
+
+    await CountrydleStateRepository(session).get_player_countrydle_states(
+        MagicMock(id=1), hide_day=today
+    )
+
+    assert [state.day.country for state in states] == [None, "target"]
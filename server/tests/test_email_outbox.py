@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from email import message_from_bytes
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import OutboxEmail
+from utils import email
+from utils.email import Mailer, deliver_batch, queue_email
+
+PORT = 8025
+
+
+class Sink:
+    """Local SMTP server that keeps what it receives."""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+        self.replies = []  # Replies to DATA given before accepting anything
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append(message_from_bytes(envelope.content))
+        return "250 OK"
+
+
+@pytest.fixture
+def sink():
+    sink = Sink()
+    controller = Controller(sink, hostname="127.0.0.1", port=PORT)
+    controller.start()
+    yield sink
+    controller.stop()
+
+
+@pytest.fixture
+async def session(pg_engine):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        yield session
+
+    async with pg_engine.begin() as conn:
+        await conn.execute(text("TRUNCATE email_outbox RESTART IDENTITY"))
+
+
+def mailer() -> Mailer:
+    return Mailer(hostname="127.0.0.1", port=PORT, use_tls=False, username=None, password=None)
+
+
+async def queue(session, recipients):
+    for recipient in recipients:
+        await queue_email(
+            session,
+            recipient,
+            "Verify Your Email",
+            "verification_email.html",
+            {"username": "player", "verification_url": "https://example.com/verify"},
+            sender="noreply@example.com",
+        )
+    await session.commit()
+
+
+@pytest.mark.anyio
+async def test_batch_is_sent_over_one_connection(session, sink):
+    await queue(session, [f"player{n}@example.com" for n in range(3)])
+    sender = mailer()
+
+    assert await deliver_batch(session, sender) == 3
+    assert await deliver_batch(session, sender) == 0
+    await sender.close()
+
+    assert [message["To"] for message in sink.messages] == [
+        f"player{n}@example.com" for n in range(3)
+    ]
+    assert "https://example.com/verify" in sink.messages[0].get_payload(decode=True).decode()
+    assert (sender.connections, len(sink.peers)) == (1, 1)
+    statuses = await session.scalars(select(OutboxEmail.status))
+    assert set(statuses) == {"sent"}
+
+
+@pytest.mark.anyio
+async def test_failed_sends_are_retried_with_backoff(session, sink):
+    await queue(session, ["later@example.com", "never@example.com"])
+    sink.replies = ["451 Try again later", "550 No such user"]
+    sender = mailer()
+
+    await deliver_batch(session, sender)
+    later, never = await session.scalars(select(OutboxEmail).order_by(OutboxEmail.id))
+    assert (later.status, later.attempts) == ("queued", 1)
+    assert later.next_attempt_at > datetime.now() + timedelta(seconds=20)
+    assert "451" in later.last_error
+    assert (never.status, never.attempts) == ("failed", 1)
+
+    # Not due yet, so nothing is claimed until the backoff has passed
+    assert await deliver_batch(session, sender) == 0
+    await session.execute(
+        update(OutboxEmail).values(next_attempt_at=datetime.now() - timedelta(seconds=1))
+    )
+    await session.commit()
+    assert await deliver_batch(session, sender) == 1
+    await sender.close()
+
+    await session.refresh(later)
+    assert (later.status, later.attempts, later.last_error) == ("sent", 2, None)
+    assert [message["To"] for message in sink.messages] == ["later@example.com"]
+
+
+@pytest.mark.anyio
+async def test_unreachable_server_leaves_emails_queued(session, monkeypatch):
+    monkeypatch.setattr(email, "SMTP_TIMEOUT", 1)
+    await queue(session, ["player@example.com"])
+
+    await deliver_batch(session, mailer())
+
+    queued = await session.scalar(select(OutboxEmail))
+    await session.refresh(queued)
+    assert (queued.status, queued.attempts) == ("queued", 0)
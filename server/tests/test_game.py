@@ -24,17 +24,9 @@ async def test_get_game_state(auth_client):
             new_callable=AsyncMock,
         ) as mock_get_today,
         patch(
-            "db.repositories.countrydle.CountrydleStateRepository.get_state",
+            "db.repositories.countrydle.CountrydleStateRepository.load_state",
             new_callable=AsyncMock,
         ) as mock_get_state,
-        patch(
-            "db.repositories.guess.CountrydleGuessRepository.get_user_day_guesses",
-            new_callable=AsyncMock,
-        ) as mock_get_guesses,
-        patch(
-            "db.repositories.question.CountrydleQuestionsRepository.get_user_day_questions",
-            new_callable=AsyncMock,
-        ) as mock_get_questions,
     ):
         # Mock Day
         mock_day = MagicMock()
@@ -55,11 +47,10 @@ async def test_get_game_state(auth_client):
         mock_state.is_game_over = False
         mock_state.won = False
         mock_state.points = 0
+        mock_state.guesses = []
+        mock_state.questions = []
         mock_get_state.return_value = mock_state
 
-        mock_get_guesses.return_value = []
-        mock_get_questions.return_value = []
-
         response = await auth_client.get("/countrydle/state")
         assert response.status_code == 200
         data = response.json()
@@ -166,9 +157,9 @@ async def test_make_guess_correct_mocked(async_client):
                 new_callable=AsyncMock,
             ) as mock_get_today,
             patch(
-                "db.repositories.countrydle.CountrydleStateRepository.get_player_countrydle_state",
+                "db.repositories.countrydle.CountrydleStateRepository.record_guess",
                 new_callable=AsyncMock,
-            ) as mock_get_state,
+            ) as mock_record_guess,
             patch(
                 "db.repositories.country.CountryRepository.get", new_callable=AsyncMock
             ) as mock_get_country,
@@ -189,11 +180,11 @@ async def test_make_guess_correct_mocked(async_client):
 
             # Mock State
             mock_state = MagicMock()
-            mock_state.remaining_guesses = 3
+            mock_state.remaining_guesses = 2
             mock_state.remaining_questions = 10
-            mock_state.is_game_over = False
-            mock_state.won = False
-            mock_get_state.return_value = mock_state
+            mock_state.is_game_over = True
+            mock_state.won = True
+            mock_record_guess.return_value = mock_state
 
             # Mock Country
             mock_country = MagicMock()
@@ -227,6 +218,10 @@ async def test_make_guess_correct_mocked(async_client):
             assert guess_create_arg.country_id == 100
             assert guess_create_arg.answer is True
 
+            # The state moves on in one conditional update, told the guess is right
+            assert mock_record_guess.await_args.args[-1] is True
+            mock_guess_made.assert_awaited_once()
+
     finally:
         app.dependency_overrides = {}
 
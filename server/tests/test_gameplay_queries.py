@@ -0,0 +1,169 @@
+"""Counts the statements and commits behind the gameplay endpoints.
+
+Needs a real Postgres (TEST_DATABASE_URL). Today's day is served by the daily
+target cache once warm, so reading a game should cost a single query: the
+state joined with its guesses and questions. Writes go through one commit per
+request, with generated columns coming back via RETURNING.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from db.models import (
+    Country,
+    CountrydleDay,
+    CountrydleState,
+    CountrydleQuestion,
+    Powiat,
+    PowiatdleDay,
+    PowiatdleGuess,
+    PowiatdleQuestion,
+    PowiatdleState,
+    USState,
+    USStatedleDay,
+    USStatedleGuess,
+    USStatedleQuestion,
+    USStatedleState,
+    User,
+    Wojewodztwo,
+    WojewodztwodleDay,
+    WojewodztwodleGuess,
+    WojewodztwodleQuestion,
+    WojewodztwodleState,
+)
+from db.models.guess import CountrydleGuess
+from users.utils import get_current_or_guest_user
+from utils import daily_targets
+
+pytestmark = pytest.mark.truncate("users", "countries", "powiaty", "us_states", "wojewodztwa")
+
+GAMES = {
+    "countrydle": (
+        CountrydleDay, CountrydleState, CountrydleGuess, CountrydleQuestion,
+        Country, dict(name="Poland", official_name="Poland", wiki="", md_file="pl.md"),
+    ),
+    "powiatdle": (
+        PowiatdleDay, PowiatdleState, PowiatdleGuess, PowiatdleQuestion,
+        Powiat, dict(nazwa="krakowski"),
+    ),
+    "us_statedle": (
+        USStatedleDay, USStatedleState, USStatedleGuess, USStatedleQuestion,
+        USState, dict(name="Ohio"),
+    ),
+    "wojewodztwodle": (
+        WojewodztwodleDay, WojewodztwodleState, WojewodztwodleGuess,
+        WojewodztwodleQuestion, Wojewodztwo, dict(nazwa="malopolskie"),
+    ),
+}
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def commit(conn):
+        statements.append("COMMIT")
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "commit", commit)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(engine.sync_engine, "commit", commit)
+
+
+@pytest.fixture
+async def player(pg_engine, pg_app):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        user = User(username="player", email="player@example.com", verified=True)
+        session.add(user)
+        await session.flush()
+
+        for game, (day_model, state, guess, question, target, fields) in GAMES.items():
+            day = day_model(date=daily_targets.game_today())
+            setattr(day, daily_targets.GAMES[game].target, target(**fields))
+            session.add(day)
+            await session.flush()
+            session.add(
+                state(
+                    user_id=user.id, day_id=day.id, remaining_questions=8,
+                    remaining_guesses=1, questions_asked=2, guesses_made=2,
+                    is_game_over=True, won=False, points=0,
+                )
+            )
+            for n in range(2):
+                session.add(guess(user_id=user.id, day_id=day.id, guess=f"no {n}", answer=False))
+                session.add(
+                    question(
+                        user_id=user.id, day_id=day.id, original_question=f"q {n}",
+                        question=f"q {n}", valid=True, answer=False, explanation="No.",
+                    )
+                )
+        await session.commit()
+
+    app.dependency_overrides[get_current_or_guest_user] = lambda: user
+    return user
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(1)
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/countrydle/state",
+        "/countrydle/end/state",
+        "/powiatdle/state",
+        "/us_statedle/state",
+        "/wojewodztwodle/state",
+    ],
+)
+async def test_state_is_one_query(async_client, pg_engine, player, url):
+    async with AsyncSession(pg_engine) as session:
+        await daily_targets.get_today(url.split("/")[1], session)
+
+    response = await async_client.get(url)
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [g["guess"] for g in data["guesses"]] == ["no 0", "no 1"]
+    assert [q["original_question"] for q in data["questions"]] == ["q 0", "q 1"]
+    assert data["state"]["is_game_over"]
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(commits=1)
+@pytest.mark.parametrize(
+    "game, guess",
+    [
+        ("countrydle", {"guess": "Chile", "country_id": None}),
+        ("powiatdle", {"guess": "tatrzanski", "powiat_id": None}),
+        ("us_statedle", {"guess": "Utah", "us_state_id": None}),
+        ("wojewodztwodle", {"guess": "lubuskie", "wojewodztwo_id": None}),
+    ],
+)
+async def test_guess_is_one_commit(async_client, pg_engine, player, game, guess):
+    async with pg_engine.begin() as conn:
+        await conn.execute(text(f"UPDATE {game}_states SET is_game_over = false"))
+    async with AsyncSession(pg_engine) as session:
+        await daily_targets.get_today(game, session)
+
+    with count_queries(pg_engine) as statements:
+        response = await async_client.post(f"/{game}/guess", json=guess)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["id"] > 0
+    assert statements[-1] == "COMMIT"
+    # The new guess comes back from its INSERT, not from a refresh
+    insert = next(s for s in statements if s.startswith(f"INSERT INTO {game}_guesses"))
+    assert "RETURNING" in insert
+    assert not any(
+        s.startswith(f"SELECT {game}_guesses") for s in statements[statements.index(insert):]
+    )
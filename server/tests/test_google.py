@@ -0,0 +1,137 @@
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+
+from utils import google
+
+CLIENT_ID = "client.apps.googleusercontent.com"
+
+
+def rsa_key(kid: str) -> tuple[str, dict]:
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+
+class Google:
+    """Stands in for Google's key set and tokeninfo endpoints."""
+
+    def __init__(self):
+        self.signing = {}
+        self.published = []
+        self.requests = []
+
+    def add_key(self, kid: str, publish: bool = True) -> None:
+        self.signing[kid], public = rsa_key(kid)
+        if publish:
+            self.published.append(public)
+
+    def id_token(self, kid: str, **claims) -> str:
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "1234",
+            "email": "player@example.com",
+            "email_verified": True,
+            "exp": int(time.time()) + 600,
+            **claims,
+        }
+        return jwt.encode(claims, self.signing[kid], algorithm="RS256", headers={"kid": kid})
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request.url.path)
+        if request.url.path == "/oauth2/v3/certs":
+            return httpx.Response(
+                200,
+                json={"keys": self.published},
+                headers={"Cache-Control": "public, max-age=3600, must-revalidate"},
+            )
+        if request.url.params.get("access_token") == "ya29.valid":
+            return httpx.Response(
+                200,
+                json={"azp": CLIENT_ID, "email": "player@example.com", "email_verified": "true"},
+            )
+        return httpx.Response(400, json={"error": "invalid_token"})
+
+
+@pytest.fixture
+def google_stub(monkeypatch):
+    stub = Google()
+    stub.add_key("first")
+    monkeypatch.setattr(google, "GOOGLE_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setattr(google, "transport", httpx.MockTransport(stub.handle))
+    monkeypatch.setattr(google, "keys", google.SigningKeys(google.GOOGLE_CERTS_URL))
+    return stub
+
+
+@pytest.mark.anyio
+async def test_id_tokens_are_verified_with_cached_keys(google_stub):
+    for _ in range(3):
+        info = await google.verify_google_token(google_stub.id_token("first"))
+        assert info["email"] == "player@example.com"
+
+    assert google_stub.requests == ["/oauth2/v3/certs"]
+    assert google.keys.expires_at == pytest.approx(time.time() + 3600, abs=5)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"aud": "someone-else"},
+        {"iss": "evil.example.com"},
+        {"exp": int(time.time()) - 10},
+        {"email_verified": False},
+    ],
+)
+async def test_invalid_id_tokens_are_rejected(google_stub, claims):
+    with pytest.raises(HTTPException) as error:
+        await google.verify_google_token(google_stub.id_token("first", **claims))
+
+    assert error.value.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_rotated_key_refetches_once(google_stub, monkeypatch):
+    monkeypatch.setattr(google, "KEYS_MIN_REFETCH", 0)
+    await google.verify_google_token(google_stub.id_token("first"))
+    google_stub.add_key("second")
+    google_stub.add_key("forged", publish=False)
+
+    await google.verify_google_token(google_stub.id_token("second"))
+    with pytest.raises(HTTPException):
+        await google.verify_google_token(google_stub.id_token("forged"))
+
+    assert google_stub.requests.count("/oauth2/v3/certs") == 3
+
+
+@pytest.mark.anyio
+async def test_access_tokens_go_to_tokeninfo(google_stub):
+    info = await google.verify_google_token("ya29.valid")
+
+    assert info["email"] == "player@example.com"
+    assert google_stub.requests == ["/tokeninfo"]
+    with pytest.raises(HTTPException):
+        await google.verify_google_token("ya29.expired")
+
+
+@pytest.mark.anyio
+async def test_tokeninfo_unreachable(google_stub, monkeypatch):
+    def unreachable(request):
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    monkeypatch.setattr(google, "transport", httpx.MockTransport(unreachable))
+    with pytest.raises(HTTPException) as error:
+        await google.verify_google_token("ya29.valid")
+
+    assert error.value.status_code == 503
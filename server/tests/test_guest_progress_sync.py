@@ -0,0 +1,226 @@
+"""A guest's progress in every game is moved onto their account by one /sync.
+
+Needs a real Postgres (TEST_DATABASE_URL).
+"""
+
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from db.models import (
+    Country,
+    CountrydleDay,
+    CountrydleQuestion,
+    CountrydleState,
+    Powiat,
+    PowiatdleDay,
+    PowiatdleGuess,
+    PowiatdleQuestion,
+    PowiatdleState,
+    USState,
+    USStatedleDay,
+    USStatedleQuestion,
+    USStatedleState,
+    User,
+    UserGameScore,
+    Wojewodztwo,
+    WojewodztwodleDay,
+    WojewodztwodleQuestion,
+    WojewodztwodleState,
+)
+from db.models.guess import CountrydleGuess
+from users.utils import get_current_user
+from utils import daily_targets
+
+pytestmark = pytest.mark.truncate("users", "countries", "powiaty", "us_states", "wojewodztwa")
+
+GAMES = {
+    "countrydle": (
+        CountrydleDay, CountrydleState, CountrydleQuestion,
+        Country, dict(name="Poland", official_name="Poland", wiki="", md_file="pl.md"),
+    ),
+    "powiatdle": (PowiatdleDay, PowiatdleState, PowiatdleQuestion, Powiat, dict(nazwa="krakowski")),
+    "us_statedle": (USStatedleDay, USStatedleState, USStatedleQuestion, USState, dict(name="Ohio")),
+    "wojewodztwodle": (
+        WojewodztwodleDay, WojewodztwodleState, WojewodztwodleQuestion,
+        Wojewodztwo, dict(nazwa="malopolskie"),
+    ),
+}
+
+
+@pytest.fixture
+async def player(pg_engine, pg_app):
+    """Signs a user in with two unclaimed guest questions in every game."""
+    days, questions = {}, {}
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        user = User(username="player", email="player@example.com", verified=True)
+        other = User(username="other", email="other@example.com", verified=True)
+        session.add_all([user, other])
+        await session.flush()
+
+        for game, (day_model, _, question, target, fields) in GAMES.items():
+            day = day_model(date=daily_targets.game_today())
+            setattr(day, daily_targets.GAMES[game].target, target(**fields))
+            session.add(day)
+            await session.flush()
+            asked = [
+                question(
+                    user_id=owner, day_id=day.id, original_question=f"q {n}",
+                    question=f"q {n}", valid=True, answer=False, explanation="No.",
+                )
+                for n, owner in enumerate([None, None, other.id])
+            ]
+            session.add_all(asked)
+            await session.flush()
+            days[game] = day
+            questions[game] = [q.id for q in asked]
+        await session.commit()
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    return user, days, questions
+
+
+def progress(game, day, questions, guesses) -> dict:
+    return {
+        # Guests send their own counters too; the server works them out instead
+        "state": {
+            "id": 0, "user_id": 0, "day_id": 0, "points": 0, "remaining_questions": 0, "remaining_guesses": 0, "questions_asked": 99,
+            "guesses_made": 99, "is_game_over": False, "won": False,
+        },
+        "questions": questions,
+        "guesses": guesses,
+        "date": str(day.date),
+    }
+
+
+def target_id(game) -> str:
+    return f"{daily_targets.GAMES[game].target}_id"
+
+
+@pytest.mark.anyio
+# About ten statements a game, however many questions and guesses it had
+@pytest.mark.query_budget(44, commits=1)
+async def test_every_game_in_one_request(client, pg_engine, player):
+    user, days, questions = player
+    payload = {}
+    for game, day in days.items():
+        guesses = [{"guess": "wrong", target_id(game): None}]
+        if game != "wojewodztwodle":
+            guesses.append({"guess": "right", target_id(game): getattr(day, target_id(game))})
+        # The last question was asked by someone else and stays theirs
+        payload[game] = progress(game, day, questions[game], guesses)
+
+    response = await client.post("/sync", json=payload)
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data.pop("errors") == {}
+    assert set(data) == set(GAMES)
+    async with AsyncSession(pg_engine) as session:
+        for game, (_, state_model, question, _, _) in GAMES.items():
+            state = await session.scalar(select(state_model))
+            assert state.questions_asked == 2
+            assert data[game]["state"]["questions_asked"] == 2
+            assert len(data[game]["questions"]) == 2
+            claimed = await session.scalar(
+                select(func.count()).where(question.user_id == user.id)
+            )
+            assert claimed == 2
+        countrydle = await session.scalar(select(CountrydleState))
+        assert (countrydle.guesses_made, countrydle.won, countrydle.is_game_over) == (
+            2, True, True,
+        )
+        assert countrydle.points > 0
+        assert await session.scalar(select(func.count(CountrydleGuess.id))) == 2
+        # One wrong guess of the two wojewodztwodle allows leaves the game running
+        wojewodztwodle = await session.scalar(select(WojewodztwodleState))
+        assert (wojewodztwodle.remaining_guesses, wojewodztwodle.is_game_over) == (1, False)
+        finished = await session.scalars(select(UserGameScore.game))
+        assert sorted(finished) == ["countrydle", "powiatdle", "us_statedle"]
+
+
+@pytest.mark.anyio
+async def test_server_progress_wins(client, pg_engine, player):
+    user, days, questions = player
+    day = days["powiatdle"]
+    async with AsyncSession(pg_engine) as session:
+        session.add(
+            PowiatdleState(
+                user_id=user.id, day_id=day.id, remaining_questions=14,
+                remaining_guesses=3, questions_asked=1, guesses_made=0,
+            )
+        )
+        await session.commit()
+
+    # Skipped before it is even looked at, so not reported either
+    too_many = [{"guess": "a"}, {"guess": "b"}, {"guess": "c"}, {"guess": "d"}]
+    response = await client.post(
+        "/sync",
+        json={"powiatdle": progress("powiatdle", day, questions["powiatdle"], too_many)},
+    )
+
+    assert response.status_code == 200, response.text
+    assert response.json()["errors"] == {}
+    assert response.json()["powiatdle"]["state"]["questions_asked"] == 1
+    async with AsyncSession(pg_engine) as session:
+        assert await session.scalar(
+            select(func.count()).where(PowiatdleQuestion.user_id == user.id)
+        ) == 0
+
+
+@pytest.mark.anyio
+async def test_guesses_after_the_right_one_are_dropped(client, pg_engine, player):
+    user, days, questions = player
+    day = days["powiatdle"]
+    guesses = [{"guess": "right", "powiat_id": day.powiat_id}, {"guess": "more"}]
+
+    response = await client.post(
+        "/sync", json={"powiatdle": progress("powiatdle", day, [], guesses)}
+    )
+
+    assert response.status_code == 200, response.text
+    assert response.json()["errors"] == {}
+    async with AsyncSession(pg_engine) as session:
+        state = await session.scalar(select(PowiatdleState))
+        assert (state.guesses_made, state.won, state.is_game_over) == (1, True, True)
+        assert await session.scalar(select(func.count(PowiatdleGuess.id))) == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("malformed", ["too many guesses", "tomorrow", "last week"])
+async def test_invalid_game_is_reported(client, pg_engine, player, malformed):
+    user, days, questions = player
+    day = days["powiatdle"]
+    powiatdle = progress("powiatdle", day, questions["powiatdle"], [])
+    if malformed == "too many guesses":
+        powiatdle["guesses"] = [{"guess": "a"}, {"guess": "b"}, {"guess": "c"}, {"guess": "d"}]
+    else:
+        days_ahead = 1 if malformed == "tomorrow" else -7
+        powiatdle["date"] = str(day.date + timedelta(days=days_ahead))
+
+    response = await client.post(
+        "/sync",
+        json={
+            "countrydle": progress("countrydle", days["countrydle"], questions["countrydle"], []),
+            "powiatdle": powiatdle,
+            "us_statedle": {**progress("us_statedle", days["us_statedle"], [], []), "date": "?"},
+        },
+    )
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    # One reason for everything, so nothing is learnt from it
+    assert data["errors"] == {
+        "powiatdle": "Invalid guest progress.",
+        "us_statedle": "Invalid guest progress.",
+    }
+    assert data["powiatdle"] is None
+    # The valid game is synced all the same
+    assert data["countrydle"]["state"]["questions_asked"] == 2
+    async with AsyncSession(pg_engine) as session:
+        assert (await session.scalar(select(CountrydleState))).questions_asked == 2
+        assert await session.scalar(select(PowiatdleState)) is None
+        assert await session.scalar(select(PowiatdleGuess)) is None
@@ -1,11 +1,13 @@
 import pytest
 from httpx import AsyncClient
 from unittest.mock import patch, AsyncMock, MagicMock
-from datetime import date, datetime
+from datetime import date
+from types import SimpleNamespace
 from db.models import User, CountrydleDay, CountrydleState
 
 from app import app
 from users.utils import get_current_user
+from utils import daily_targets
 
 @pytest.fixture
 def mock_user():
@@ -29,131 +31,116 @@ def mock_day():
     day.date = date(2023, 1, 1)
     return day
 
-@pytest.mark.anyio
-async def test_sync_guest_data_success(async_client: AsyncClient, mock_user, mock_day, override_get_current_user):
-    # Mock Repository methods
+def sync_payload(guesses, won):
+    # What the client claims; the server works the outcome out from the guesses
+    return {
+        "date": str(daily_targets.game_today()),
+        "state": {
+            "remaining_questions": 8,
+            "remaining_guesses": 2,
+            "questions_asked": 2,
+            "guesses_made": len(guesses),
+            "is_game_over": won,
+            "won": won,
+        },
+        "questions": [1, 2],
+        "guesses": guesses,
+    }
+
+
+def state_response(questions_asked, won):
+    from schemas.countrydle import CountrydleStateResponse, CountrydleStateSchema
+    return CountrydleStateResponse(
+        user=None,
+        date=str(daily_targets.game_today()),
+        state=CountrydleStateSchema(
+            remaining_questions=10 - questions_asked,
+            remaining_guesses=3,
+            questions_asked=questions_asked,
+            guesses_made=0,
+            is_game_over=won,
+            won=won,
+        ),
+        questions=[],
+        guesses=[],
+    )
+
+
+@pytest.fixture
+def mock_sync(mock_day):
     with (
-        patch("db.repositories.countrydle.CountrydleRepository.get_day_country_by_date", new_callable=AsyncMock) as mock_get_day,
-        patch("db.repositories.countrydle.CountrydleStateRepository.get_state", new_callable=AsyncMock) as mock_get_state,
-        patch("db.repositories.countrydle.CountrydleStateRepository.update_countrydle_state", new_callable=AsyncMock) as mock_update_state,
-        patch("db.repositories.guess.CountrydleGuessRepository.add_guess", new_callable=AsyncMock) as mock_add_guess,
-        patch("db.repositories.countrydle.CountrydleStateRepository.calc_points", new_callable=AsyncMock) as mock_calc_points,
+        patch("db.repositories.countrydle.CountrydleRepository.get_day_country_by_date", new_callable=AsyncMock, return_value=mock_day) as mock_get_day,
+        patch("db.repositories.countrydle.CountrydleStateRepository.has_progress", new_callable=AsyncMock, return_value=False) as mock_has_progress,
+        patch("db.repositories.countrydle.CountrydleStateRepository.sync_guest_progress", new_callable=AsyncMock) as mock_sync_progress,
+        patch("db.repositories.countrydle.CountrydleStateRepository.calc_points", new_callable=AsyncMock, return_value=500),
         patch("db.repositories.user.UserRepository.update_points", new_callable=AsyncMock) as mock_update_points,
-        patch("sqlalchemy.ext.asyncio.AsyncSession.execute", new_callable=AsyncMock) as mock_execute,
-        patch("countrydle.get_state", new_callable=AsyncMock) as mock_get_final_state
+        patch("db.repositories.leaderboard.LeaderboardRepository.record_game", new_callable=AsyncMock) as mock_record_game,
+        patch("countrydle.get_state", new_callable=AsyncMock) as mock_get_final_state,
     ):
-        mock_get_day.return_value = mock_day
-        
-        # Initial state (no progress)
-        initial_state = MagicMock(spec=CountrydleState)
-        initial_state.questions_asked = 0
-        initial_state.guesses_made = 0
-        initial_state.won = False
-        initial_state.is_game_over = False
-        mock_get_state.return_value = initial_state
-        
-        mock_calc_points.return_value = 500
-        
-        # Final state response mock
-        from schemas.countrydle import CountrydleStateResponse, CountrydleStateSchema
-        mock_get_final_state.return_value = CountrydleStateResponse(
-            user=None, # In reality it would be the user, but for the mock it just needs to match schema
-            date="2023-01-01",
-            state=CountrydleStateSchema(
-                remaining_questions=8,
-                remaining_guesses=2,
-                questions_asked=2,
-                guesses_made=1,
-                is_game_over=True,
-                won=True
-            ),
-            questions=[],
-            guesses=[]
+        yield SimpleNamespace(
+            get_day=mock_get_day,
+            has_progress=mock_has_progress,
+            sync_progress=mock_sync_progress,
+            update_points=mock_update_points,
+            record_game=mock_record_game,
+            get_state=mock_get_final_state,
         )
 
-        sync_payload = {
-            "date": "2023-01-01",
-            "state": {
-                "remaining_questions": 8,
-                "remaining_guesses": 2,
-                "questions_asked": 2,
-                "guesses_made": 1,
-                "is_game_over": True,
-                "won": True
-            },
-            "questions": [1, 2],
-            "guesses": [
-                {"guess": "Poland", "country_id": 100}
-            ]
-        }
-
-        response = await async_client.post("/countrydle/sync", json=sync_payload)
-        
-        assert response.status_code == 200
-        
-        # Verify state was updated
-        assert initial_state.questions_asked == 2
-        assert initial_state.guesses_made == 1
-        assert initial_state.won is True
-        assert initial_state.is_game_over is True
-        assert initial_state.points == 500
-        
-        # Verify repository calls
-        mock_get_day.assert_called_once_with(date(2023, 1, 1))
-        mock_update_state.assert_called_once_with(initial_state)
-        mock_add_guess.assert_called_once()
-        mock_update_points.assert_called_once()
 
 @pytest.mark.anyio
-async def test_sync_guest_data_already_has_progress(async_client: AsyncClient, mock_user, mock_day, override_get_current_user):
-    with (
-        patch("db.repositories.countrydle.CountrydleRepository.get_day_country_by_date", new_callable=AsyncMock) as mock_get_day,
-        patch("db.repositories.countrydle.CountrydleStateRepository.get_state", new_callable=AsyncMock) as mock_get_state,
-        patch("countrydle.get_state", new_callable=AsyncMock) as mock_get_final_state
-    ):
-        mock_get_day.return_value = mock_day
-        
-        # State with existing progress
-        existing_state = MagicMock(spec=CountrydleState)
-        existing_state.questions_asked = 1
-        existing_state.guesses_made = 0
-        mock_get_state.return_value = existing_state
-        
-        from schemas.countrydle import CountrydleStateResponse, CountrydleStateSchema
-        mock_get_final_state.return_value = CountrydleStateResponse(
-            user=None,
-            date="2023-01-01",
-            state=CountrydleStateSchema(
-                remaining_questions=9,
-                remaining_guesses=3,
-                questions_asked=1,
-                guesses_made=0,
-                is_game_over=False,
-                won=False
-            ),
-            questions=[],
-            guesses=[]
-        )
+async def test_sync_guest_data_success(async_client: AsyncClient, mock_sync, override_get_current_user):
+    state = MagicMock(spec=CountrydleState)
+    state.won = True
+    state.is_game_over = True
+    mock_sync.sync_progress.return_value = state
+    mock_sync.get_state.return_value = state_response(2, won=True)
+
+    response = await async_client.post(
+        "/countrydle/sync", json=sync_payload([{"guess": "Poland", "country_id": 100}], won=True)
+    )
+
+    assert response.status_code == 200
+    mock_sync.get_day.assert_called_once_with(daily_targets.game_today())
+    guesses = mock_sync.sync_progress.await_args.args[-1]
+    assert guesses == [{"guess": "Poland", "country_id": 100, "answer": True}]
+    assert state.points == 500
+    mock_sync.update_points.assert_awaited_once()
+    mock_sync.record_game.assert_awaited_once_with("countrydle", state)
+
+
+@pytest.mark.anyio
+async def test_sync_guest_data_ignores_claimed_win(async_client: AsyncClient, mock_sync, override_get_current_user):
+    state = MagicMock(spec=CountrydleState)
+    state.won = False
+    state.is_game_over = False
+    mock_sync.sync_progress.return_value = state
+    mock_sync.get_state.return_value = state_response(2, won=False)
+
+    # Germany is not the day's country, whatever the client says
+    response = await async_client.post(
+        "/countrydle/sync", json=sync_payload([{"guess": "Germany", "country_id": 101}], won=True)
+    )
+
+    assert response.status_code == 200
+    assert response.json()["state"]["won"] is False
+    guesses = mock_sync.sync_progress.await_args.args[-1]
+    assert guesses == [{"guess": "Germany", "country_id": 101, "answer": False}]
+    mock_sync.update_points.assert_not_awaited()
+    mock_sync.record_game.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_sync_guest_data_already_has_progress(async_client: AsyncClient, mock_sync, override_get_current_user):
+    # Progress already on the server wins
+    mock_sync.has_progress.return_value = True
+    mock_sync.get_state.return_value = state_response(1, won=False)
+
+    response = await async_client.post("/countrydle/sync", json=sync_payload([], won=False))
 
-        sync_payload = {
-            "date": "2023-01-01",
-            "state": {
-                "remaining_questions": 5,
-                "remaining_guesses": 3,
-                "questions_asked": 5,
-                "guesses_made": 0,
-                "is_game_over": False,
-                "won": False
-            },
-            "questions": [1, 2, 3, 4, 5],
-            "guesses": []
-        }
-
-        response = await async_client.post("/countrydle/sync", json=sync_payload)
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert data["state"]["questions_asked"] == 1 # Should return existing progress, not synced one
+    assert response.status_code == 200
+    assert response.json()["state"]["questions_asked"] == 1
+    mock_sync.sync_progress.assert_not_awaited()
+    mock_sync.record_game.assert_not_awaited()
 
 
 @pytest.mark.anyio
@@ -172,6 +159,6 @@ async def test_sync_guest_data_invalid_date(async_client: AsyncClient, mock_user
         "guesses": []
     }
     response = await async_client.post("/countrydle/sync", json=sync_payload)
-    assert response.status_code == 400
-    assert response.json()["detail"] == "Invalid date format. Use YYYY-MM-DD."
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid guest progress."
 
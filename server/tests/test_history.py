@@ -0,0 +1,93 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from utils import daily_targets
+
+
+def make_days(*names):
+    countries = {}
+    days = []
+    for n, name in enumerate(names, start=1):
+        country = countries.setdefault(
+            name, SimpleNamespace(id=len(countries) + 1, name=name, official_name=name)
+        )
+        days.append(
+            SimpleNamespace(
+                id=n,
+                country_id=country.id,
+                country=country,
+                date=daily_targets.game_today() - timedelta(days=n),
+            )
+        )
+    return days
+
+
+@pytest.mark.anyio
+async def test_countrydle_history_pages(async_client):
+    days = make_days("Poland", "Chile", "Poland", "Japan", "Chile", "Poland")
+
+    with patch(
+        "db.repositories.countrydle.CountrydleRepository.get_countrydle_history",
+        new_callable=AsyncMock,
+        return_value=days,
+    ) as mock_history:
+        first = await async_client.get("/countrydle/statistics/history?limit=4")
+        cursor = first.json()["daily_countries"][-1]["date"]
+        second = await async_client.get(
+            f"/countrydle/statistics/history?limit=4&before={cursor}"
+        )
+
+    assert mock_history.await_count == 1
+    assert [d["id"] for d in first.json()["daily_countries"]] == [1, 2, 3, 4]
+    assert [d["id"] for d in second.json()["daily_countries"]] == [5, 6]
+    assert [(c["name"], c["count"]) for c in second.json()["countries_count"]] == [
+        ("Poland", 3),
+        ("Chile", 2),
+        ("Japan", 1),
+    ]
+    assert first.headers["etag"] != second.headers["etag"]
+
+
+@pytest.mark.anyio
+async def test_history_not_modified(async_client):
+    days = [
+        SimpleNamespace(id=1, powiat=None, date=daily_targets.game_today() - timedelta(days=1))
+    ]
+
+    with patch(
+        "db.repositories.powiatdle.PowiatdleDayRepository.get_history",
+        new_callable=AsyncMock,
+        return_value=days,
+    ):
+        response = await async_client.get("/powiatdle/history")
+        cached = await async_client.get(
+            "/powiatdle/history", headers={"If-None-Match": response.headers["etag"]}
+        )
+
+    assert response.json() == [{"id": 1, "powiat": None, "date": str(days[0].date)}]
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == response.headers["etag"]
+
+
+@pytest.mark.anyio
+async def test_history_rebuilt_after_rollover(async_client):
+    today = daily_targets.game_today()
+    tomorrow = today + timedelta(days=1)
+
+    with (
+        patch(
+            "db.repositories.us_statedle.USStatedleDayRepository.get_history",
+            new_callable=AsyncMock,
+            return_value=[],
+        ) as mock_history,
+        patch("utils.daily_targets.game_today", return_value=today) as mock_today,
+    ):
+        await async_client.get("/us_statedle/history")
+        await async_client.get("/us_statedle/history")
+        mock_today.return_value = tomorrow
+        await async_client.get("/us_statedle/history")
+
+    assert [call.args[0] for call in mock_history.await_args_list] == [today, tomorrow]
@@ -0,0 +1,158 @@
+"""Retried submissions with the same Idempotency-Key run only once.
+
+Needs a real Postgres (TEST_DATABASE_URL).
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import app
+from db.models import IdempotencyKey, Powiat, PowiatdleDay, PowiatdleState, User
+from users.utils import create_access_token, get_current_or_guest_user, user_claims
+from utils import daily_targets, idempotency
+
+pytestmark = pytest.mark.truncate("users", "powiaty", "idempotency_keys")
+
+
+@pytest.fixture
+async def player(client, pg_engine, monkeypatch, pg_app):
+    monkeypatch.setattr(
+        idempotency, "sessions", async_sessionmaker(pg_engine, expire_on_commit=False)
+    )
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        user = User(username="player", email="player@example.com", verified=True)
+        day = PowiatdleDay(date=daily_targets.game_today(), powiat=Powiat(nazwa="krakowski"))
+        session.add_all([user, day])
+        await session.commit()
+
+    app.dependency_overrides[get_current_or_guest_user] = lambda: user
+    # Keys are scoped by the token the middleware sees
+    client.cookies.set("access_token", create_access_token(data=user_claims(user)))
+    return user
+
+
+def enhance(delay: float = 0, error: Exception | None = None) -> AsyncMock:
+    """Stands in for the LLM, finding every question invalid."""
+
+    async def answer(question):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return MagicMock(
+            valid=False, original_question=question, question=question, explanation="No."
+        )
+
+    return AsyncMock(side_effect=answer)
+
+
+async def questions_asked(pg_engine) -> int:
+    async with AsyncSession(pg_engine) as session:
+        return await session.scalar(select(PowiatdleState.questions_asked))
+
+
+def ask(client, question="Is it big?", key="retry-1"):
+    return client.post(
+        "/powiatdle/question",
+        json={"question": question},
+        headers={"Idempotency-Key": key, "Origin": "http://localhost:5173"},
+    )
+
+
+@pytest.mark.anyio
+async def test_retry_replays_the_response(client, pg_engine, player):
+    llm = enhance()
+    with patch("powiatdle.utils.enhance_question", llm):
+        first = await ask(client)
+        retry = await ask(client)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    # Replays are answered before the app, but still readable across origins
+    assert retry.headers["Access-Control-Allow-Origin"] == "http://localhost:5173"
+    assert llm.await_count == 1
+    assert await questions_asked(pg_engine) == 1
+    # Nothing is left waiting once both have been answered
+    assert idempotency.stats()["waiting"] == 0
+
+
+@pytest.mark.anyio
+async def test_retry_waits_for_the_running_request(client, pg_engine, player):
+    llm = enhance(delay=0.3)
+    with patch("powiatdle.utils.enhance_question", llm):
+        first, retry = await asyncio.gather(ask(client), ask(client))
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert llm.await_count == 1
+    assert idempotency.stats()["waited"] >= 1
+    assert await questions_asked(pg_engine) == 1
+
+
+@pytest.mark.anyio
+async def test_other_keys_and_requests(client, pg_engine, player):
+    with patch("powiatdle.utils.enhance_question", enhance()):
+        await ask(client)
+        reused = await ask(client, question="Is it small?")
+        other = await ask(client, question="Is it small?", key="retry-2")
+
+    assert reused.status_code == 422
+    assert other.status_code == 200
+    assert await questions_asked(pg_engine) == 2
+
+
+@pytest.mark.anyio
+async def test_failed_request_gives_its_key_up(client, pg_engine, player):
+    with patch("powiatdle.utils.enhance_question", enhance(error=RuntimeError("down"))):
+        with pytest.raises(RuntimeError):
+            await ask(client)
+
+    async with AsyncSession(pg_engine) as session:
+        assert await session.scalar(select(IdempotencyKey)) is None
+
+    with patch("powiatdle.utils.enhance_question", enhance()):
+        retry = await ask(client)
+
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert await questions_asked(pg_engine) == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_request_gives_its_key_up(client, pg_engine, player):
+    with patch("powiatdle.utils.enhance_question", enhance(delay=5)):
+        # The client goes away while the LLM is still answering
+        request = asyncio.create_task(ask(client))
+        await asyncio.sleep(0.3)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        await asyncio.sleep(0.1)
+
+    async with AsyncSession(pg_engine) as session:
+        assert await session.scalar(select(IdempotencyKey)) is None
+    assert idempotency.stats()["waiting"] == 0
+
+    with patch("powiatdle.utils.enhance_question", enhance()):
+        retry = await ask(client)
+
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+@pytest.mark.anyio
+async def test_guest_keys_are_ignored(client, pg_engine, player):
+    client.cookies.delete("access_token")
+    with patch("powiatdle.utils.enhance_question", enhance()) as llm:
+        first = await ask(client)
+        # Maybe another guest, who must not get the first one's answer
+        second = await ask(client, question="Is it small?")
+
+    assert first.status_code == second.status_code == 200
+    assert "Idempotent-Replayed" not in second.headers
+    assert llm.await_count == 2
+    assert idempotency.stats()["guests"] >= 2
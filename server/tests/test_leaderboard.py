@@ -0,0 +1,216 @@
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (
+    CountrydleDay,
+    CountrydleState,
+    Powiat,
+    PowiatdleDay,
+    PowiatdleState,
+    User,
+    UserGameScore,
+)
+from db.models.user import UserPoints
+from db.repositories.leaderboard import PROFILE_CHANNEL, LeaderboardRepository
+from db.repositories.statistics import ProfileStatisticsRepository
+from db.repositories.user import UserRepository
+from db.notify import listener
+from utils import profile_stats
+
+
+def finished(user, day, points, won):
+    return SimpleNamespace(user_id=user.id, day_id=day.id, points=points, won=won)
+
+
+@pytest.fixture
+async def session(pg_engine):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        yield session
+
+    async with pg_engine.begin() as conn:
+        await conn.execute(
+            text("TRUNCATE user_game_scores, powiatdle_days, powiaty, countrydle_days, users "
+                "RESTART IDENTITY CASCADE")
+        )
+
+
+@pytest.fixture
+async def players(session):
+    users = {
+        name: User(username=name, email=f"{name or 'google'}@example.com", verified=True)
+        for name in ["alice", "bob", "carol", "test_hidden", None]
+    }
+    days = [PowiatdleDay(date=date(2026, 1, d)) for d in (1, 2, 3)]
+    session.add_all([*users.values(), *days])
+    await session.commit()
+    return users, days
+
+
+@pytest.mark.anyio
+async def test_leaderboard_order_and_rank(session, players):
+    users, (day1, day2, day3) = players
+    repo = LeaderboardRepository(session)
+
+    await repo.record_game("powiatdle", finished(users["alice"], day1, 500, True))
+    await repo.record_game("powiatdle", finished(users["alice"], day2, 0, False))
+    await repo.record_game("powiatdle", finished(users["bob"], day1, 300, True))
+    await repo.record_game("powiatdle", finished(users["bob"], day2, 300, True))
+    await repo.record_game("powiatdle", finished(users["carol"], day1, 100, True))
+    await repo.record_game("powiatdle", finished(users["test_hidden"], day1, 9000, True))
+    await repo.record_game("powiatdle", finished(users[None], day1, 50, True))
+    await session.commit()
+
+    leaderboard = await repo.get_leaderboard("powiatdle")
+    assert [e.username for e in leaderboard] == ["bob", "alice", "carol"]
+    assert (leaderboard[0].points, leaderboard[0].wins, leaderboard[0].streak) == (600, 2, 2)
+    assert (leaderboard[1].points, leaderboard[1].wins, leaderboard[1].streak) == (500, 1, 0)
+
+    page = await repo.get_leaderboard("powiatdle", limit=1, offset=1)
+    assert [e.username for e in page] == ["alice"]
+
+    assert (await repo.get_rank("powiatdle", users["bob"])).rank == 1
+    assert (await repo.get_rank("powiatdle", users["carol"])).rank == 3
+    assert (await repo.get_rank("powiatdle", users["test_hidden"])).rank is None
+    assert (await repo.get_rank("countrydle", users["bob"])).rank is None
+
+    alice = await session.get(UserGameScore, ("powiatdle", users["alice"].id))
+    assert (alice.games_played, alice.longest_streak, alice.last_played) == (
+        2,
+        1,
+        day2.date,
+    )
+
+
+@pytest.mark.anyio
+async def test_reset_stale_streaks(session, players):
+    users, (day1, day2, day3) = players
+    repo = LeaderboardRepository(session)
+
+    await repo.record_game("powiatdle", finished(users["alice"], day1, 100, True))
+    await repo.record_game("powiatdle", finished(users["alice"], day2, 100, True))
+    await repo.record_game("powiatdle", finished(users["bob"], day1, 100, True))
+    await repo.reset_stale_streaks(day2.date)
+    await session.commit()
+
+    entries = {e.username: e for e in await repo.get_leaderboard("powiatdle")}
+    assert entries["alice"].streak == 2
+    assert entries["bob"].streak == 0
+
+    bob = await session.get(UserGameScore, ("powiatdle", users["bob"].id))
+    assert bob.longest_streak == 1
+
+
+@pytest.mark.anyio
+async def test_countrydle_streaks(session, players):
+    users, _ = players
+    days = [CountrydleDay(date=date(2026, 1, d)) for d in (1, 2, 3, 4)]
+    session.add_all(days)
+    await session.flush()
+    repo = UserRepository(session)
+
+    for day, won in zip(days, [True, True, False, True]):
+        await repo.update_points(users["alice"].id, finished(users["alice"], day, 100, won))
+    await repo.update_points(users["bob"].id, finished(users["bob"], days[2], 100, True))
+    session.add(
+        CountrydleState(user_id=users["alice"].id, day_id=days[3].id, is_game_over=True)
+    )
+    await repo.reset_stale_streaks(days[3].date)
+    await session.commit()
+
+    alice = await session.get(UserPoints, users["alice"].id)
+    assert (alice.points, alice.streak) == (400, 1)
+    assert (alice.longest_streak, alice.longest_streak_start) == (2, days[0].date)
+
+    bob = await session.get(UserPoints, users["bob"].id)
+    assert (bob.streak, bob.longest_streak) == (0, 1)
+
+
+@pytest.mark.anyio
+async def test_profile_statistics(session, players):
+    users, days = players
+    alice = users["alice"]
+    powiat = Powiat(nazwa="Kraków")
+    session.add(powiat)
+    await session.flush()
+    for day, won in zip(days, [True, False, True]):
+        day.powiat_id = powiat.id
+        state = PowiatdleState(
+            user_id=alice.id,
+            day_id=day.id,
+            guesses_made=2,
+            is_game_over=True,
+            won=won,
+            points=100 if won else 0,
+        )
+        session.add(state)
+        await LeaderboardRepository(session).record_game("powiatdle", state)
+    session.add(PowiatdleState(user_id=users["bob"].id, day_id=days[0].id))
+    await session.commit()
+
+    profile = await ProfileStatisticsRepository(session).get_profile(alice, history_limit=2)
+    powiatdle = profile.powiatdle
+    assert (powiatdle.points, powiatdle.wins, powiatdle.games_played) == (200, 2, 3)
+    assert [(e.date, e.target_name) for e in powiatdle.history] == [
+        (str(days[2].date), "Kraków"),
+        (str(days[1].date), "???"),
+    ]
+    assert profile.countrydle.games_played == 0 and profile.countrydle.history == []
+
+    bob = await ProfileStatisticsRepository(session).get_profile(users["bob"])
+    assert bob.powiatdle.history == []
+
+
+@pytest.mark.anyio
+async def test_history_pages(session, players):
+    users, days = players
+    for day in days:
+        session.add(PowiatdleState(user_id=users["alice"].id, day_id=day.id, is_game_over=True))
+    session.add(PowiatdleState(user_id=users["bob"].id, day_id=days[0].id, is_game_over=True))
+    await session.commit()
+    repo = ProfileStatisticsRepository(session)
+
+    first = await repo.get_history("powiatdle", users["alice"], limit=2)
+    assert [e.date for e in first] == [str(days[2].date), str(days[1].date)]
+
+    second = await repo.get_history("powiatdle", users["alice"], first[-1].day_id, limit=2)
+    assert [e.day_id for e in second] == [days[0].id]
+
+
+@pytest.mark.anyio
+async def test_profile_cache_invalidated_on_finish():
+    user = SimpleNamespace(id=7)
+    session = SimpleNamespace(info={})
+    get_profile = AsyncMock(side_effect=["first", "second"])
+
+    with patch.object(ProfileStatisticsRepository, "get_profile", get_profile):
+        assert await profile_stats.get_profile(user, session) == "first"
+        assert await profile_stats.get_profile(user, session) == "first"
+        listener._dispatch(None, 0, PROFILE_CHANNEL, "7")
+        assert await profile_stats.get_profile(user, session) == "second"
+
+    assert get_profile.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_profile_read_before_a_finish_is_not_cached():
+    user = SimpleNamespace(id=7)
+    session = SimpleNamespace(info={})
+    profiles = ["stale", "fresh"]
+
+    async def read(user):
+        profile = profiles.pop(0)
+        if profile == "stale":
+            # The game finishes while this worker is still reading the profile
+            listener._dispatch(None, 0, PROFILE_CHANNEL, "7")
+        return profile
+
+    with patch.object(ProfileStatisticsRepository, "get_profile", side_effect=read):
+        assert await profile_stats.get_profile(user, session) == "stale"
+        # What the first request read was never cached
+        assert await profile_stats.get_profile(user, session) == "fresh"
+        assert await profile_stats.get_profile(user, session) == "fresh"
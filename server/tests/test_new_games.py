@@ -1,3 +1,5 @@
+from datetime import datetime
+
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
 from db.models import User
@@ -28,17 +30,9 @@ async def test_us_statedle_state(async_client, mock_user_override):
             new_callable=AsyncMock,
         ) as mock_get_today,
         patch(
-            "db.repositories.us_statedle.USStatedleStateRepository.get_state",
+            "db.repositories.us_statedle.USStatedleStateRepository.load_state",
             new_callable=AsyncMock,
         ) as mock_get_state,
-        patch(
-            "db.repositories.us_statedle.USStatedleGuessRepository.get_user_day_guesses",
-            new_callable=AsyncMock,
-        ) as mock_get_guesses,
-        patch(
-            "db.repositories.us_statedle.USStatedleQuestionRepository.get_user_day_questions",
-            new_callable=AsyncMock,
-        ) as mock_get_questions,
     ):
         # Mock Day
         mock_day = MagicMock()
@@ -59,11 +53,12 @@ async def test_us_statedle_state(async_client, mock_user_override):
         mock_state.is_game_over = False
         mock_state.won = False
         mock_state.points = 0
+        mock_state.version = 0
+        mock_state.updated_at = datetime(2023, 1, 1, 12, 0)
+        mock_state.guesses = []
+        mock_state.questions = []
         mock_get_state.return_value = mock_state
 
-        mock_get_guesses.return_value = []
-        mock_get_questions.return_value = []
-
         response = await async_client.get("/us_statedle/state")
         assert response.status_code == 200
         data = response.json()
@@ -79,17 +74,9 @@ async def test_wojewodztwodle_state(async_client, mock_user_override):
             new_callable=AsyncMock,
         ) as mock_get_today,
         patch(
-            "db.repositories.wojewodztwodle.WojewodztwodleStateRepository.get_state",
+            "db.repositories.wojewodztwodle.WojewodztwodleStateRepository.load_state",
             new_callable=AsyncMock,
         ) as mock_get_state,
-        patch(
-            "db.repositories.wojewodztwodle.WojewodztwodleGuessRepository.get_user_day_guesses",
-            new_callable=AsyncMock,
-        ) as mock_get_guesses,
-        patch(
-            "db.repositories.wojewodztwodle.WojewodztwodleQuestionRepository.get_user_day_questions",
-            new_callable=AsyncMock,
-        ) as mock_get_questions,
     ):
         # Mock Day
         mock_day = MagicMock()
@@ -110,11 +97,12 @@ async def test_wojewodztwodle_state(async_client, mock_user_override):
         mock_state.is_game_over = False
         mock_state.won = False
         mock_state.points = 0
+        mock_state.version = 0
+        mock_state.updated_at = datetime(2023, 1, 1, 12, 0)
+        mock_state.guesses = []
+        mock_state.questions = []
         mock_get_state.return_value = mock_state
 
-        mock_get_guesses.return_value = []
-        mock_get_questions.return_value = []
-
         response = await async_client.get("/wojewodztwodle/state")
         assert response.status_code == 200
         data = response.json()
@@ -130,17 +118,17 @@ async def test_us_statedle_guess_correct(async_client, mock_user_override):
             new_callable=AsyncMock,
         ) as mock_get_today,
         patch(
-            "db.repositories.us_statedle.USStatedleStateRepository.get_state",
+            "db.repositories.us_statedle.USStatedleStateRepository.record_guess",
             new_callable=AsyncMock,
-        ) as mock_get_state,
+        ) as mock_record_guess,
         patch(
             "db.repositories.us_statedle.USStatedleGuessRepository.add_guess",
             new_callable=AsyncMock,
         ) as mock_add_guess,
         patch(
-            "db.repositories.us_statedle.USStatedleStateRepository.update_state",
+            "db.repositories.leaderboard.LeaderboardRepository.record_game",
             new_callable=AsyncMock,
-        ) as mock_update_state,
+        ) as mock_record_game,
     ):
         # Mock Day
         mock_day = MagicMock()
@@ -150,12 +138,12 @@ async def test_us_statedle_guess_correct(async_client, mock_user_override):
 
         # Mock State
         mock_state = MagicMock()
-        mock_state.remaining_guesses = 3
+        mock_state.remaining_guesses = 2
         mock_state.remaining_questions = 10
-        mock_state.guesses_made = 0
-        mock_state.won = False
-        mock_state.is_game_over = False
-        mock_get_state.return_value = mock_state
+        mock_state.guesses_made = 1
+        mock_state.won = True
+        mock_state.is_game_over = True
+        mock_record_guess.return_value = mock_state
 
         # Mock Guess Result
         mock_guess_result = MagicMock()
@@ -174,7 +162,9 @@ async def test_us_statedle_guess_correct(async_client, mock_user_override):
         assert response.status_code == 200
         data = response.json()
         assert data["answer"] is True
-        assert mock_update_state.called
+        assert mock_record_guess.await_args.args[-1] is True
+        assert mock_state.points > 0
+        mock_record_game.assert_awaited_once()
 
 
 @pytest.mark.anyio
@@ -185,17 +175,17 @@ async def test_wojewodztwodle_guess_correct(async_client, mock_user_override):
             new_callable=AsyncMock,
         ) as mock_get_today,
         patch(
-            "db.repositories.wojewodztwodle.WojewodztwodleStateRepository.get_state",
+            "db.repositories.wojewodztwodle.WojewodztwodleStateRepository.record_guess",
             new_callable=AsyncMock,
-        ) as mock_get_state,
+        ) as mock_record_guess,
         patch(
             "db.repositories.wojewodztwodle.WojewodztwodleGuessRepository.add_guess",
             new_callable=AsyncMock,
         ) as mock_add_guess,
         patch(
-            "db.repositories.wojewodztwodle.WojewodztwodleStateRepository.update_state",
+            "db.repositories.leaderboard.LeaderboardRepository.record_game",
             new_callable=AsyncMock,
-        ) as mock_update_state,
+        ) as mock_record_game,
     ):
         # Mock Day
         mock_day = MagicMock()
@@ -205,12 +195,12 @@ async def test_wojewodztwodle_guess_correct(async_client, mock_user_override):
 
         # Mock State
         mock_state = MagicMock()
-        mock_state.remaining_guesses = 3
+        mock_state.remaining_guesses = 2
         mock_state.remaining_questions = 10
-        mock_state.guesses_made = 0
-        mock_state.won = False
-        mock_state.is_game_over = False
-        mock_get_state.return_value = mock_state
+        mock_state.guesses_made = 1
+        mock_state.won = True
+        mock_state.is_game_over = True
+        mock_record_guess.return_value = mock_state
 
         # Mock Guess Result
         mock_guess_result = MagicMock()
@@ -229,4 +219,6 @@ async def test_wojewodztwodle_guess_correct(async_client, mock_user_override):
         assert response.status_code == 200
         data = response.json()
         assert data["answer"] is True
-        assert mock_update_state.called
+        assert mock_record_guess.await_args.args[-1] is True
+        assert mock_state.points > 0
+        mock_record_game.assert_awaited_once()
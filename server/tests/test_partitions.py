@@ -0,0 +1,162 @@
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import partitions
+from db.models import CountrydleDay, CountrydleQuestion, User
+from db.repositories.question import CountrydleQuestionsRepository
+
+TABLE = CountrydleQuestion.__table__
+# Far from the dates other tests use, so their rows never share a partition
+TODAY = date(2031, 5, 10)
+
+
+@pytest.fixture
+async def session(pg_engine):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        yield session
+
+    async with pg_engine.begin() as conn:
+        await conn.execute(
+            text(
+                "TRUNCATE countrydle_questions, countrydle_questions_archive, "
+                "countrydle_days, users RESTART IDENTITY CASCADE"
+            )
+        )
+        for month in range(1, 13):
+            name = partitions.partition_name(TABLE, date(TODAY.year, month, 1))
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+@pytest.fixture
+async def questions(session):
+    """One question per month, from February to June."""
+    player = User(username="asker", email="asker@example.com", verified=True)
+    days = [CountrydleDay(date=date(2031, month, 10)) for month in range(2, 7)]
+    session.add_all([player, *days])
+    await session.flush()
+    session.add_all(
+        CountrydleQuestion(
+            user_id=player.id,
+            day_id=day.id,
+            original_question="Is it in Europe?",
+            valid=True,
+            answer=n % 2 == 0,
+            explanation="",
+        )
+        for n, day in enumerate(days)
+    )
+    await session.commit()
+    return player, days
+
+
+def scanned_relations(plan: dict) -> list[str]:
+    found = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", []):
+        found.extend(scanned_relations(child))
+    return found
+
+
+async def partition_counts(session) -> dict[str, int]:
+    result = await session.execute(
+        text(
+            "SELECT tableoid::regclass::text, count(*) FROM countrydle_questions "
+            "GROUP BY 1"
+        )
+    )
+    return dict(result.all())
+
+
+@pytest.mark.anyio
+async def test_day_date_is_filled_on_insert(session, questions):
+    _, days = questions
+
+    result = await session.execute(
+        text("SELECT day_date FROM countrydle_questions ORDER BY id")
+    )
+
+    assert result.scalars().all() == [day.date for day in days]
+
+
+@pytest.mark.anyio
+async def test_new_partitions_take_rows_from_default(session, questions):
+    async with session.bind.begin() as conn:
+        created = await partitions.ensure_partitions(conn, TABLE, TODAY)
+        assert await partitions.ensure_partitions(conn, TABLE, TODAY) == []
+
+    assert created == ["countrydle_questions_2031_05", "countrydle_questions_2031_06"]
+    assert await partition_counts(session) == {
+        "countrydle_questions_default": 3,
+        "countrydle_questions_2031_05": 1,
+        "countrydle_questions_2031_06": 1,
+    }
+
+
+@pytest.mark.anyio
+async def test_questions_of_a_day_touch_one_partition(session, questions):
+    player, days = questions
+    async with session.bind.begin() as conn:
+        await partitions.ensure_partitions(conn, TABLE, TODAY)
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(session.bind.sync_engine, "before_cursor_execute", capture)
+    try:
+        found = await CountrydleQuestionsRepository(session).get_user_day_questions(
+            player, days[3]
+        )
+    finally:
+        event.remove(session.bind.sync_engine, "before_cursor_execute", capture)
+
+    assert len(found) == 1
+    (statement, parameters), = statements
+    async with session.bind.connect() as conn:
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        )
+        plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    assert scanned_relations(plan[0]["Plan"]) == ["countrydle_questions_2031_05"]
+
+
+@pytest.mark.anyio
+async def test_old_partitions_are_archived(session, questions):
+    player, _ = questions
+    async with session.bind.begin() as conn:
+        await partitions.ensure_partitions(conn, TABLE, date(2031, 2, 1), ahead=4)
+        archived = await partitions.archive_partitions(conn, TABLE, TODAY, hot_months=2)
+
+    assert archived == ["countrydle_questions_2031_02", "countrydle_questions_2031_03"]
+    assert await partition_counts(session) == {
+        "countrydle_questions_2031_04": 1,
+        "countrydle_questions_2031_05": 1,
+        "countrydle_questions_2031_06": 1,
+    }
+    assert await session.scalar(
+        text("SELECT count(*) FROM countrydle_questions_archive")
+    ) == 2
+    assert await session.scalar(
+        text("SELECT to_regclass('countrydle_questions_2031_02')")
+    ) is None
+
+    # Archived questions still count towards the player's statistics
+    count, correct, incorrect = await CountrydleQuestionsRepository(
+        session
+    ).get_user_question_statistics(player)
+    assert (count, correct, incorrect) == (5, 3, 2)
+
+
+def test_migrations_skip_partitions():
+    assert partitions.is_partition(partitions.partition_name(TABLE, TODAY))
+    assert partitions.is_partition("powiatdle_questions_default")
+    assert not partitions.is_partition("countrydle_questions")
+    assert not partitions.is_partition("countrydle_questions_archive")
+    assert not partitions.is_partition("countrydle_states")
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import passwords
+from db.models import User
+
+
+@pytest.mark.anyio
+async def test_hashing_leaves_the_loop_free():
+    gaps = []
+
+    async def ticker():
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(0.005)
+            gaps.append(time.monotonic() - started)
+
+    ticks = asyncio.create_task(ticker())
+    started = time.monotonic()
+    hashed = await passwords.hash("Password123!")
+    elapsed = time.monotonic() - started
+    ticks.cancel()
+
+    assert await passwords.verify("Password123!", hashed)
+    assert max(gaps) < elapsed / 2
+
+
+@pytest.fixture
+async def player(pg_engine, monkeypatch, pg_app):
+    monkeypatch.setattr(
+        passwords, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5)
+    )
+    outdated = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        player = User(
+            username="player",
+            email="player@example.com",
+            hashed_password=outdated.hash("Password123!"),
+            verified=True,
+        )
+        session.add(player)
+        await session.commit()
+
+    return player
+
+
+@pytest.mark.anyio
+async def test_login_rehashes_with_the_current_cost(client, pg_engine, player):
+    login = {"username": "player", "password": "Password123!"}
+
+    first = await client.post("/login", data=login)
+    second = await client.post("/login", data=login)
+    wrong = await client.post("/login", data={**login, "password": "nope"})
+
+    assert (first.status_code, second.status_code, wrong.status_code) == (200, 200, 400)
+    async with AsyncSession(pg_engine) as session:
+        stored = await session.scalar(select(User.hashed_password))
+    assert stored.startswith("$2b$05$")
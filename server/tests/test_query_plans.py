@@ -0,0 +1,234 @@
+"""Runs EXPLAIN on the hot gameplay queries and fails on sequential scans.
+
+Needs a real Postgres (TEST_DATABASE_URL). Sequential scans are disabled for
+the EXPLAIN, so a `Seq Scan` in the plan means no index can serve the query.
+"""
+
+import json
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.repositories.countrydle import CountrydleRepository, CountrydleStateRepository
+from db.repositories.guess import CountrydleGuessRepository
+from db.repositories.statistics import ProfileStatisticsRepository
+from db.repositories.question import CountrydleQuestionsRepository
+from db.repositories.powiatdle import (
+    PowiatdleDayRepository,
+    PowiatdleGuessRepository,
+    PowiatdleQuestionRepository,
+    PowiatdleStateRepository,
+)
+from db.repositories.us_statedle import (
+    USStatedleDayRepository,
+    USStatedleGuessRepository,
+    USStatedleQuestionRepository,
+    USStatedleStateRepository,
+)
+from db.repositories.wojewodztwodle import (
+    WojewodztwodleDayRepository,
+    WojewodztwodleGuessRepository,
+    WojewodztwodleQuestionRepository,
+    WojewodztwodleStateRepository,
+)
+
+GAMES = ["countrydle", "powiatdle", "us_statedle", "wojewodztwodle"]
+USERS = 500
+DAYS = 400
+FIRST_DAY = date(2020, 1, 1)
+
+PLAYER = SimpleNamespace(id=42)
+DAY = SimpleNamespace(id=DAYS, date=FIRST_DAY + timedelta(days=DAYS))
+
+
+async def countrydle_queries(session):
+    await CountrydleRepository(session).get_today_country(DAY.date)
+    await CountrydleRepository(session).get_day_country_by_date(DAY.date)
+    await CountrydleStateRepository(session).get_state(PLAYER, DAY)
+    await CountrydleStateRepository(session).load_state(PLAYER, DAY)
+    await CountrydleGuessRepository(session).get_user_day_guesses(PLAYER, DAY)
+    await CountrydleQuestionsRepository(session).get_user_day_questions(PLAYER, DAY)
+    await ProfileStatisticsRepository(session).get_history("countrydle", PLAYER, DAY.id)
+
+
+async def powiatdle_queries(session):
+    await PowiatdleDayRepository(session).get_today_powiat(DAY.date)
+    await PowiatdleDayRepository(session).get_day_powiat_by_date(DAY.date)
+    await PowiatdleStateRepository(session).get_state(PLAYER, DAY)
+    await PowiatdleStateRepository(session).load_state(PLAYER, DAY)
+    await PowiatdleGuessRepository(session).get_user_day_guesses(PLAYER, DAY)
+    await PowiatdleQuestionRepository(session).get_user_day_questions(PLAYER, DAY)
+    await ProfileStatisticsRepository(session).get_history("powiatdle", PLAYER, DAY.id)
+
+
+async def us_statedle_queries(session):
+    await USStatedleDayRepository(session).get_today_us_state(DAY.date)
+    await USStatedleDayRepository(session).get_day_us_state_by_date(DAY.date)
+    await USStatedleStateRepository(session).get_state(PLAYER, DAY)
+    await USStatedleStateRepository(session).load_state(PLAYER, DAY)
+    await USStatedleGuessRepository(session).get_user_day_guesses(PLAYER, DAY)
+    await USStatedleQuestionRepository(session).get_user_day_questions(PLAYER, DAY)
+    await ProfileStatisticsRepository(session).get_history("us_statedle", PLAYER, DAY.id)
+
+
+async def wojewodztwodle_queries(session):
+    await WojewodztwodleDayRepository(session).get_today_wojewodztwo(DAY.date)
+    await WojewodztwodleDayRepository(session).get_day_wojewodztwo_by_date(DAY.date)
+    await WojewodztwodleStateRepository(session).get_state(PLAYER, DAY)
+    await WojewodztwodleStateRepository(session).load_state(PLAYER, DAY)
+    await WojewodztwodleGuessRepository(session).get_user_day_guesses(PLAYER, DAY)
+    await WojewodztwodleQuestionRepository(session).get_user_day_questions(
+        PLAYER, DAY
+    )
+    await ProfileStatisticsRepository(session).get_history("wojewodztwodle", PLAYER, DAY.id)
+
+
+HOT_QUERIES = {
+    "countrydle": countrydle_queries,
+    "powiatdle": powiatdle_queries,
+    "us_statedle": us_statedle_queries,
+    "wojewodztwodle": wojewodztwodle_queries,
+}
+
+
+@pytest.fixture(scope="module")
+async def seeded_engine(pg_engine):
+    async with pg_engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, verified) "
+                "SELECT g, 'user' || g, 'user' || g || '@example.com', true "
+                "FROM generate_series(1, :users) g"
+            ),
+            {"users": USERS},
+        )
+        for game in GAMES:
+            await conn.execute(
+                text(
+                    f"INSERT INTO {game}_days (id, date) "
+                    "SELECT g, CAST(:first_day AS date) + g FROM generate_series(1, :days) g"
+                ),
+                {"first_day": FIRST_DAY, "days": DAYS},
+            )
+            players = (
+                "FROM generate_series(1, :users) u, generate_series(8, :days, 8) d"
+            )
+            await conn.execute(
+                text(
+                    f"INSERT INTO {game}_states (user_id, day_id, remaining_questions, "
+                    "remaining_guesses, questions_asked, guesses_made, is_game_over, "
+                    f"won, points) SELECT u, d, 0, 0, 0, 0, true, false, 0 {players}"
+                ),
+                {"users": USERS, "days": DAYS},
+            )
+            await conn.execute(
+                text(
+                    f"INSERT INTO {game}_guesses (user_id, day_id, guess, answer) "
+                    f"SELECT u, d, 'guess', false {players}"
+                ),
+                {"users": USERS, "days": DAYS},
+            )
+            await conn.execute(
+                text(
+                    f"INSERT INTO {game}_questions (user_id, day_id, day_date, "
+                    "original_question, valid, explanation) SELECT u, d, "
+                    f"CAST(:first_day AS date) + d, 'question', true, '' {players}"
+                ),
+                {"users": USERS, "days": DAYS, "first_day": FIRST_DAY},
+            )
+
+    # VACUUM sets the visibility map, without which index-only scans look no cheaper
+    async with pg_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE"))
+
+    yield pg_engine
+
+    async with pg_engine.begin() as conn:
+        for game in GAMES:
+            await conn.execute(
+                text(
+                    f"TRUNCATE {game}_questions, {game}_guesses, {game}_states, "
+                    f"{game}_days RESTART IDENTITY CASCADE"
+                )
+            )
+        await conn.execute(text("TRUNCATE users RESTART IDENTITY CASCADE"))
+
+
+@asynccontextmanager
+async def captured_sql(engine):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+
+def seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan["Node Type"] == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("game", GAMES)
+async def test_hot_queries_use_indexes(seeded_engine, game):
+    async with captured_sql(seeded_engine) as statements:
+        async with AsyncSession(seeded_engine) as session:
+            await HOT_QUERIES[game](session)
+
+    selects = [(s, p) for s, p in statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects
+
+    async with seeded_engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in selects:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            scanned = seq_scans(plan[0]["Plan"])
+            assert not scanned, f"Sequential scan on {scanned} for:\n{statement}"
+
+
+def index_scans(plan: dict) -> list[tuple[str, str]]:
+    found = []
+    if "Index Name" in plan:
+        found.append((plan["Node Type"], plan["Index Name"]))
+    for child in plan.get("Plans", []):
+        found.extend(index_scans(child))
+    return found
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("game", GAMES)
+async def test_history_page_is_index_only(seeded_engine, game):
+    async with captured_sql(seeded_engine) as statements:
+        async with AsyncSession(seeded_engine) as session:
+            await ProfileStatisticsRepository(session).get_history(game, PLAYER, DAY.id)
+
+    (statement, parameters), = statements
+    async with seeded_engine.connect() as conn:
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        )
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+    assert ("Index Only Scan", f"ix_{game}_states_history") in index_scans(plan[0]["Plan"])
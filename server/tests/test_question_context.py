@@ -0,0 +1,106 @@
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from db.models import Country, CountryFragment, CountrydleDay, CountrydleQuestion
+from qdrant.utils import Fragment, fragment_refs
+from users.utils import get_current_user
+from utils import question_context
+
+
+def test_fragments_are_stored_by_reference():
+    fragments = [Fragment(text="a", id=4, score=0.8), Fragment(text="b", id=5)]
+
+    assert fragment_refs(fragments) == [
+        {"id": 4, "score": 0.8},
+        {"id": 5, "score": None},
+    ]
+    # Points synced with UUIDs cannot be traced back to their rows
+    assert fragment_refs([Fragment(text="a"), *fragments]) is None
+
+
+@pytest.fixture
+async def session(pg_engine):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        yield session
+
+    async with pg_engine.begin() as conn:
+        await conn.execute(
+            text(
+                "TRUNCATE countrydle_questions, country_fragments, countrydle_days, "
+                "countries RESTART IDENTITY CASCADE"
+            )
+        )
+
+
+@pytest.mark.anyio
+async def test_context_is_rebuilt_in_order(session):
+    country = Country(name="Chile", md_file="chile.md")
+    session.add(country)
+    await session.flush()
+    first, second, third = (
+        CountryFragment(country_id=country.id, text=t) for t in ("One.", "Two.", "Three.")
+    )
+    day = CountrydleDay(country_id=country.id, date=date(2026, 3, 1))
+    session.add_all([first, second, third, day])
+    await session.flush()
+    question = CountrydleQuestion(
+        day_id=day.id,
+        original_question="Is it long?",
+        valid=True,
+        answer=True,
+        explanation="",
+        context_fragments=[
+            {"id": third.id, "score": 0.9},
+            {"id": first.id, "score": None},
+            {"id": 999, "score": None},
+        ],
+    )
+    session.add(question)
+    await session.commit()
+
+    context = await question_context.get_context("countrydle", question, session)
+
+    assert context.context == "Three.\n[ ... ]\nOne."
+    assert [fragment.id for fragment in context.fragments] == [third.id, first.id, 999]
+    assert context.fragments[0].score == 0.9
+
+
+@pytest.fixture
+def player():
+    player = SimpleNamespace(id=1, username="player")
+    app.dependency_overrides[get_current_user] = lambda: player
+    yield player
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+@pytest.mark.anyio
+async def test_context_is_hidden_until_game_over(async_client, player):
+    question = SimpleNamespace(id=7, context="Stored text.", context_fragments=None)
+    state = SimpleNamespace(is_game_over=False, questions=[question])
+
+    with (
+        patch("utils.daily_targets.get_today", new_callable=AsyncMock),
+        patch(
+            "db.repositories.powiatdle.PowiatdleStateRepository.load_state",
+            new_callable=AsyncMock,
+            return_value=state,
+        ),
+    ):
+        playing = await async_client.get("/powiatdle/question/7/context")
+        state.is_game_over = True
+        finished = await async_client.get("/powiatdle/question/7/context")
+        missing = await async_client.get("/powiatdle/question/8/context")
+
+    assert playing.status_code == 400
+    assert finished.json() == {
+        "question_id": 7,
+        "context": "Stored text.",
+        "fragments": [],
+    }
+    assert missing.status_code == 404
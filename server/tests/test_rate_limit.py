@@ -0,0 +1,126 @@
+"""Clients are limited per class of endpoints, in the process or through Postgres.
+
+The shared buckets need a real Postgres (TEST_DATABASE_URL).
+"""
+
+import asyncio
+
+import pytest
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.repositories.rate_limit import RateLimitRepository
+from utils import rate_limit
+from utils.rate_limit import Limit
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "question", Limit(burst=2, per_minute=60))
+    monkeypatch.setitem(rate_limit.LIMITS, "play", Limit(burst=1, per_minute=6))
+
+
+def request(path="/countrydle/question", ip="203.0.113.5", headers=()) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": path,
+            "query_string": b"",
+            "headers": [(name.encode(), value.encode()) for name, value in headers],
+            "client": (ip, 40000),
+        }
+    )
+
+
+async def send(*args, **kwargs):
+    async def call_next(request):
+        return JSONResponse({"ok": True})
+
+    return await rate_limit.handle(request(*args, **kwargs), call_next)
+
+
+@pytest.mark.anyio
+async def test_burst_then_429(limits):
+    assert [(await send()).status_code for _ in range(3)] == [200, 200, 429]
+
+    limited = await send()
+    assert limited.headers["Retry-After"] == "1"
+    # Guessing and other clients have buckets of their own
+    assert (await send("/countrydle/guess")).status_code == 200
+    assert (await send(ip="203.0.113.6")).status_code == 200
+    assert rate_limit.stats()["limited"]["question"] >= 2
+
+
+@pytest.mark.anyio
+async def test_bucket_refills(limits, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now)
+    assert (await send("/powiatdle/guess")).status_code == 200
+    limited = await send("/powiatdle/guess")
+    assert (limited.status_code, limited.headers["Retry-After"]) == (429, "10")
+
+    now += 10
+    assert (await send("/powiatdle/guess")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_unlimited_routes_and_proxies(limits, monkeypatch):
+    assert [(await send("/countrydle/state")).status_code for _ in range(5)] == [200] * 5
+
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", {"10.0.0.2"})
+    behind_proxy = [
+        (await send(ip="10.0.0.2", headers=[("x-real-ip", f"198.51.100.{n}")])).status_code
+        for n in range(3)
+    ]
+    assert behind_proxy == [200, 200, 200]
+
+
+@pytest.fixture
+async def buckets(pg_engine, limits, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_SHARED", True)
+    monkeypatch.setattr(
+        rate_limit, "sessions", async_sessionmaker(pg_engine, expire_on_commit=False)
+    )
+    yield
+    async with pg_engine.begin() as conn:
+        await conn.execute(text("TRUNCATE rate_limit_buckets"))
+
+
+@pytest.mark.anyio
+async def test_shared_buckets(buckets):
+    assert [(await send()).status_code for _ in range(3)] == [200, 200, 429]
+    assert (await send()).headers["Retry-After"] == "1"
+    # Nothing of it was kept in the process
+    assert rate_limit.stats()["clients"] == 0
+
+
+@pytest.mark.anyio
+async def test_workers_share_the_last_tokens(pg_engine, buckets):
+    async def take():
+        async with AsyncSession(pg_engine) as session:
+            retry_after = await RateLimitRepository(session).take("race", 3, 0.01)
+            await session.commit()
+            return retry_after
+
+    retry_afters = await asyncio.gather(*(take() for _ in range(8)))
+
+    assert retry_afters.count(0.0) == 3
+    assert all(50 < retry_after <= 100 for retry_after in retry_afters if retry_after)
+
+
+@pytest.mark.anyio
+async def test_cross_origin_429(client, monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "question", Limit(burst=0, per_minute=60))
+    origin = "http://localhost:5173"
+
+    response = await client.post(
+        "/countrydle/question", json={"question": "Is it big?"}, headers={"Origin": origin}
+    )
+
+    assert response.status_code == 429
+    # Browsers would otherwise hide the response, and the header, from the client
+    assert response.headers["Access-Control-Allow-Origin"] == origin
+    assert "Retry-After" in response.headers["Access-Control-Expose-Headers"]
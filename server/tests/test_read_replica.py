@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import db
+from db.replica import ReplicaMonitor
+
+
+@pytest.fixture
+async def replica(pg_engine, pg_read_engine, monkeypatch):
+    read_engine = create_async_engine(
+        pg_read_engine.url, execution_options={"postgresql_readonly": True}
+    )
+    monitor = ReplicaMonitor(read_engine, max_lag=30)
+    monkeypatch.setattr(db, "replica", monitor)
+    monkeypatch.setattr(
+        db, "ReadSessionLocal", sessionmaker(read_engine, class_=AsyncSession)
+    )
+    monkeypatch.setattr(db, "AsyncSessionLocal", sessionmaker(pg_engine, class_=AsyncSession))
+
+    # Only the "replica" knows this player, so responses show where they were read
+    async with pg_read_engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, verified) "
+                "VALUES (1, 'reader', 'reader@example.com', true)"
+            )
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO user_game_scores (game, user_id, points, wins, games_played, "
+                "streak, longest_streak) VALUES ('powiatdle', 1, 300, 1, 1, 1, 1)"
+            )
+        )
+
+    yield monitor
+
+    await read_engine.dispose()
+    async with pg_read_engine.begin() as conn:
+        await conn.execute(text("TRUNCATE users RESTART IDENTITY CASCADE"))
+
+
+@pytest.mark.anyio
+async def test_reads_go_to_replica(async_client, replica):
+    response = await async_client.get("/powiatdle/leaderboard")
+
+    assert [e["username"] for e in response.json()] == ["reader"]
+    assert replica.stats() == {"usable": True, "lag": 0.0, "fallbacks": 0}
+
+
+@pytest.mark.anyio
+async def test_replica_is_read_only(replica):
+    sessions = db.get_read_db()
+    session = await anext(sessions)
+
+    with pytest.raises(DBAPIError, match="read-only"):
+        await session.execute(text("DELETE FROM users"))
+    await sessions.aclose()
+
+
+@pytest.mark.anyio
+async def test_lagging_replica_falls_back(async_client, replica):
+    replica.max_lag = -1
+
+    response = await async_client.get("/powiatdle/leaderboard")
+
+    assert response.json() == []
+    assert replica.stats()["fallbacks"] == 1
+
+
+@pytest.mark.anyio
+async def test_unreachable_replica_falls_back():
+    monitor = ReplicaMonitor(
+        create_async_engine("postgresql+asyncpg://postgres@127.0.0.1:1/none"), max_lag=30
+    )
+
+    assert not await monitor.usable()
+    assert not await monitor.usable()
+    assert monitor.stats() == {"usable": False, "lag": None, "fallbacks": 2}
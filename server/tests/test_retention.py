@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import CountrydleDay, CountrydleQuestion, User, UserPoints
+from utils import retention
+
+TODAY = date(2026, 3, 20)
+
+
+@pytest.fixture
+async def session(pg_engine, monkeypatch):
+    monkeypatch.setattr(retention, "QUESTION_BATCH", 2)
+    monkeypatch.setattr(retention, "USER_BATCH", 1)
+    monkeypatch.setattr(retention, "THROTTLE", 0)
+
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        yield session
+
+    async with pg_engine.begin() as conn:
+        await conn.execute(
+            text(
+                "TRUNCATE countrydle_questions, countrydle_days, user_points, users "
+                "RESTART IDENTITY CASCADE"
+            )
+        )
+
+
+def question(day, user=None) -> CountrydleQuestion:
+    return CountrydleQuestion(
+        user_id=user.id if user else None,
+        day_id=day.id,
+        original_question="Is it an island?",
+        valid=True,
+        answer=False,
+        explanation="",
+    )
+
+
+@pytest.mark.anyio
+async def test_old_guest_and_test_data_is_deleted(session, pg_engine):
+    old = datetime.now() - timedelta(days=2)
+    testers = [
+        User(username=f"pytest_{n}", email=f"t{n}@example.com", created_at=old)
+        for n in range(3)
+    ]
+    running = User(username="test_running", email="running@example.com")
+    player = User(username="player", email="player@example.com", created_at=old)
+    # Look like test accounts only if "_" were a wildcard
+    lookalikes = [
+        User(username=name, email=f"{name}@example.com", created_at=old)
+        for name in ("tester", "testowy", "guesthouse", "ask_question_fan")
+    ]
+    old_day = CountrydleDay(date=TODAY - timedelta(days=30))
+    recent_day = CountrydleDay(date=TODAY - timedelta(days=1))
+    session.add_all([*testers, *lookalikes, running, player, old_day, recent_day])
+    await session.flush()
+    session.add_all([question(old_day) for _ in range(5)])
+    session.add_all([question(recent_day), question(old_day, player)])
+    session.add_all([question(old_day, tester) for tester in testers])
+    session.add_all([UserPoints(user_id=user.id) for user in (*testers, player)])
+    await session.commit()
+
+    report = await retention.run(pg_engine, TODAY)
+
+    assert report.finished
+    assert report.deleted["countrydle_questions"] == 5 + 3
+    assert report.deleted["user_points"] == 3
+    assert report.deleted["users"] == 3
+    assert report.rows == 5 + 3 + 3 + 3
+    # Bounded chunks: three for the guest questions, one per test user
+    assert report.chunks >= 3 + 3
+
+    usernames = await session.scalars(select(User.username).order_by(User.username))
+    assert usernames.all() == [
+        "ask_question_fan",
+        "guesthouse",
+        "player",
+        "test_running",
+        "tester",
+        "testowy",
+    ]
+    remaining = await session.execute(
+        select(CountrydleQuestion.user_id, CountrydleQuestion.day_date)
+    )
+    assert sorted(remaining.all(), key=str) == sorted(
+        [(None, recent_day.date), (player.id, old_day.date)], key=str
+    )
+    assert await session.scalar(select(func.count()).select_from(UserPoints)) == 1
+
+    assert retention.stats()["rows"] == report.rows
@@ -0,0 +1,127 @@
+"""State endpoints answer conditional GETs, finished games from memory.
+
+Needs a real Postgres (TEST_DATABASE_URL).
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from db import telemetry
+from db.models import Powiat, PowiatdleDay, PowiatdleState, User
+from db.repositories.powiatdle import PowiatdleStateRepository
+from powiatdle import game_rules
+from users.utils import get_current_or_guest_user
+from utils import daily_targets
+
+pytestmark = pytest.mark.truncate("users", "powiaty")
+
+
+@pytest.fixture
+async def game(pg_engine, pg_app):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        user = User(username="player", email="player@example.com", verified=True)
+        day = PowiatdleDay(date=daily_targets.game_today(), powiat=Powiat(nazwa="krakowski"))
+        session.add_all([user, day])
+        await session.commit()
+        # Warm, as it is in production, so only the state is left to query
+        await daily_targets.get_today("powiatdle", session)
+
+    app.dependency_overrides[get_current_or_guest_user] = lambda: user
+    return user, day
+
+
+async def finish(pg_engine):
+    async with AsyncSession(pg_engine) as session:
+        state = await session.scalar(select(PowiatdleState))
+        state.is_game_over = True
+        await session.commit()
+
+
+@pytest.mark.anyio
+async def test_changes_bump_the_version(pg_engine, game):
+    user, day = game
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        repository = PowiatdleStateRepository(session)
+        state = await repository.reserve_question(user, day, game_rules)
+        await session.commit()
+        first = state.version
+        state = await repository.reserve_question(user, day, game_rules)
+        await session.commit()
+        assert state.version == first + 1
+
+        # Plain ORM updates bump it as well and bring the new value back
+        state.points = 100
+        await session.commit()
+        assert state.version == first + 2
+
+
+@pytest.mark.anyio
+async def test_game_in_progress_is_revalidated(client, pg_engine, game):
+    user, day = game
+    first = await client.get("/powiatdle/state")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    with telemetry.watch() as finished:
+        unchanged = await client.get("/powiatdle/state", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert [db.queries for _, db in finished] == [1]
+
+    async with AsyncSession(pg_engine) as session:
+        await PowiatdleStateRepository(session).reserve_question(user, day, game_rules)
+        await session.commit()
+
+    changed = await client.get("/powiatdle/state", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["state"]["questions_asked"] == 1
+
+    since = await client.get(
+        "/powiatdle/state", headers={"If-Modified-Since": changed.headers["Last-Modified"]}
+    )
+    assert since.status_code == 304
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("url", ["/powiatdle/state", "/powiatdle/reveal"])
+async def test_finished_game_needs_no_database(client, pg_engine, game, url):
+    await client.get("/powiatdle/state")
+    await finish(pg_engine)
+
+    first = await client.get(url)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"].startswith("private, max-age=")
+
+    with telemetry.watch() as finished:
+        again = await client.get(url)
+        unchanged = await client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert again.json() == first.json()
+    assert unchanged.status_code == 304
+    assert [db.queries for _, db in finished] == [0, 0]
+
+
+@pytest.mark.anyio
+async def test_asked_question_changes_the_etag(client, game):
+    during = {}
+
+    async def enhance(question):
+        # The question is reserved and committed, its answer not yet
+        during["state"] = await client.get("/powiatdle/state")
+        return MagicMock(
+            valid=False, original_question=question, question=question, explanation="No."
+        )
+
+    with patch("powiatdle.utils.enhance_question", AsyncMock(side_effect=enhance)):
+        asked = await client.post("/powiatdle/question", json={"question": "Is it big?"})
+    assert asked.status_code == 200
+
+    etag = during["state"].headers["ETag"]
+    assert during["state"].json()["questions"] == []
+    after = await client.get("/powiatdle/state", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert [q["original_question"] for q in after.json()["questions"]] == ["Is it big?"]
@@ -0,0 +1,133 @@
+"""Questions and guesses are taken with one conditional UPDATE each.
+
+Needs a real Postgres (TEST_DATABASE_URL).
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import app
+from db.models import Powiat, PowiatdleDay, PowiatdleQuestion, PowiatdleState, User
+from db.repositories.powiatdle import PowiatdleStateRepository
+from powiatdle import game_rules
+from users.utils import get_current_or_guest_user
+from utils import daily_targets
+
+pytestmark = pytest.mark.truncate("users", "powiaty")
+
+
+@pytest.fixture
+async def game(pg_engine, pg_app):
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        user = User(username="player", email="player@example.com", verified=True)
+        day = PowiatdleDay(date=daily_targets.game_today(), powiat=Powiat(nazwa="krakowski"))
+        session.add_all([user, day])
+        await session.commit()
+
+    app.dependency_overrides[get_current_or_guest_user] = lambda: user
+    return user, day
+
+
+async def set_state(pg_engine, user, day, **values) -> None:
+    async with AsyncSession(pg_engine) as session:
+        session.add(PowiatdleState(user_id=user.id, day_id=day.id, **values))
+        await session.commit()
+
+
+async def get_state(pg_engine) -> PowiatdleState:
+    async with AsyncSession(pg_engine) as session:
+        return await session.scalar(select(PowiatdleState))
+
+
+@pytest.mark.anyio
+async def test_first_question_starts_the_game(pg_engine, game):
+    user, day = game
+    async with AsyncSession(pg_engine, expire_on_commit=False) as session:
+        state = await PowiatdleStateRepository(session).reserve_question(
+            user, day, game_rules
+        )
+        await session.commit()
+
+    assert (state.remaining_questions, state.questions_asked) == (
+        game_rules.config.max_questions - 1,
+        1,
+    )
+    assert state.remaining_guesses == game_rules.config.max_guesses
+
+
+@pytest.mark.anyio
+async def test_last_question_goes_to_one_request(pg_engine, game):
+    user, day = game
+    await set_state(pg_engine, user, day, remaining_questions=1, questions_asked=14)
+
+    async def reserve():
+        async with AsyncSession(pg_engine) as session:
+            state = await PowiatdleStateRepository(session).reserve_question(
+                user, day, game_rules
+            )
+            await asyncio.sleep(0.1)  # Holds the row lock while the other waits
+            await session.commit()
+            return state
+
+    results = await asyncio.gather(reserve(), reserve())
+
+    assert sorted(state is None for state in results) == [False, True]
+    state = await get_state(pg_engine)
+    assert (state.remaining_questions, state.questions_asked) == (0, 15)
+
+
+@pytest.mark.anyio
+async def test_failed_answer_gives_the_question_back(async_client, pg_engine, game):
+    user, day = game
+    await set_state(pg_engine, user, day, remaining_questions=5, questions_asked=10)
+
+    with patch(
+        "powiatdle.utils.enhance_question",
+        new_callable=AsyncMock,
+        side_effect=RuntimeError("LLM unavailable"),
+    ):
+        with pytest.raises(RuntimeError):
+            await async_client.post("/powiatdle/question", json={"question": "Is it big?"})
+
+    state = await get_state(pg_engine)
+    assert (state.remaining_questions, state.questions_asked) == (5, 10)
+    async with AsyncSession(pg_engine) as session:
+        assert await session.scalar(select(PowiatdleQuestion)) is None
+
+
+@pytest.mark.anyio
+async def test_last_guess_ends_the_game(async_client, pg_engine, game):
+    user, day = game
+    await set_state(pg_engine, user, day, remaining_guesses=1, guesses_made=2)
+
+    response = await async_client.post("/powiatdle/guess", json={"guess": "tatrzanski"})
+    assert response.status_code == 200, response.text
+
+    state = await get_state(pg_engine)
+    assert (state.remaining_guesses, state.is_game_over, state.won) == (0, True, False)
+
+    response = await async_client.post(
+        "/powiatdle/guess", json={"guess": "krakowski", "powiat_id": day.powiat_id}
+    )
+    assert response.status_code == 400
+    state = await get_state(pg_engine)
+    assert (state.guesses_made, state.won) == (3, False)
+
+
+@pytest.mark.anyio
+async def test_correct_guess_wins(async_client, pg_engine, game):
+    user, day = game
+    await set_state(pg_engine, user, day, remaining_guesses=3, remaining_questions=15)
+
+    response = await async_client.post(
+        "/powiatdle/guess", json={"guess": "krakowski", "powiat_id": day.powiat_id}
+    )
+
+    assert response.json()["answer"] is True
+    state = await get_state(pg_engine)
+    assert (state.remaining_guesses, state.is_game_over, state.won) == (2, True, True)
+    assert state.points > 0
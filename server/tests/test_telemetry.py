@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import telemetry
+
+
+@pytest.mark.anyio
+async def test_track_records_statements(pg_engine):
+    with telemetry.track() as db:
+        async with AsyncSession(pg_engine) as session:
+            for n in range(5):
+                await session.execute(text(f"SELECT {n}"))
+            await session.commit()
+
+    assert (db.queries, db.commits) == (5, 1)
+    assert db.db_time > 0
+    assert len(db.slowest) == telemetry.SLOWEST_KEPT
+    assert db.slowest == sorted(db.slowest, key=lambda entry: entry[0], reverse=True)
+
+
+def test_repeated_statement_is_reported(caplog):
+    db = telemetry.RequestTelemetry()
+    for _ in range(telemetry.N_PLUS_ONE_THRESHOLD):
+        db.record("SELECT * FROM countries WHERE id = $1", 0.001)
+    db.record("SELECT 1", 0.002)
+
+    with caplog.at_level(logging.WARNING):
+        telemetry.record("GET /test/n-plus-one", db)
+
+    stats = telemetry.stats()["GET /test/n-plus-one"]
+    assert (stats["requests"], stats["queries"], stats["n_plus_one"]) == (
+        1,
+        telemetry.N_PLUS_ONE_THRESHOLD + 1,
+        1,
+    )
+    assert "SELECT * FROM countries" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_debug_headers(async_client, monkeypatch):
+    monkeypatch.setattr(telemetry, "DEBUG", True)
+
+    response = await async_client.get("/version")
+
+    assert response.headers["X-DB-Queries"] == "0"
+    assert telemetry.stats()["GET /version"]["requests"] >= 1
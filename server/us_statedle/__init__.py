@@ -1,17 +1,23 @@
+from datetime import date
 from typing import Union, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db
+from db import get_db, get_read_db
 from db.models import User
+from db.repositories.leaderboard import LeaderboardRepository
+from db.repositories.statistics import (
+    HISTORY_LIMIT,
+    MAX_HISTORY_LIMIT,
+    ProfileStatisticsRepository,
+)
 from db.repositories.us_statedle import (
     USStatedleDayRepository,
     USStatedleStateRepository,
     USStatedleGuessRepository,
     USStatedleQuestionRepository,
 )
-from db.repositories.us_state import USStateRepository
 from schemas.us_statedle import (
     USStateDisplay,
     USStatedleStateResponse,
@@ -26,9 +32,12 @@ from schemas.us_statedle import (
     DayUSStateDisplay,
     USStatedleSyncSchema,
 )
+from schemas.fragment import QuestionContext
+from schemas.statistics import GameHistoryEntry
 from users.utils import get_current_or_guest_user, get_current_user
+from utils import catalogs, daily_targets, history, question_context, state_cache
 import us_statedle.utils as uutils
-from game_logic import GameConfig, GameRules, GameState
+from game_logic import GameConfig, GameRules
 
 router = APIRouter(prefix="/us_statedle")
 
@@ -36,34 +45,49 @@ USSTATEDLE_CONFIG = GameConfig(max_questions=8, max_guesses=3)
 game_rules = GameRules(USSTATEDLE_CONFIG)
 
 
-def db_state_to_game_state(db_state) -> GameState:
-    return GameState(
-        questions_used=USSTATEDLE_CONFIG.max_questions - db_state.remaining_questions,
-        guesses_used=USSTATEDLE_CONFIG.max_guesses - db_state.remaining_guesses,
-        is_won=db_state.won,
-        is_lost=db_state.is_game_over and not db_state.won,
-    )
-
-
 @router.post("/sync", response_model=USStatedleStateResponse)
 async def sync_guest_data(
     sync_data: USStatedleSyncSchema,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
 ):
-    from datetime import datetime
-    from sqlalchemy import update
-    
-    try:
-        game_date = datetime.strptime(sync_data.date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-        
-    day_state = await USStatedleDayRepository(session).get_day_us_state_by_date(game_date)
-    if not day_state:
-        raise HTTPException(status_code=404, detail="Game for this date not found.")
-
-    state = await USStatedleStateRepository(session).get_state(user, day_state)
+    # Imported here, since the bulk /sync is built on these routers
+    from sync import sync_game
+
+    # The outcome is worked out from the guesses, never taken from the client
+    await sync_game("us_statedle", sync_data, user, session)
+    response = await get_state(user, session)
+    await session.commit()
+    return response
+
+
+@router.get("/history", response_model=List[DayUSStateDisplay])
+async def get_history(
+    request: Request,
+    before: date | None = Query(None, description="Only days before this date"),
+    limit: int = Query(history.HISTORY_PAGE_SIZE, ge=1, le=history.MAX_HISTORY_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_db),
+):
+    page = await history.get_page("us_statedle", session, before, limit)
+    return history.respond(request, page.etag, page.days)
+
+
+@router.get("/history/me", response_model=List[GameHistoryEntry])
+async def get_my_history(
+    before: int | None = Query(None, description="Day id of the last entry already loaded"),
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=MAX_HISTORY_LIMIT),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await ProfileStatisticsRepository(session).get_history(
+        "us_statedle", user, before, limit
+    )
+
+
+async def state_response(user: User, day_state, session: AsyncSession):
+    """Loads the user's state, starting the game if need be, with the response for it."""
+    state = await USStatedleStateRepository(session).load_state(user, day_state)
+
     if state is None:
         state = await USStatedleStateRepository(session).create_state(
             user,
@@ -71,66 +95,36 @@ async def sync_guest_data(
             max_questions=USSTATEDLE_CONFIG.max_questions,
             max_guesses=USSTATEDLE_CONFIG.max_guesses,
         )
-    
-    if state.questions_asked > 0 or state.guesses_made > 0:
-        return await get_state(user, session)
+        await session.commit()
+        guesses, questions = [], []
+    else:
+        guesses, questions = state.guesses, state.questions
 
-    if sync_data.questions:
-        from db.models import USStatedleQuestion
-        await session.execute(
-            update(USStatedleQuestion)
-            .where(
-                USStatedleQuestion.id.in_(sync_data.questions), 
-                USStatedleQuestion.user_id == None,
-                USStatedleQuestion.day_id == day_state.id
-            )
-            .values(user_id=user.id)
-        )
-
-    for guess in sync_data.guesses:
-        is_correct = False
-        if guess.us_state_id:
-            is_correct = guess.us_state_id == day_state.us_state_id
-            
-        guess_create = USStateGuessCreate(
-            guess=guess.guess,
-            us_state_id=guess.us_state_id,
-            day_id=day_state.id,
-            user_id=user.id,
-            answer=is_correct,
+    if state.is_game_over:
+        return state, USStatedleEndStateResponse(
+            user=user,
+            date=str(day_state.date),
+            state=USStatedleStateSchema.model_validate(state),
+            guesses=guesses,
+            questions=questions,
+            us_state=day_state.us_state,
         )
-        await USStatedleGuessRepository(session).add_guess(guess_create)
-
-    state.remaining_questions = sync_data.state.remaining_questions
-    state.remaining_guesses = sync_data.state.remaining_guesses
-    state.questions_asked = sync_data.state.questions_asked
-    state.guesses_made = sync_data.state.guesses_made
-    state.is_game_over = sync_data.state.is_game_over
-    state.won = sync_data.state.won
-    
-    if state.won:
-        state.points = await USStatedleStateRepository(session).calc_points(state)
-        
-    await USStatedleStateRepository(session).update_state(state)
-    
-    return await get_state(user, session)
-
 
-@router.get("/history", response_model=List[DayUSStateDisplay])
-async def get_history(session: AsyncSession = Depends(get_db)):
-    return await USStatedleDayRepository(session).get_history()
+    return state, USStatedleStateResponse(
+        user=user,
+        date=str(day_state.date),
+        state=USStatedleStateSchema.model_validate(state),
+        guesses=guesses,
+        questions=questions,
+        us_state=None,
+    )
 
 
-@router.get(
-    "/state", response_model=Union[USStatedleStateResponse, USStatedleEndStateResponse]
-)
 async def get_state(
-    user: User | None = Depends(get_current_or_guest_user),
-    session: AsyncSession = Depends(get_db),
-):
-    day_state = await USStatedleDayRepository(session).get_today_us_state()
-    if not day_state:
-        day_state = await USStatedleDayRepository(session).generate_new_day_us_state()
+    user: User | None, session: AsyncSession
+) -> Union[USStatedleStateResponse, USStatedleEndStateResponse]:
+    """What GET /state answers, without the validators; the sync endpoints answer with it too."""
+    day_state = await daily_targets.get_today("us_statedle", session)
 
     if user is None:
         return USStatedleStateResponse(
@@ -153,57 +147,61 @@ async def get_state(
             us_state=None,
         )
 
-    state = await USStatedleStateRepository(session).get_state(user, day_state)
-
-    if state is None:
-        state = await USStatedleStateRepository(session).create_state(
-            user,
-            day_state,
-            max_questions=USSTATEDLE_CONFIG.max_questions,
-            max_guesses=USSTATEDLE_CONFIG.max_guesses,
-        )
+    _, response = await state_response(user, day_state, session)
+    return response
 
-    guesses = await USStatedleGuessRepository(session).get_user_day_guesses(
-        user, day_state
-    )
-    questions = await USStatedleQuestionRepository(session).get_user_day_questions(
-        user, day_state
-    )
 
-    if state.is_game_over:
-        us_state = await USStateRepository(session).get(day_state.us_state_id)
-        return USStatedleEndStateResponse(
-            user=user,
-            date=str(day_state.date),
-            state=USStatedleStateSchema.model_validate(state),
-            guesses=guesses,
-            questions=questions,
-            us_state=us_state,
-        )
+@router.get(
+    "/state", response_model=Union[USStatedleStateResponse, USStatedleEndStateResponse]
+)
+async def read_state(
+    request: Request,
+    user: User | None = Depends(get_current_or_guest_user),
+    session: AsyncSession = Depends(get_db),
+):
+    if user is None:
+        return await get_state(user, session)
 
-    return USStatedleStateResponse(
-        user=user,
-        date=str(day_state.date),
-        state=USStatedleStateSchema.model_validate(state),
-        guesses=guesses,
-        questions=questions,
-        us_state=None,
+    day_state = await daily_targets.get_today("us_statedle", session)
+    return await state_cache.respond(
+        request,
+        "us_statedle",
+        "state",
+        user,
+        day_state,
+        USStatedleStateRepository(session),
+        lambda: state_response(user, day_state, session),
     )
 
 
-from schemas.countrydle import LeaderboardEntry
+from schemas.countrydle import LeaderboardEntry, LeaderboardRank
 
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(session: AsyncSession = Depends(get_db)):
-    return await USStatedleStateRepository(session).get_leaderboard()
+async def get_leaderboard(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await LeaderboardRepository(session).get_leaderboard(
+        "us_statedle", limit, offset
+    )
+
+
+@router.get("/leaderboard/me", response_model=LeaderboardRank)
+async def get_my_rank(
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await LeaderboardRepository(session).get_rank("us_statedle", user)
 
 
 @router.get("/states", response_model=List[USStateDisplay])
 async def get_us_states(
+    request: Request,
     session: AsyncSession = Depends(get_db),
 ):
-    return await USStateRepository(session).get_all()
+    return await catalogs.respond(request, "us_statedle", session)
 
 
 @router.post("/question", response_model=USStateQuestionDisplay)
@@ -212,7 +210,7 @@ async def ask_question(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await USStatedleDayRepository(session).get_today_us_state()
+    day_state = await daily_targets.get_today("us_statedle", session)
     
     from qdrant.utils import add_question_to_qdrant
 
@@ -232,6 +230,7 @@ async def ask_question(
             new_quest = await USStatedleQuestionRepository(session).create_question(
                 question_create
             )
+            await session.commit()
             return new_quest
 
         question_create, question_vector = await uutils.ask_question(
@@ -244,6 +243,7 @@ async def ask_question(
         new_quest = await USStatedleQuestionRepository(session).create_question(
             question_create
         )
+        await session.commit()
 
         if question_vector:
             await add_question_to_qdrant(
@@ -278,51 +278,54 @@ async def ask_question(
 
         return new_quest
 
-    state = await USStatedleStateRepository(session).get_state(user, day_state)
-
-    current_game_state = db_state_to_game_state(state)
-    if not game_rules.can_ask_question(current_game_state):
+    state_repository = USStatedleStateRepository(session)
+    if await state_repository.reserve_question(user, day_state, game_rules) is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No more questions left or game over!",
         )
+    # Committed before the LLM is called, so a concurrent request cannot take
+    # the same question while this one waits for the answer
+    await session.commit()
 
-    enh_question = await uutils.enhance_question(question.question)
-    if not enh_question.valid:
-        question_create = USStateQuestionCreate(
-            user_id=user.id,
-            day_id=day_state.id,
-            original_question=enh_question.original_question,
-            valid=enh_question.valid,
-            question=enh_question.question,
-            answer=None,
-            explanation=enh_question.explanation,
-            context=None,
+    try:
+        enh_question = await uutils.enhance_question(question.question)
+        if not enh_question.valid:
+            question_create = USStateQuestionCreate(
+                user_id=user.id,
+                day_id=day_state.id,
+                original_question=enh_question.original_question,
+                valid=enh_question.valid,
+                question=enh_question.question,
+                answer=None,
+                explanation=enh_question.explanation,
+                context=None,
+            )
+            new_quest = await USStatedleQuestionRepository(session).create_question(
+                question_create
+            )
+            await state_repository.bump_version(user, day_state)
+            await session.commit()
+
+            return new_quest
+
+        question_create, question_vector = await uutils.ask_question(
+            enh_question,
+            day_state,
+            user,
+            session,
         )
+
         new_quest = await USStatedleQuestionRepository(session).create_question(
             question_create
         )
-
-        # Update state
-        new_game_state = game_rules.process_question(current_game_state)
-        state.remaining_questions = (
-            USSTATEDLE_CONFIG.max_questions - new_game_state.questions_used
-        )
-        state.questions_asked += 1
-        await USStatedleStateRepository(session).update_state(state)
-
-        return new_quest
-
-    question_create, question_vector = await uutils.ask_question(
-        enh_question,
-        day_state,
-        user,
-        session,
-    )
-
-    new_quest = await USStatedleQuestionRepository(session).create_question(
-        question_create
-    )
+        await state_repository.bump_version(user, day_state)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        await state_repository.release_question(user, day_state)
+        await session.commit()
+        raise
 
     await add_question_to_qdrant(
         new_quest,
@@ -332,38 +335,62 @@ async def ask_question(
         collection_name="us_states_questions",
     )
 
-    # Update state
-    new_game_state = game_rules.process_question(current_game_state)
-    state.remaining_questions = (
-        USSTATEDLE_CONFIG.max_questions - new_game_state.questions_used
-    )
-    state.questions_asked += 1
-    await USStatedleStateRepository(session).update_state(state)
-
     return new_quest
 
 
+@router.get("/question/{question_id}/context", response_model=QuestionContext)
+async def get_question_context(
+    question_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    day_state = await daily_targets.get_today("us_statedle", session)
+    state = await USStatedleStateRepository(session).load_state(user, day_state)
+
+    # The context describes the target, so it stays hidden until the game is over
+    if state is None or not state.is_game_over:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Question context is only available after the game is over.",
+        )
+
+    question = next((q for q in state.questions if q.id == question_id), None)
+    if question is None:
+        raise HTTPException(status_code=404, detail="Question not found.")
+
+    return await question_context.get_context("us_statedle", question, session)
+
+
 @router.get("/reveal", response_model=USStateDisplay)
 async def reveal_us_state(
+    request: Request,
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await USStatedleDayRepository(session).get_today_us_state()
-    if not day_state:
-        day_state = await USStatedleDayRepository(session).generate_new_day_us_state()
-    if not day_state:
-        raise HTTPException(status_code=404, detail="No game today")
-        
-    if user is not None:
+    day_state = await daily_targets.get_today("us_statedle", session)
+
+    if user is None:
+        return day_state.us_state
+
+    async def build():
         state = await USStatedleStateRepository(session).get_state(user, day_state)
         if state and not state.is_game_over:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Cannot reveal state before game is over.",
             )
-            
-    us_state = await USStateRepository(session).get(day_state.us_state_id)
-    return us_state
+        return state, USStateDisplay.model_validate(day_state.us_state)
+
+    return await state_cache.respond(
+        request,
+        "us_statedle",
+        "reveal",
+        user,
+        day_state,
+        USStatedleStateRepository(session),
+        build,
+    )
+
 
 @router.post("/guess", response_model=USStateGuessDisplay)
 async def make_guess(
@@ -371,7 +398,7 @@ async def make_guess(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await USStatedleDayRepository(session).get_today_us_state()
+    day_state = await daily_targets.get_today("us_statedle", session)
     
     if user is None:
         is_correct = False
@@ -387,19 +414,18 @@ async def make_guess(
             guessed_at=datetime.now()
         )
 
-    state = await USStatedleStateRepository(session).get_state(user, day_state)
+    is_correct = False
+    if guess.us_state_id:
+        is_correct = guess.us_state_id == day_state.us_state_id
 
-    current_game_state = db_state_to_game_state(state)
-    if not game_rules.can_make_guess(current_game_state):
+    state_repository = USStatedleStateRepository(session)
+    state = await state_repository.record_guess(user, day_state, game_rules, is_correct)
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No more guesses left or game over!",
         )
 
-    is_correct = False
-    if guess.us_state_id:
-        is_correct = guess.us_state_id == day_state.us_state_id
-
     guess_create = USStateGuessCreate(
         guess=guess.guess,
         us_state_id=guess.us_state_id,
@@ -410,18 +436,12 @@ async def make_guess(
 
     new_guess = await USStatedleGuessRepository(session).add_guess(guess_create)
 
-    # Update state
-    new_game_state = game_rules.process_guess(current_game_state, is_correct)
-    state.remaining_guesses = (
-        USSTATEDLE_CONFIG.max_guesses - new_game_state.guesses_used
-    )
-    state.guesses_made += 1
-    state.won = new_game_state.is_won
-    state.is_game_over = new_game_state.is_game_over
-
     if state.won:
-        state.points = await USStatedleStateRepository(session).calc_points(state)
+        state.points = await state_repository.calc_points(state)
+
+    if state.is_game_over:
+        await LeaderboardRepository(session).record_game("us_statedle", state)
 
-    await USStatedleStateRepository(session).update_state(state)
+    await session.commit()
 
     return new_guess
@@ -6,7 +6,11 @@ from openai import OpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import USState, USStatedleDay, User
-from qdrant.utils import get_fragments_matching_question
+from qdrant.utils import (
+    CONTEXT_SEPARATOR,
+    fragment_refs,
+    get_fragments_matching_question,
+)
 import qdrant
 from schemas.us_statedle import USStateQuestionCreate, USStateQuestionEnhanced
 from db.repositories.us_state import USStateRepository
@@ -131,7 +135,7 @@ async def ask_question(
     fragments, question_vector = await get_fragments_matching_question(
         question.question, "us_state_id", day_state.us_state_id, "us_states", session, limit=qdrant.US_STATEDLE_CONTEXT_LIMIT
     )
-    context = "\n[ ... ]\n".join(fragment.text for fragment in fragments)
+    context = CONTEXT_SEPARATOR.join(fragment.text for fragment in fragments)
     state: USState = await USStateRepository(session).get(day_state.us_state_id)
 
     system_prompt = f"""
@@ -187,6 +191,7 @@ Answer with JSON format and nothing else. Use the specific format:
         print(answer)
         raise
 
+    refs = fragment_refs(fragments)
     question_create = USStateQuestionCreate(
         user_id=user.id if user else None,
         day_id=day_state.id,
@@ -195,7 +200,8 @@ Answer with JSON format and nothing else. Use the specific format:
         question=question.question,
         answer=answer_dict.get("answer"),
         explanation=answer_dict.get("explanation") or "No explanation provided.",
-        context=context,
+        context=context if refs is None else None,
+        context_fragments=refs,
     )
 
     return question_create, question_vector
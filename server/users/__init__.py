@@ -1,19 +1,22 @@
 from datetime import datetime
-from db import get_db
+from db import get_db, get_read_db
 from db.models import User
 from schemas.user import ChangePassword, UserDisplay, UserUpdate
 from dotenv import load_dotenv
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.repositories.user import UserRepository
-from db.repositories.countrydle import CountrydleRepository
-from db.repositories.powiatdle import PowiatdleStateRepository
-from db.repositories.us_statedle import USStatedleStateRepository
-from db.repositories.wojewodztwodle import WojewodztwodleStateRepository
 from schemas.statistics import UserProfileStatistics
+from utils import auth_cache, profile_stats
 
-from .utils import create_access_token, get_current_user, send_verification_email
+from .utils import (
+    create_access_token,
+    get_current_user,
+    send_verification_email,
+    set_access_token_cookie,
+    user_claims,
+)
 
 load_dotenv()
 router = APIRouter()
@@ -29,31 +32,19 @@ async def read_users_me(
 @router.get("/{username}/stats", response_model=UserProfileStatistics)
 async def get_user_stats_by_username(
     username: str,
-    session: AsyncSession = Depends(get_db)
+    session: AsyncSession = Depends(get_read_db)
 ):
     user = await UserRepository(session).get_user(username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    countrydle_stats = await CountrydleRepository(session).get_game_statistics(user)
-    powiatdle_stats = await PowiatdleStateRepository(session).get_user_statistics(user)
-    us_statedle_stats = await USStatedleStateRepository(session).get_user_statistics(user)
-    wojewodztwodle_stats = await WojewodztwodleStateRepository(session).get_user_statistics(user)
-    
-    return UserProfileStatistics(
-        user=user,
-        countrydle=countrydle_stats,
-        powiatdle=powiatdle_stats,
-        us_statedle=us_statedle_stats,
-        wojewodztwodle=wojewodztwodle_stats
-    )
+    return await profile_stats.get_profile(user, session)
 
 
 @router.post("/update")
 async def change_username(
     updated_user: UserUpdate,
     response: Response,
-    background_tasks: BackgroundTasks,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
 ):
@@ -93,9 +84,14 @@ async def change_username(
     up_user: User = await UserRepository(session).update_user_email_username(
         user.id, updated_user
     )
+    # Cached profiles embed the old username
+    profile_stats.invalidate(user.id)
+    auth_cache.invalidate(user.id)
     if not up_user.verified:
 
-        await send_verification_email(user, background_tasks)
+        # Sent to the new address, which is the one left to verify
+        await send_verification_email(up_user, session)
+        await session.commit()
         response.set_cookie(
             key="access_token",
             value="",
@@ -109,7 +105,7 @@ async def change_username(
             "message": "Account updated successfully! You will be logged out!",
         }
 
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data=user_claims(up_user))
 
 
     response.set_cookie(
@@ -127,6 +123,7 @@ async def change_username(
 @router.post("/change/password")
 async def change_username(
     password: ChangePassword,
+    response: Response,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
 ):
@@ -145,4 +142,7 @@ async def change_username(
     updated_user = await UserRepository(session).change_password(
         user.id, password.password
     )
+    auth_cache.invalidate(user.id)
+    # The new password voids the old token, so keep this session signed in
+    set_access_token_cookie(response, create_access_token(data=user_claims(updated_user)))
     return {"message": "Password changed successfully"}
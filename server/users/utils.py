@@ -2,22 +2,26 @@ import os
 from datetime import UTC, datetime, timedelta
 from uuid import uuid4
 
-from fastapi_mail import MessageSchema
-
 from db import get_db
 from db.models import User
 from db.repositories.user import UserRepository
-from fastapi import BackgroundTasks, Cookie, Depends, HTTPException, status, Response
+from fastapi import Cookie, Depends, HTTPException, status, Response
 
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from jose.exceptions import ExpiredSignatureError
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.email import fm, fm_noreply
+from utils import auth_cache
+from utils.auth_cache import CurrentUser
+from utils.email import queue_email
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+# Tokens are only re-signed once less than this much of their lifetime is left
+ACCESS_TOKEN_REFRESH_MINUTES = int(
+    os.getenv("ACCESS_TOKEN_REFRESH_MINUTES", ACCESS_TOKEN_EXPIRE_MINUTES // 2)
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
@@ -29,7 +33,25 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def verify_access_token(token: str):
+def user_claims(user: User) -> dict:
+    return CurrentUser.from_user(user).claims()
+
+
+def set_access_token_cookie(response: Response, token: str) -> None:
+    expiration = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    response.set_cookie(
+        key="access_token",
+        value=token,
+        httponly=True,
+        secure=False,  # Set to False for local development (HTTP)
+        samesite="lax",
+        path="/",
+        expires=expiration.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+def verify_access_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -40,12 +62,11 @@ def verify_access_token(token: str):
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    return username
+    return payload
 
 
 def create_verification_token(email: str):
@@ -73,10 +94,18 @@ async def get_current_user(
     response: Response,
     access_token: str = Cookie(None),
     session: AsyncSession = Depends(get_db),
-) -> User:
-    email = verify_access_token(access_token)
-
-    user = await UserRepository(session).get_by_email(email)
+) -> CurrentUser:
+    claims = verify_access_token(access_token)
+
+    if "uid" in claims:
+        user = await auth_cache.get_user(claims["uid"], session)
+        # A password change voids every token signed before it
+        if user is not None and user.stamp != claims.get("stamp"):
+            user = None
+    else:
+        # Signed before tokens carried the user id
+        found = await UserRepository(session).get_by_email(claims["sub"])
+        user = CurrentUser.from_user(found) if found else None
 
     if not user:
         raise HTTPException(
@@ -85,22 +114,11 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Refresh the token and cookie
-    new_access_token = create_access_token(data={"sub": user.email})
-
-    # Calculate expiration time for the cookie
-    expiration = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-
-    response.set_cookie(
-        key="access_token",
-        value=new_access_token,
-        httponly=True,
-        secure=False,  # Set to False for local development (HTTP)
-        samesite="lax",
-        path="/",
-        expires=expiration.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-    )
+    # Signing is skipped until the token nears expiry or the account changed
+    expires_in = claims["exp"] - datetime.now(UTC).timestamp()
+    stale = any(claims.get(key) != value for key, value in user.claims().items())
+    if stale or expires_in < ACCESS_TOKEN_REFRESH_MINUTES * 60:
+        set_access_token_cookie(response, create_access_token(data=user.claims()))
 
     return user
 
@@ -123,19 +141,15 @@ async def get_current_or_guest_user(
     return None
 
 
-async def send_verification_email(
-    user: User, background_tasks: BackgroundTasks
-) -> None:
+async def send_verification_email(user: User, session: AsyncSession) -> None:
+    """Queues the verification email; it goes out once the session commits."""
     token = create_verification_token(user.email)
 
     verification_url = f"https://jmelzacki.com/api/verify-email?token={token}"
-    message = MessageSchema(
-        subject="Verify Your Email",
-        recipients=[user.email],  # List of recipients
-        subtype="html",
-        template_body={"username": user.username, "verification_url": verification_url},
-    )
-
-    background_tasks.add_task(
-        fm_noreply.send_message, message, template_name="verification_email.html"
+    await queue_email(
+        session,
+        user.email,
+        "Verify Your Email",
+        "verification_email.html",
+        {"username": user.username, "verification_url": verification_url},
     )
@@ -1,62 +1,82 @@
-from datetime import date, timedelta
+from datetime import timedelta
 import logging
 
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from db import AsyncSessionLocal
+from db import AsyncSessionLocal, engine, partitions
 from db.base import Base
 from db.models import *  # noqa: F403
-from db.repositories.countrydle import CountrydleRepository, CountrydleStateRepository
 from sqlalchemy.ext.asyncio import AsyncEngine
 
+from db.repositories.leaderboard import LeaderboardRepository
 from db.repositories.user import UserRepository
+from utils import daily_targets, history, retention
 
 
 async def check_streaks():
+    yesterday = daily_targets.game_today() - timedelta(days=1)
     async with AsyncSessionLocal() as session:
-        u_repo = UserRepository(session)
-        cs_repo = CountrydleStateRepository(session)
+        await UserRepository(session).reset_stale_streaks(yesterday)
+        await LeaderboardRepository(session).reset_stale_streaks(yesterday)
+        await session.commit()
 
-        users = await u_repo.get_all_verified_users()
-        yesterday = date.today() - timedelta(days=1)
-        dc_yesterday = await CountrydleRepository(session).get_day_country_by_date(
-            yesterday
-        )
 
-        if dc_yesterday is None:
-            logging.error(f"DayCountry for {yesterday} not found.")
-            return
+async def generate_days():
+    for game in daily_targets.GAMES:
+        try:
+            async with AsyncSessionLocal() as session:
+                created = await daily_targets.generate_days(game, session)
+        except Exception as e:
+            logging.error(f"Generating {game} days failed: {e}", exc_info=True)
+            continue
 
-        for user in users:
-            points = await u_repo.get_user_points(user.id)
-            if not points:
-                points = await u_repo.add_user_points(user.id)
+        for day_date in created:
+            logging.info(f"Generated {game} day for {day_date}")
 
-            yesterday_state = await cs_repo.get_player_countrydle_state(
-                user, dc_yesterday
-            )
 
-            if yesterday_state is None or not yesterday_state.is_game_over:
-                points.streak = 0
+async def build_history():
+    for game in history.GAMES:
+        try:
+            async with AsyncSessionLocal() as session:
+                await history.refresh(game, session)
+        except Exception as e:
+            logging.error(f"Building {game} history failed: {e}", exc_info=True)
 
-            await session.commit()
 
+async def maintain_question_partitions():
+    today = daily_targets.game_today()
+    for table in partitions.PARTITIONED:
+        try:
+            async with engine.begin() as conn:
+                await partitions.ensure_partitions(conn, table, today)
+                archived = await partitions.archive_partitions(conn, table, today)
+        except Exception as e:
+            logging.error(f"Maintaining {table.name} partitions failed: {e}", exc_info=True)
+            continue
 
-async def generate_day_countries():
-    async with AsyncSessionLocal() as session:
-        c_repo = CountrydleRepository(session)
+        for name in archived:
+            logging.info(f"Archived {name}")
+
+
+async def apply_retention():
+    try:
+        await retention.run(engine, daily_targets.game_today())
+    except Exception as e:
+        logging.error(f"Retention failed: {e}", exc_info=True)
 
-        for day_date in (date.today() + timedelta(days=n) for n in range(5)):
-            day_country = await c_repo.get_day_country_by_date(day_date)
-            if day_country is not None:
-                logging.info(f"DayCountry for {day_date} already exists.")
-                continue
 
-            print(f"Generating country for {day_date}")
-            await c_repo.generate_new_day_country(day_date)
+def at(hour: int, minute: int) -> CronTrigger:
+    # Jobs follow the game day, not the server's clock
+    return CronTrigger(hour=hour, minute=minute, timezone=daily_targets.GAME_TIMEZONE)
 
 
 scheduler = AsyncIOScheduler()
-scheduler.add_job(generate_day_countries, CronTrigger(hour=0, minute=0))
-scheduler.add_job(check_streaks, CronTrigger(hour=0, minute=0))
+scheduler.add_job(generate_days, at(0, 0))
+# Yesterday joins the history, so rebuild it before the first request has to
+scheduler.add_job(build_history, at(0, 0))
+# A few minutes after rollover, so games finished just before midnight are committed
+scheduler.add_job(check_streaks, at(0, 5))
+# Detaching a partition briefly locks its table, so do it when few people play
+scheduler.add_job(maintain_question_partitions, at(3, 0))
+scheduler.add_job(apply_retention, at(3, 30))
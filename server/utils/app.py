@@ -4,6 +4,7 @@ from contextlib import asynccontextmanager
 
 import users.crud as ucrud
 from db import AsyncSessionLocal, get_engine
+from db.notify import listener
 
 from db.models import *  # noqa: F403
 from db.base import Base
@@ -11,6 +12,7 @@ from fastapi import FastAPI
 from qdrant import close_qdrant_client, init_qdrant
 from sqlalchemy.ext.asyncio import AsyncEngine
 import utils
+from utils import catalogs, email
 
 
 async def init_models(engine: AsyncEngine):
@@ -44,7 +46,11 @@ async def lifespan(app: FastAPI):
             await ucrud.add_base_permissions(session)
             await init_qdrant(session)
 
+        await utils.generate_days()
+        await catalogs.warm()
         utils.scheduler.start()
+        await listener.start()
+        email.start()
 
         yield
     except ConnectionRefusedError:
@@ -57,6 +63,8 @@ async def lifespan(app: FastAPI):
     finally:
         try:
             logging.info("Shutting down application...")
+            await email.stop()
+            await listener.stop()
             utils.scheduler.shutdown(wait=True)
             close_qdrant_client()
             await engine.dispose()
@@ -0,0 +1,85 @@
+import hashlib
+import os
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import User
+from db.notify import listener
+from db.repositories.user import USER_CHANNEL, UserRepository
+from utils.cache import TTLCache
+
+# Account changes invalidate an entry right away, so the TTL only bounds how
+# long a deleted account keeps working while the notification listener is down
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10_000))
+
+_cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_SIZE)
+# Bumped by every invalidation, so an account read before one is not kept after it
+_generation = 0
+
+
+def credential_stamp(hashed_password: str | None) -> str:
+    """Changes whenever the password does, which voids tokens signed before."""
+    if hashed_password is None:
+        return ""
+    return hashlib.sha256(hashed_password.encode()).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """What requests need of the signed-in user, detached from any session."""
+
+    id: int
+    username: str | None
+    email: str
+    verified: bool
+    stamp: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            verified=user.verified,
+            stamp=credential_stamp(user.hashed_password),
+        )
+
+    def claims(self) -> dict:
+        return {"sub": self.email, "uid": self.id, "username": self.username, "stamp": self.stamp}
+
+
+async def get_user(user_id: int, session: AsyncSession) -> CurrentUser | None:
+    user = _cache.get(user_id)
+    if user is None:
+        generation = _generation
+        found = await UserRepository(session).get(user_id)
+        if found is None:
+            return None
+        user = CurrentUser.from_user(found)
+        if _generation == generation:
+            # Otherwise the account changed while it was read; the next request reads again
+            _cache.set(user_id, user)
+    return user
+
+
+def invalidate(user_id: int | None = None) -> None:
+    global _generation
+    _generation += 1
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.invalidate(user_id)
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def _on_notify(payload: str) -> None:
+    # An empty payload comes from a listener reconnect, when updates may have been missed
+    invalidate(int(payload) if payload else None)
+
+
+listener.subscribe(USER_CHANNEL, _on_notify)
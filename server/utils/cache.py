@@ -0,0 +1,60 @@
+import time
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """Small in-process cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, ttl: float | None = None, maxsize: int | None = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[Hashable, tuple[float | None, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.time():
+                self.hits += 1
+                return value
+            self._entries.pop(key, None)
+
+        self.misses += 1
+        return default
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+
+        self._entries.pop(key, None)
+        if self.maxsize is not None and len(self._entries) >= self.maxsize:
+            # Dicts keep insertion order, so the first key is the oldest entry
+            self._entries.pop(next(iter(self._entries)))
+
+        self._entries[key] = (expires_at, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,150 @@
+"""Pre-serialized catalogs of countries, powiaty, US states and województwa.
+
+Clients load a game's whole catalog on every page load, while it only changes
+when a population script runs. Each catalog is serialized once, at startup or
+on the first request after a change, and served from memory with a strong
+ETag. The population scripts publish on CHANNEL when they are done, which
+drops the catalog in every worker.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AsyncSessionLocal
+from db.notify import listener, notify
+from db.repositories.country import CountryRepository
+from db.repositories.powiatdle import PowiatRepository
+from db.repositories.us_state import USStateRepository
+from db.repositories.wojewodztwo import WojewodztwoRepository
+from schemas.country import CountryDisplay
+from schemas.powiatdle import PowiatDisplay
+from schemas.us_statedle import USStateDisplay
+from schemas.wojewodztwodle import WojewodztwoDisplay
+from utils.cache import TTLCache
+from utils.etag import is_fresh, make_etag
+
+CHANNEL = "catalogs"
+# Clients revalidate with their ETag afterwards, so this only bounds how long a
+# browser keeps a catalog that a population run has since changed
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", 3600))
+
+
+@dataclass(frozen=True)
+class CatalogSpec:
+    load: Callable[[AsyncSession], Awaitable[list]]
+    display: type[BaseModel]
+
+
+CATALOGS: dict[str, CatalogSpec] = {
+    "countrydle": CatalogSpec(
+        load=lambda s: CountryRepository(s).get_all_countries(),
+        display=CountryDisplay,
+    ),
+    "powiatdle": CatalogSpec(
+        load=lambda s: PowiatRepository(s).get_all(),
+        display=PowiatDisplay,
+    ),
+    "us_statedle": CatalogSpec(
+        load=lambda s: USStateRepository(s).get_all(),
+        display=USStateDisplay,
+    ),
+    "wojewodztwodle": CatalogSpec(
+        load=lambda s: WojewodztwoRepository(s).get_all(),
+        display=WojewodztwoDisplay,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Catalog:
+    body: bytes
+    etag: str
+
+
+_cache = TTLCache()
+_locks: dict[str, asyncio.Lock] = {}
+# Bumped by every invalidation, so a refresh that read the rows before it does not
+# keep them afterwards
+_generations: dict[str, int] = dict.fromkeys(CATALOGS, 0)
+
+
+async def refresh(game: str, session: AsyncSession) -> Catalog:
+    """Serializes the catalog of `game` and keeps it until it is invalidated."""
+    spec = CATALOGS[game]
+    generation = _generations[game]
+    entries = await spec.load(session)
+    body = (
+        b"["
+        + b",".join(spec.display.model_validate(e).model_dump_json().encode() for e in entries)
+        + b"]"
+    )
+    catalog = Catalog(body=body, etag=make_etag(game, body))
+    if _generations[game] != generation:
+        # Changed while it was read; this request gets it, the next one reads again
+        return catalog
+    _cache.set(game, catalog)
+    logging.info(f"Built {game} catalog: {len(entries)} entries")
+    return catalog
+
+
+async def get_catalog(game: str, session: AsyncSession) -> Catalog:
+    catalog = _cache.get(game)
+    if catalog is not None:
+        return catalog
+
+    async with _locks.setdefault(game, asyncio.Lock()):
+        catalog = _cache.get(game)
+        if catalog is not None:
+            return catalog
+        return await refresh(game, session)
+
+
+async def warm() -> None:
+    for game in CATALOGS:
+        try:
+            async with AsyncSessionLocal() as session:
+                await refresh(game, session)
+        except Exception as e:
+            # The first request builds it instead
+            logging.warning(f"Could not build the {game} catalog: {e}")
+
+
+async def respond(request: Request, game: str, session: AsyncSession) -> Response:
+    catalog = await get_catalog(game, session)
+    headers = {"ETag": catalog.etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if is_fresh(request, catalog.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+
+async def publish(session: AsyncSession, game: str | None = None) -> None:
+    """Tells every worker the catalog of `game`, or all of them, changed. Does not commit."""
+    await notify(session, CHANNEL, game or "")
+
+
+def invalidate(game: str | None = None) -> None:
+    for name in [game] if game else CATALOGS:
+        _generations[name] += 1
+    if game:
+        _cache.invalidate(game)
+    else:
+        _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def _on_notify(payload: str) -> None:
+    logging.info(f"Catalog invalidated: {payload or 'all games'}")
+    invalidate(payload if payload in CATALOGS else None)
+
+
+listener.subscribe(CHANNEL, _on_notify)
@@ -0,0 +1,152 @@
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.notify import listener, notify
+from db.repositories.countrydle import CountrydleRepository
+from db.repositories.powiatdle import PowiatdleDayRepository
+from db.repositories.us_statedle import USStatedleDayRepository
+from db.repositories.wojewodztwodle import WojewodztwodleDayRepository
+from utils.cache import TTLCache
+
+# Timezone whose midnight starts a new game day. Defaults to the server's local time.
+GAME_TIMEZONE = os.getenv("GAME_TIMEZONE")
+CHANNEL = "daily_targets"
+DAYS_AHEAD = int(os.getenv("DAYS_AHEAD", 5))
+
+
+@dataclass(frozen=True)
+class DailyGame:
+    target: str  # Name of the day row's relationship to the target entity
+    load: Callable[[AsyncSession, date], Awaitable[Any]]
+    generate: Callable[[AsyncSession, date], Awaitable[bool]]
+
+
+GAMES: dict[str, DailyGame] = {
+    "countrydle": DailyGame(
+        target="country",
+        load=lambda s, today: CountrydleRepository(s).get_today_country(today),
+        generate=lambda s, d: CountrydleRepository(s).generate_new_day_country(d),
+    ),
+    "powiatdle": DailyGame(
+        target="powiat",
+        load=lambda s, today: PowiatdleDayRepository(s).get_today_powiat(today),
+        generate=lambda s, d: PowiatdleDayRepository(s).generate_new_day_powiat(d),
+    ),
+    "us_statedle": DailyGame(
+        target="us_state",
+        load=lambda s, today: USStatedleDayRepository(s).get_today_us_state(today),
+        generate=lambda s, d: USStatedleDayRepository(s).generate_new_day_us_state(
+            d
+        ),
+    ),
+    "wojewodztwodle": DailyGame(
+        target="wojewodztwo",
+        load=lambda s, today: WojewodztwodleDayRepository(s).get_today_wojewodztwo(
+            today
+        ),
+        generate=lambda s, d: WojewodztwodleDayRepository(
+            s
+        ).generate_new_day_wojewodztwo(d),
+    ),
+}
+
+_cache = TTLCache()
+
+
+def _now() -> datetime:
+    if GAME_TIMEZONE:
+        return datetime.now(ZoneInfo(GAME_TIMEZONE))
+    return datetime.now().astimezone()
+
+
+def game_today() -> date:
+    return _now().date()
+
+
+def next_rollover() -> datetime:
+    """Returns the moment the next game day starts (the coming midnight)."""
+    now = _now()
+    tomorrow = now.date() + timedelta(days=1)
+    return datetime.combine(tomorrow, time.min, tzinfo=now.tzinfo)
+
+
+async def get_today(game: str, session: AsyncSession):
+    """Returns today's day row for `game` with its target entity loaded.
+
+    The row is shared between requests until the next rollover, so callers
+    must treat it as read-only.
+    """
+    today = game_today()
+    day = _cache.get(game)
+    if day is not None and day.date == today:
+        return day
+
+    spec = GAMES[game]
+    day = await spec.load(session, today)
+    if day is None:
+        # Days are generated ahead of time by the scheduler, never on the request path
+        logging.error(f"No {game} day for {today}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Today's game is not ready yet. Please try again in a moment.",
+        )
+
+    if day.date == today:
+        target = getattr(day, spec.target)
+        session.expunge(day)
+        if target is not None and target in session:
+            session.expunge(target)
+        _cache.set(game, day, expires_at=next_rollover().timestamp())
+
+    return day
+
+
+async def generate_days(
+    game: str, session: AsyncSession, days_ahead: int = DAYS_AHEAD
+) -> list[date]:
+    """Makes sure `game` has a day for today and each of the next `days_ahead` days.
+
+    Returns the dates that were created. Commits the session.
+    """
+    # Every worker runs the scheduler, so only one of them should do the work.
+    # The unique date constraint keeps days consistent even without the lock.
+    await session.execute(select(func.pg_advisory_xact_lock(func.hashtext(game))))
+
+    spec = GAMES[game]
+    today = game_today()
+    created = []
+    for day_date in (today + timedelta(days=n) for n in range(days_ahead + 1)):
+        if await spec.generate(session, day_date):
+            created.append(day_date)
+
+    if today in created:
+        await notify(session, CHANNEL, game)
+    await session.commit()
+    return created
+
+
+def invalidate(game: str | None = None) -> None:
+    if game:
+        _cache.invalidate(game)
+    else:
+        _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def _on_notify(payload: str) -> None:
+    logging.info(f"Daily target invalidated: {payload or 'all games'}")
+    invalidate(payload if payload in GAMES else None)
+
+
+listener.subscribe(CHANNEL, _on_notify)
@@ -1,42 +1,216 @@
+"""Outgoing email, through the email_outbox table.
 
+Handlers only render an email and queue it in their own transaction, so it
+is sent if and only if their changes are committed. The outbox worker claims
+due emails in batches and sends each batch over one SMTP connection, which
+stays open between batches until it idles out. Failed sends are retried with
+exponential backoff. Every process can run a worker; SKIP LOCKED keeps them
+from sending an email twice.
+"""
 
+import asyncio
+import logging
 import os
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
 from pathlib import Path
+
+import aiosmtplib
 from dotenv import load_dotenv
-from fastapi_mail import ConnectionConfig, FastMail
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AsyncSessionLocal
+from db.models import OutboxEmail
+from db.notify import listener
+from db.repositories.email import OUTBOX_CHANNEL, EmailRepository
+from schemas.email import EmailCreate
 
 load_dotenv()
 
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 NOREPLY_EMAIL = os.getenv("NOREPLY_EMAIL")
+SMTP_HOST = os.getenv("SMTP_HOST", "mail.privateemail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() == "true"
+SMTP_TIMEOUT = 30
+# Set to false where scripts/email_worker.py sends the mail instead
+EMAIL_OUTBOX_WORKER = os.getenv("EMAIL_OUTBOX_WORKER", "true").lower() == "true"
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=EMAIL_USERNAME,
-    MAIL_PASSWORD=EMAIL_PASSWORD,  # Use the app password here
-    MAIL_FROM=EMAIL_USERNAME,
-    MAIL_PORT=465,
-    MAIL_SERVER="mail.privateemail.com",
-    MAIL_STARTTLS=False,  # Use False if you're using SSL/TLS on port 465
-    MAIL_SSL_TLS=True,  # Enable SSL/TLS connection (True if you're using port 465)
-    USE_CREDENTIALS=True,  # Use SMTP credentials
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path('templates')
+OUTBOX_BATCH = 20
+MAX_ATTEMPTS = 6
+RETRY_DELAY = 30  # Doubles with every failed attempt
+MAX_RETRY_DELAY = 3600
+# Queued emails wake the worker right away; this only covers retries and a
+# listener that is down
+POLL_INTERVAL = 60
+SMTP_IDLE_TIMEOUT = 60
+
+templates = Environment(
+    loader=FileSystemLoader(Path("templates")), autoescape=select_autoescape()
 )
 
 
-conf_noreply = ConnectionConfig(
-    MAIL_USERNAME=EMAIL_USERNAME,
-    MAIL_PASSWORD=EMAIL_PASSWORD,  # Use the app password here
-    MAIL_FROM=NOREPLY_EMAIL,
-    MAIL_PORT=465,
-    MAIL_SERVER="mail.privateemail.com",
-    MAIL_STARTTLS=False,  # Use False if you're using SSL/TLS on port 465
-    MAIL_SSL_TLS=True,  # Enable SSL/TLS connection (True if you're using port 465)
-    USE_CREDENTIALS=True,  # Use SMTP credentials
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path('templates')
-)
+async def queue_email(
+    session: AsyncSession,
+    recipient: str,
+    subject: str,
+    template_name: str,
+    context: dict,
+    sender: str = NOREPLY_EMAIL,
+) -> OutboxEmail:
+    """Renders `template_name` and queues it. Sent once the session commits."""
+    body = templates.get_template(template_name).render(**context)
+    return await EmailRepository(session).enqueue(
+        EmailCreate(sender=sender, recipient=recipient, subject=subject, body=body)
+    )
+
+
+def retry_at(attempts: int) -> datetime | None:
+    """When to try again after `attempts` failures, or None to give up."""
+    if attempts >= MAX_ATTEMPTS:
+        return None
+    delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return datetime.now() + timedelta(seconds=delay)
+
+
+class Mailer:
+    """One SMTP connection, opened on demand and reused across sends."""
+
+    def __init__(
+        self,
+        hostname: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        use_tls: bool = SMTP_SSL,
+        username: str | None = EMAIL_USERNAME,
+        password: str | None = EMAIL_PASSWORD,
+    ):
+        self.options = {
+            "hostname": hostname,
+            "port": port,
+            "use_tls": use_tls,
+            "username": username,
+            "password": password,
+            "timeout": SMTP_TIMEOUT,
+        }
+        self._smtp: aiosmtplib.SMTP | None = None
+        self.last_used = 0.0
+        self.connections = 0
+
+    async def connect(self) -> None:
+        if self._smtp is None or not self._smtp.is_connected:
+            self._smtp = aiosmtplib.SMTP(**self.options)
+            await self._smtp.connect()
+            self.connections += 1
+
+    async def send(self, email: OutboxEmail) -> None:
+        await self.connect()
+        message = EmailMessage()
+        message["From"] = email.sender
+        message["To"] = email.recipient
+        message["Subject"] = email.subject
+        message.set_content(email.body, subtype="html")
+        await self._smtp.send_message(message)
+        self.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = None
+
+    async def close_if_idle(self) -> None:
+        if time.monotonic() - self.last_used >= SMTP_IDLE_TIMEOUT:
+            await self.close()
+
+
+_counts = {"sent": 0, "retried": 0, "failed": 0}
+
+
+async def deliver_batch(session: AsyncSession, mailer: Mailer) -> int:
+    """Sends up to OUTBOX_BATCH due emails and records how each went."""
+    repository = EmailRepository(session)
+    emails = await repository.claim_due(OUTBOX_BATCH)
+    for email in emails:
+        try:
+            await mailer.connect()
+        except (aiosmtplib.SMTPException, OSError) as e:
+            # Not the emails' fault, so they wait for the next round untouched
+            logging.warning(f"Could not connect to the SMTP server: {e}")
+            break
+
+        try:
+            await mailer.send(email)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            # A 5xx reply to the email is final; anything else may work later
+            final = isinstance(e, aiosmtplib.SMTPResponseException) and e.code >= 500
+            retry = None if final else retry_at(email.attempts + 1)
+            repository.mark_failed(email, str(e), retry)
+            _counts["failed" if retry is None else "retried"] += 1
+            # The connection may be what broke, so open a fresh one next time
+            await mailer.close()
+            logging.warning(f"Could not send email {email.id}: {e}")
+        else:
+            repository.mark_sent(email)
+            _counts["sent"] += 1
+    await session.commit()
+    return len(emails)
+
+
+_wake = asyncio.Event()
+_worker: asyncio.Task | None = None
+
+
+async def run_worker(mailer: Mailer | None = None) -> None:
+    mailer = mailer or Mailer()
+    try:
+        while True:
+            _wake.clear()
+            try:
+                async with AsyncSessionLocal() as session:
+                    claimed = await deliver_batch(session, mailer)
+            except Exception:
+                logging.exception("Email outbox worker failed, retrying")
+                claimed = 0
+            if claimed == OUTBOX_BATCH:
+                continue  # More may be due already
+
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            await mailer.close_if_idle()
+    finally:
+        await mailer.close()
+
+
+def start() -> None:
+    global _worker
+    if EMAIL_OUTBOX_WORKER and _worker is None:
+        _worker = asyncio.create_task(run_worker())
+
+
+async def stop() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+
+
+def stats() -> dict:
+    return {"running": _worker is not None and not _worker.done(), **_counts}
+
+
+def _on_notify(payload: str) -> None:
+    _wake.set()
+
 
-fm = FastMail(conf)
-fm_noreply = FastMail(conf_noreply)
\ No newline at end of file
+listener.subscribe(OUTBOX_CHANNEL, _on_notify)
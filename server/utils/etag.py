@@ -0,0 +1,47 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()}"'
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already covers `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as proxies may weaken the tags they pass on
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def http_date(moment: datetime) -> str:
+    """Formats `moment` for Last-Modified; naive times are taken as local."""
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Whether the client's validators are current, If-None-Match taking precedence."""
+    if "if-none-match" in request.headers:
+        return is_fresh(request, etag)
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds only
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
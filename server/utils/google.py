@@ -1,50 +1,165 @@
+"""Verification of Google sign-in credentials.
 
+ID tokens are checked locally against Google's signing keys. The keys are
+cached for as long as Google's Cache-Control allows and refreshed in the
+background shortly before that. Access tokens, which the web client's popup
+flow hands out, can only be checked by Google, so they still go to the
+tokeninfo endpoint, without blocking the event loop.
+"""
 
+import asyncio
+import logging
+import os
+import re
+import time
 
+import httpx
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from jose import JWTError
-load_dotenv()
-import os
-import requests
+from jose import JWTError, jwt
 
+load_dotenv()
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_OAUTH2_URL = "https://oauth2.googleapis.com/tokeninfo?id_token="
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_TOKENINFO_URL = "https://oauth2.googleapis.com/tokeninfo"
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+HTTP_TIMEOUT = 5
+# Used when the key set comes without a max-age
+KEYS_DEFAULT_TTL = 3600
+# Keys are refreshed in the background once they expire within this many seconds
+KEYS_REFRESH_MARGIN = 300
+# A token signed with a key we do not know refetches the keys at most this often
+KEYS_MIN_REFETCH = 60
+
+# Tests swap in an httpx.MockTransport serving a local key set
+transport: httpx.AsyncBaseTransport | None = None
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=HTTP_TIMEOUT, transport=transport)
+
+
+def _max_age(headers: httpx.Headers) -> int:
+    match = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+    if match is None:
+        return KEYS_DEFAULT_TTL
+    return max(int(match.group(1)) - int(headers.get("age", 0)), 0)
+
+
+class SigningKeys:
+    """Google's public keys by key id, fetched on first use."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._keys: dict[str, dict] = {}
+        self.fetched_at = 0.0
+        self.expires_at = 0.0
+        self.fetches = 0
+        self._lock = asyncio.Lock()
+        self._background: asyncio.Task | None = None
+
+    async def get(self, kid: str | None) -> dict | None:
+        now = time.time()
+        unknown = kid not in self._keys and now - self.fetched_at >= KEYS_MIN_REFETCH
+        if now >= self.expires_at or unknown:
+            try:
+                await self.refresh()
+            except httpx.HTTPError:
+                if not self._keys:
+                    raise HTTPException(
+                        status_code=503, detail="Google sign-in is unavailable"
+                    )
+                # Keys rotate slowly, so the ones we have are most likely still valid
+                logging.warning("Could not refresh Google keys", exc_info=True)
+        elif now >= self.expires_at - KEYS_REFRESH_MARGIN and (
+            self._background is None or self._background.done()
+        ):
+            self._background = asyncio.create_task(self._refresh_quietly())
+        return self._keys.get(kid)
+
+    async def refresh(self) -> None:
+        fetched_at = self.fetched_at
+        async with self._lock:
+            if self.fetched_at != fetched_at:
+                return  # Another request refreshed them while this one waited
+            async with _client() as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+            self._keys = {key["kid"]: key for key in response.json()["keys"]}
+            self.fetched_at = time.time()
+            self.expires_at = self.fetched_at + _max_age(response.headers)
+            self.fetches += 1
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except httpx.HTTPError:
+            logging.warning("Could not refresh Google keys", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "fetches": self.fetches,
+            "expires_in": max(round(self.expires_at - time.time()), 0),
+        }
+
+
+keys = SigningKeys(GOOGLE_CERTS_URL)
+
+
+def _check_token_info(token_info: dict) -> dict:
+    # ID tokens carry the client id in 'aud', access tokens in 'aud' or 'azp'
+    if GOOGLE_CLIENT_ID not in (token_info.get("aud"), token_info.get("azp")):
+        raise HTTPException(status_code=400, detail="Token not issued for this app!")
+
+    # Boolean in ID tokens, a string in tokeninfo responses
+    if token_info.get("email_verified") not in (True, "true"):
+        raise HTTPException(status_code=400, detail="Email is not verified!")
+
+    return token_info
+
+
+async def verify_id_token(token: str, header: dict) -> dict:
+    key = await keys.get(header.get("kid"))
+    if key is None:
+        raise HTTPException(status_code=400, detail="Invalid Google Token")
 
-def verify_google_token(token: str):
     try:
-        # Try verifying as ID Token first
-        response = requests.get(f"https://oauth2.googleapis.com/tokeninfo?id_token={token}")
-        
-        # If that fails (e.g. 400), try as Access Token
-        if response.status_code != 200:
-             response = requests.get(f"https://oauth2.googleapis.com/tokeninfo?access_token={token}")
-
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Invalid Google Token")
-        
-        token_info = response.json()
-
-        # Check if the token was issued to your app's client
-        # For ID tokens, client ID is in 'aud'
-        # For Access tokens, client ID is in 'aud' or 'azp'
-        aud = token_info.get("aud")
-        azp = token_info.get("azp")
-        
-        if aud != GOOGLE_CLIENT_ID and azp != GOOGLE_CLIENT_ID:
-             # Double check logic: sometimes aud is an array?
-             # But usually for these tokens it's a string.
-             # If strictly checking:
-             if str(aud) != str(GOOGLE_CLIENT_ID) and str(azp) != str(GOOGLE_CLIENT_ID):
-                raise HTTPException(status_code=400, detail="Token not issued for this app!")
-        
-        if not token_info.get("email_verified") == "true" and not token_info.get("email_verified") is True:
-             # Google returns boolean true for id_token, string "true" for access_token sometimes? 
-             # Let's be safe.
-             raise HTTPException(status_code=400, detail="Email is not verified!")
-
-        return token_info
-
-    except JWTError as e:
-        raise HTTPException(status_code=400, detail="Token verification failed")
\ No newline at end of file
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=GOOGLE_CLIENT_ID,
+            issuer=GOOGLE_ISSUERS,
+            # at_hash ties the token to an access token we never receive
+            options={"verify_at_hash": False},
+        )
+    except JWTError:
+        raise HTTPException(status_code=400, detail="Invalid Google Token")
+    return _check_token_info(claims)
+
+
+async def verify_access_token(token: str) -> dict:
+    try:
+        async with _client() as client:
+            response = await client.get(GOOGLE_TOKENINFO_URL, params={"access_token": token})
+    except httpx.HTTPError:
+        logging.warning("Could not reach Google tokeninfo", exc_info=True)
+        raise HTTPException(status_code=503, detail="Google sign-in is unavailable")
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Invalid Google Token")
+    return _check_token_info(response.json())
+
+
+async def verify_google_token(token: str) -> dict:
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        # Not a JWT, so an opaque access token
+        return await verify_access_token(token)
+    return await verify_id_token(token, header)
+
+
+def stats() -> dict:
+    return keys.stats()
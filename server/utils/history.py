@@ -0,0 +1,177 @@
+import asyncio
+import bisect
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.repositories.countrydle import CountrydleRepository
+from db.repositories.powiatdle import PowiatdleDayRepository
+from db.repositories.us_statedle import USStatedleDayRepository
+from db.repositories.wojewodztwodle import WojewodztwodleDayRepository
+from schemas.country import CountryCount, DayCountryDisplay
+from schemas.powiatdle import DayPowiatDisplay
+from schemas.us_statedle import DayUSStateDisplay
+from schemas.wojewodztwodle import DayWojewodztwoDisplay
+from utils import daily_targets
+from utils.cache import TTLCache
+from utils.etag import is_fresh, make_etag
+
+HISTORY_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 1000
+
+
+def country_counts(days) -> list[CountryCount]:
+    """How often each country has been the target, most frequent first."""
+    counts: dict[int, CountryCount] = {}
+    for day in days:  # Newest first, so the first day seen is the last one
+        if day.country is None:
+            continue
+        if day.country_id in counts:
+            counts[day.country_id].count += 1
+        else:
+            counts[day.country_id] = CountryCount(
+                id=day.country.id, name=day.country.name, count=1, last=day.date
+            )
+
+    return sorted(
+        counts.values(), key=lambda c: (-c.count, -c.last.toordinal(), c.name)
+    )
+
+
+@dataclass(frozen=True)
+class HistoryGame:
+    load: Callable[[AsyncSession, date], Awaitable[list]]
+    display: type[BaseModel]
+    # Summary of the whole history served with every page, if the game has one
+    summarize: Callable[[list], list[BaseModel]] | None = None
+
+
+GAMES: dict[str, HistoryGame] = {
+    "countrydle": HistoryGame(
+        load=lambda s, today: CountrydleRepository(s).get_countrydle_history(today),
+        display=DayCountryDisplay,
+        summarize=country_counts,
+    ),
+    "powiatdle": HistoryGame(
+        load=lambda s, today: PowiatdleDayRepository(s).get_history(today),
+        display=DayPowiatDisplay,
+    ),
+    "us_statedle": HistoryGame(
+        load=lambda s, today: USStatedleDayRepository(s).get_history(today),
+        display=DayUSStateDisplay,
+    ),
+    "wojewodztwodle": HistoryGame(
+        load=lambda s, today: WojewodztwodleDayRepository(s).get_history(today),
+        display=DayWojewodztwoDisplay,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class HistorySnapshot:
+    today: date
+    # Negated ordinals of the days' dates, ascending so a cursor can be bisected
+    keys: list[int]
+    # Every past day serialized to JSON, newest first
+    days: list[bytes]
+    summary: bytes | None
+    version: str
+
+
+@dataclass(frozen=True)
+class HistoryPage:
+    days: bytes
+    summary: bytes | None
+    etag: str
+
+
+_cache = TTLCache()
+_locks: dict[str, asyncio.Lock] = {}
+
+
+def _json_list(items: list[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
+
+
+async def refresh(game: str, session: AsyncSession) -> HistorySnapshot:
+    """Rebuilds the history of `game` up to yesterday and caches it until rollover."""
+    spec = GAMES[game]
+    today = daily_targets.game_today()
+    days = await spec.load(session, today)
+
+    encoded = [spec.display.model_validate(day).model_dump_json().encode() for day in days]
+    summary = None
+    if spec.summarize is not None:
+        summary = _json_list(
+            [entry.model_dump_json().encode() for entry in spec.summarize(days)]
+        )
+
+    snapshot = HistorySnapshot(
+        today=today,
+        keys=[-day.date.toordinal() for day in days],
+        days=encoded,
+        summary=summary,
+        version=make_etag(game, today, summary or b"", *encoded),
+    )
+    _cache.set(game, snapshot, expires_at=daily_targets.next_rollover().timestamp())
+    logging.info(f"Built {game} history: {len(days)} days")
+    return snapshot
+
+
+async def get_snapshot(game: str, session: AsyncSession) -> HistorySnapshot:
+    snapshot = _cache.get(game)
+    if snapshot is not None and snapshot.today == daily_targets.game_today():
+        return snapshot
+
+    # Right after rollover every request misses, but one rebuild is enough
+    async with _locks.setdefault(game, asyncio.Lock()):
+        snapshot = _cache.get(game)
+        if snapshot is not None and snapshot.today == daily_targets.game_today():
+            return snapshot
+        return await refresh(game, session)
+
+
+async def get_page(
+    game: str,
+    session: AsyncSession,
+    before: date | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> HistoryPage:
+    """Returns up to `limit` days older than `before`, newest first."""
+    snapshot = await get_snapshot(game, session)
+    start = 0
+    if before is not None:
+        start = bisect.bisect_right(snapshot.keys, -before.toordinal())
+    days = snapshot.days[start : start + limit]
+
+    return HistoryPage(
+        days=_json_list(days),
+        summary=snapshot.summary,
+        etag=make_etag(snapshot.version, start, len(days)),
+    )
+
+
+def respond(request: Request, etag: str, content: bytes) -> Response:
+    # Past days never change, so a page stays valid until the next day is added
+    max_age = max(int(daily_targets.next_rollover().timestamp() - time.time()), 0)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if is_fresh(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def invalidate(game: str | None = None) -> None:
+    if game:
+        _cache.invalidate(game)
+    else:
+        _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
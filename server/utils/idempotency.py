@@ -0,0 +1,196 @@
+"""Idempotency-Key support for the question, guess and sync endpoints.
+
+Clients retry these on timeouts, and a question costs seconds of LLM work and
+one of the player's questions. A request carrying an Idempotency-Key header
+claims the key in the idempotency_keys table before it runs and stores its
+response once done. A retry with the same key replays that response or, while
+the first request is still running, waits for it instead of starting over.
+Keys belong to the signed-in user, and reusing one for a different request is
+rejected. Guests cannot be told apart reliably, so their keys are ignored
+rather than shared. Failed requests give their key up, so a retry runs again.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+from db import AsyncSessionLocal
+from db.notify import listener
+from db.repositories.idempotency import IDEMPOTENCY_CHANNEL, IdempotencyRepository
+from users.utils import verify_access_token
+from utils.daily_targets import GAMES
+
+# Responses are replayed for this long
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 900))
+# A request holding its key for this long most likely died with its process
+LOCK_TIMEOUT = 120
+# How long a retry waits for the request it repeats before answering 409
+MAX_WAIT = 60
+# Finished requests wake their waiters; this only covers a listener that is down
+POLL_INTERVAL = 1
+MAX_KEY_LENGTH = 255
+
+ROUTES = {
+    "/sync",
+    *(f"/{game}/{action}" for game in GAMES for action in ("question", "guess", "sync")),
+}
+
+# Tests point this at their own database
+sessions = AsyncSessionLocal
+
+_waiting: dict[str, asyncio.Event] = {}
+_counts = {
+    "stored": 0,
+    "replayed": 0,
+    "waited": 0,
+    "released": 0,
+    "mismatched": 0,
+    "guests": 0,
+}
+
+
+def request_scope(request: Request) -> str:
+    try:
+        claims = verify_access_token(request.cookies.get("access_token"))
+    except HTTPException:
+        return "guest"
+    # Tokens signed before they carried the user id only have the email
+    return f"user:{claims['uid']}" if "uid" in claims else f"email:{claims['sub']}"
+
+
+def fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def replay(entry) -> Response:
+    _counts["replayed"] += 1
+    return Response(
+        content=entry.body,
+        status_code=entry.status_code,
+        media_type=entry.content_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def handle(request: Request, call_next) -> Response:
+    key = request.headers.get("idempotency-key")
+    if key is None or request.method != "POST" or request.url.path not in ROUTES:
+        return await call_next(request)
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        return JSONResponse(status_code=400, content={"detail": "Invalid Idempotency-Key"})
+
+    scope = request_scope(request)
+    if scope == "guest":
+        # Another guest's key may well be the same, and their responses are not ours
+        _counts["guests"] += 1
+        return await call_next(request)
+    name = f"{scope} {key}"
+    try:
+        return await run_once(request, call_next, scope, key, name)
+    finally:
+        # Whatever became of this request, a retry waiting on the key looks again
+        # and nothing is left behind in _waiting
+        _wake(name)
+
+
+async def run_once(request: Request, call_next, scope: str, key: str, name: str) -> Response:
+    request_fingerprint = fingerprint(request, await request.body())
+    deadline = time.monotonic() + MAX_WAIT
+    waited = False
+    while True:
+        # Made before looking, so a request finishing meanwhile still wakes this one
+        finished = _waiting.setdefault(name, asyncio.Event())
+        async with sessions() as session:
+            repository = IdempotencyRepository(session)
+            if await repository.claim(
+                scope, key, request_fingerprint, IDEMPOTENCY_TTL, LOCK_TIMEOUT
+            ):
+                await session.commit()
+                break
+            entry = await repository.get(scope, key)
+
+        if entry is None:
+            continue  # Given up by its request just now
+        if entry.fingerprint != request_fingerprint:
+            _counts["mismatched"] += 1
+            return JSONResponse(
+                status_code=422,
+                content={"detail": "Idempotency-Key was already used for another request"},
+            )
+        if entry.status_code is not None:
+            return replay(entry)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "A request with this Idempotency-Key is still running"},
+            )
+        if not waited:
+            _counts["waited"] += 1
+            waited = True
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=min(remaining, POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+
+    stored = False
+    try:
+        response = await call_next(request)
+        if response.status_code >= 500:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        async with sessions() as session:
+            await IdempotencyRepository(session).complete(
+                scope, key, response.status_code, response.headers.get("content-type"), body
+            )
+            await session.commit()
+        stored = True
+    finally:
+        if not stored:
+            # Failed, or cancelled when the client went away: give the key up so a
+            # retry runs again. Shielded, as a cancelled request is cancelled again
+            # at its next await
+            await asyncio.shield(release(scope, key))
+    _counts["stored"] += 1
+
+    async def stored_body():
+        yield body
+
+    response.body_iterator = stored_body()
+    return response
+
+
+async def release(scope: str, key: str) -> None:
+    async with sessions() as session:
+        await IdempotencyRepository(session).release(scope, key)
+        await session.commit()
+    _counts["released"] += 1
+    _wake(f"{scope} {key}")
+
+
+def _wake(name: str) -> None:
+    finished = _waiting.pop(name, None)
+    if finished is not None:
+        finished.set()
+
+
+def stats() -> dict:
+    return {"waiting": len(_waiting), **_counts}
+
+
+def _on_notify(payload: str) -> None:
+    _wake(payload)
+
+
+listener.subscribe(IDEMPOTENCY_CHANNEL, _on_notify)
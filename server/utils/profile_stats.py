@@ -0,0 +1,59 @@
+import logging
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import MAX_REPLICA_LAG
+from db.models import User
+from db.notify import listener
+from db.repositories.leaderboard import PROFILE_CHANNEL
+from db.repositories.statistics import ProfileStatisticsRepository
+from schemas.statistics import UserProfileStatistics
+from utils.cache import TTLCache
+
+# Finished games invalidate a profile right away, so the TTL only bounds how
+# stale a profile gets while the notification listener is down
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 600))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10_000))
+
+_cache = TTLCache(ttl=PROFILE_CACHE_TTL, maxsize=PROFILE_CACHE_SIZE)
+# Bumped by every invalidation, so a profile read before one is not kept after it.
+# One counter for every player keeps it bounded; a read that races another
+# player's game only skips caching its result
+_generation = 0
+
+
+async def get_profile(user: User, session: AsyncSession) -> UserProfileStatistics:
+    profile = _cache.get(user.id)
+    if profile is None:
+        generation = _generation
+        profile = await ProfileStatisticsRepository(session).get_profile(user)
+        if _generation != generation:
+            # A game finished while it was read; the next request reads again
+            return profile
+        # A replica may not have replayed the game whose notification just
+        # cleared this entry yet, so keep what it returns only as long as it may lag
+        ttl = MAX_REPLICA_LAG if session.info.get("replica") else None
+        _cache.set(user.id, profile, ttl=ttl)
+    return profile
+
+
+def invalidate(user_id: int | None = None) -> None:
+    global _generation
+    _generation += 1
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.invalidate(user_id)
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def _on_notify(payload: str) -> None:
+    # An empty payload comes from a listener reconnect, when updates may have been missed
+    invalidate(int(payload) if payload else None)
+
+
+listener.subscribe(PROFILE_CHANNEL, _on_notify)
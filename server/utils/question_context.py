@@ -0,0 +1,37 @@
+"""Context the model was given for a question, rebuilt from fragment references.
+
+Questions store the ids and scores of the fragments used as context instead
+of a copy of their text; the text is only kept for fragments that cannot be
+referenced.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import CountryFragment, PowiatFragment, USStateFragment, WojewodztwoFragment
+from db.repositories.fragment import FragmentRepository
+from qdrant.utils import CONTEXT_SEPARATOR
+from schemas.fragment import ContextFragment, QuestionContext
+
+FRAGMENTS = {
+    "countrydle": CountryFragment,
+    "powiatdle": PowiatFragment,
+    "us_statedle": USStateFragment,
+    "wojewodztwodle": WojewodztwoFragment,
+}
+
+
+async def get_context(game: str, question, session: AsyncSession) -> QuestionContext:
+    if question.context_fragments is None:
+        return QuestionContext(
+            question_id=question.id, context=question.context, fragments=[]
+        )
+
+    fragments = [ContextFragment.model_validate(ref) for ref in question.context_fragments]
+    texts = await FragmentRepository(session).get_texts(
+        FRAGMENTS[game], [fragment.id for fragment in fragments]
+    )
+    # Re-populating a target replaces its fragments, so some may be gone
+    context = CONTEXT_SEPARATOR.join(
+        texts[fragment.id] for fragment in fragments if fragment.id in texts
+    )
+    return QuestionContext(question_id=question.id, context=context, fragments=fragments)
@@ -0,0 +1,154 @@
+"""Token-bucket rate limiting of the question, guess and sync endpoints.
+
+Every question costs two LLM calls and an embedding, and guests can ask as
+many as they like, so one script could use up the provider quota for
+everyone. Each client gets a bucket per class of endpoints that holds up to
+`burst` tokens and refills at `per_minute`; a request takes a token or is
+answered with 429 and a Retry-After header. Signed-in users are told apart by
+their account and guests by their address.
+
+Buckets live in the process by default, so every worker allows the full
+rate. RATE_LIMIT_SHARED=1 keeps them in the rate_limit_buckets table instead,
+shared by all workers at the cost of one statement per limited request.
+"""
+
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+
+from db import AsyncSessionLocal
+from db.repositories.rate_limit import RateLimitRepository
+from utils.cache import TTLCache
+from utils.daily_targets import GAMES
+from utils.idempotency import request_scope
+
+
+@dataclass(frozen=True)
+class Limit:
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+LIMITS = {
+    # Backed by the LLM; a player needs about a minute per question anyway
+    "question": Limit(
+        burst=int(os.getenv("RATE_LIMIT_QUESTION_BURST", 20)),
+        per_minute=float(os.getenv("RATE_LIMIT_QUESTION_PER_MINUTE", 6)),
+    ),
+    "play": Limit(
+        burst=int(os.getenv("RATE_LIMIT_PLAY_BURST", 30)),
+        per_minute=float(os.getenv("RATE_LIMIT_PLAY_PER_MINUTE", 30)),
+    ),
+}
+
+ROUTES = {
+    "/sync": "play",
+    **{f"/{game}/question": "question" for game in GAMES},
+    **{f"/{game}/{action}": "play" for game in GAMES for action in ("guess", "sync")},
+}
+
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "").lower() in ("1", "true", "yes")
+# Addresses of reverse proxies whose X-Real-IP header names the client; "*" trusts any
+TRUSTED_PROXIES = {ip for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip}
+# Full buckets are dropped, so this only bounds memory under a flood of addresses
+MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100_000))
+
+# Tests point this at their own database
+sessions = AsyncSessionLocal
+
+_buckets = TTLCache(maxsize=MAX_CLIENTS)
+_counts = {
+    "allowed": dict.fromkeys(LIMITS, 0),
+    "limited": dict.fromkeys(LIMITS, 0),
+    "errors": 0,
+}
+
+
+def client_address(request: Request) -> str:
+    host = request.client.host if request.client else "unknown"
+    if "*" in TRUSTED_PROXIES or host in TRUSTED_PROXIES:
+        return request.headers.get("x-real-ip", host)
+    return host
+
+
+def client_key(request: Request) -> str:
+    scope = request_scope(request)
+    return f"ip:{client_address(request)}" if scope == "guest" else scope
+
+
+def take_local(key: str, limit: Limit) -> float:
+    """Same as RateLimitRepository.take, for a bucket of this process."""
+    now = time.time()
+    tokens, updated_at = _buckets.get(key, (limit.burst, now))
+    tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+    if tokens < 1:
+        return (1 - tokens) / limit.rate
+
+    tokens -= 1
+    # Expires once it would be full again, which is the same as no bucket
+    _buckets.set(
+        key, (tokens, now), expires_at=now + (limit.burst - tokens) / limit.rate
+    )
+    return 0.0
+
+
+async def take_shared(key: str, limit: Limit) -> float:
+    try:
+        async with sessions() as session:
+            retry_after = await RateLimitRepository(session).take(
+                key, limit.burst, limit.rate
+            )
+            await session.commit()
+    except (OSError, DBAPIError) as e:
+        # Players should not notice the limiter's table being unavailable
+        _counts["errors"] += 1
+        logging.warning(f"Rate limit bucket {key} unavailable, letting the request through: {e}")
+        return 0.0
+    return retry_after
+
+
+async def handle(request: Request, call_next) -> Response:
+    endpoints = ROUTES.get(request.url.path)
+    if endpoints is None or request.method != "POST":
+        return await call_next(request)
+
+    limit = LIMITS[endpoints]
+    key = f"{endpoints} {client_key(request)}"
+    if RATE_LIMIT_SHARED:
+        retry_after = await take_shared(key, limit)
+    else:
+        retry_after = take_local(key, limit)
+    if retry_after > 0:
+        _counts["limited"][endpoints] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests. Please try again in a moment."},
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    _counts["allowed"][endpoints] += 1
+    return await call_next(request)
+
+
+def invalidate() -> None:
+    _buckets.clear()
+
+
+def stats() -> dict:
+    return {
+        "shared": RATE_LIMIT_SHARED,
+        "clients": _buckets.stats()["size"],
+        "allowed": dict(_counts["allowed"]),
+        "limited": dict(_counts["limited"]),
+        "errors": _counts["errors"],
+    }
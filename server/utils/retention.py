@@ -0,0 +1,235 @@
+"""Scheduled deletion of old guest questions, test accounts and other leftovers.
+
+Rows are deleted in small chunks, each in its own short transaction with a
+lock timeout, so gameplay never queues behind the job for long. After every
+chunk the job sleeps RETENTION_THROTTLE times as long as the chunk took,
+which caps its share of the database however busy it is.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+import db.models  # noqa: F401  (every table has to be in the metadata)
+from db import partitions
+from db.base import Base
+from db.repositories.leaderboard import HIDDEN_USERNAME_PATTERNS
+
+# Guests can still sync their questions on the day, so keep them a while
+GUEST_QUESTION_RETENTION_DAYS = int(os.getenv("GUEST_QUESTION_RETENTION_DAYS", 7))
+# Leaves accounts of a test run that is still going alone
+TEST_USER_RETENTION_HOURS = float(os.getenv("TEST_USER_RETENTION_HOURS", 24))
+TEST_USERNAME_PATTERNS = [*HIDDEN_USERNAME_PATTERNS, r"guest\_%"]
+# Responses are only replayed for IDEMPOTENCY_TTL; anything older is left over
+IDEMPOTENCY_KEY_RETENTION_HOURS = float(os.getenv("IDEMPOTENCY_KEY_RETENTION_HOURS", 24))
+
+QUESTION_BATCH = int(os.getenv("RETENTION_QUESTION_BATCH", 2000))
+# Every user takes their games, guesses and questions along
+USER_BATCH = int(os.getenv("RETENTION_USER_BATCH", 50))
+KEY_BATCH = int(os.getenv("RETENTION_KEY_BATCH", 5000))
+# A bucket untouched this long has refilled, which is the same as having none
+RATE_LIMIT_BUCKET_IDLE = timedelta(hours=1)
+THROTTLE = float(os.getenv("RETENTION_THROTTLE", 1))
+LOCK_TIMEOUT = "2s"
+LOCK_RETRY_DELAY = 5
+MAX_LOCK_TIMEOUTS = 10
+PROGRESS_INTERVAL = 10
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+Chunk = Callable[[AsyncConnection], Awaitable[dict[str, int]]]
+
+
+@dataclass
+class RetentionReport:
+    started_at: datetime = field(default_factory=datetime.now)
+    deleted: dict[str, int] = field(default_factory=dict)
+    chunks: int = 0
+    lock_timeouts: int = 0
+    elapsed: float = 0.0
+    finished: bool = False
+
+    @property
+    def rows(self) -> int:
+        return sum(self.deleted.values())
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.rows} rows in {self.chunks} chunks, {self.elapsed:.1f}s, "
+            f"{self.rows_per_second:.0f} rows/s"
+        )
+
+
+_last: RetentionReport | None = None
+
+
+def user_dependents() -> list[tuple[str, str]]:
+    """(table, column) of every foreign key to users, dependents first."""
+    dependents = []
+    for table in reversed(Base.metadata.sorted_tables):
+        for fk in table.foreign_keys:
+            if fk.column.table.name == "users":
+                dependents.append((table.name, fk.parent.name))
+    return dependents
+
+
+def old_guest_questions(table: str, cutoff: date) -> Chunk:
+    async def chunk(conn: AsyncConnection) -> dict[str, int]:
+        result = await conn.execute(
+            text(
+                f"DELETE FROM {table} WHERE (id, day_date) IN ("
+                f"SELECT id, day_date FROM {table} "
+                "WHERE user_id IS NULL AND day_date < :cutoff LIMIT :batch)"
+            ),
+            {"cutoff": cutoff, "batch": QUESTION_BATCH},
+        )
+        return {table: result.rowcount}
+
+    return chunk
+
+
+def stale_test_users(retention_hours: float) -> Chunk:
+    async def chunk(conn: AsyncConnection) -> dict[str, int]:
+        # SKIP LOCKED leaves users that are playing right now for the next run
+        result = await conn.execute(
+            text(
+                "SELECT id FROM users WHERE username LIKE ANY(:patterns) "
+                "AND (created_at IS NULL "
+                "OR created_at < now() - make_interval(secs => :seconds)) "
+                "ORDER BY id LIMIT :batch FOR UPDATE SKIP LOCKED"
+            ),
+            {
+                "patterns": TEST_USERNAME_PATTERNS,
+                "seconds": retention_hours * 3600,
+                "batch": USER_BATCH,
+            },
+        )
+        ids = result.scalars().all()
+        if not ids:
+            return {}
+
+        deleted = {}
+        for table, column in user_dependents():
+            result = await conn.execute(
+                text(f"DELETE FROM {table} WHERE {column} = ANY(:ids)"), {"ids": ids}
+            )
+            deleted[table] = result.rowcount
+        result = await conn.execute(
+            text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": ids}
+        )
+        deleted["users"] = result.rowcount
+        return deleted
+
+    return chunk
+
+
+def expired_idempotency_keys(retention_hours: float) -> Chunk:
+    async def chunk(conn: AsyncConnection) -> dict[str, int]:
+        result = await conn.execute(
+            text(
+                "DELETE FROM idempotency_keys WHERE (scope, key) IN ("
+                "SELECT scope, key FROM idempotency_keys "
+                "WHERE created_at < now() - make_interval(secs => :seconds) LIMIT :batch)"
+            ),
+            {"seconds": retention_hours * 3600, "batch": KEY_BATCH},
+        )
+        return {"idempotency_keys": result.rowcount}
+
+    return chunk
+
+
+def idle_rate_limit_buckets() -> Chunk:
+    async def chunk(conn: AsyncConnection) -> dict[str, int]:
+        result = await conn.execute(
+            text(
+                "DELETE FROM rate_limit_buckets WHERE key IN ("
+                "SELECT key FROM rate_limit_buckets "
+                "WHERE updated_at < now() - make_interval(secs => :seconds) LIMIT :batch)"
+            ),
+            {"seconds": RATE_LIMIT_BUCKET_IDLE.total_seconds(), "batch": KEY_BATCH},
+        )
+        return {"rate_limit_buckets": result.rowcount}
+
+    return chunk
+
+
+async def run_chunks(engine: AsyncEngine, chunk: Chunk, report: RetentionReport) -> None:
+    """Runs `chunk` until it finds nothing left to delete."""
+    started = time.monotonic() - report.elapsed
+    logged = time.monotonic()
+    while True:
+        chunk_started = time.monotonic()
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                deleted = await chunk(conn)
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                raise
+            report.lock_timeouts += 1
+            if report.lock_timeouts >= MAX_LOCK_TIMEOUTS:
+                logging.warning("Retention keeps waiting for locks, giving up until next run")
+                return
+            await asyncio.sleep(LOCK_RETRY_DELAY)
+            continue
+
+        report.chunks += 1
+        for table, rows in deleted.items():
+            report.deleted[table] = report.deleted.get(table, 0) + rows
+        report.elapsed = time.monotonic() - started
+        if not any(deleted.values()):
+            return
+
+        if time.monotonic() - logged >= PROGRESS_INTERVAL:
+            logging.info(f"Retention in progress: {report.summary()}")
+            logged = time.monotonic()
+        await asyncio.sleep((time.monotonic() - chunk_started) * THROTTLE)
+
+
+async def run(
+    engine: AsyncEngine,
+    today: date,
+    test_user_retention_hours: float = TEST_USER_RETENTION_HOURS,
+) -> RetentionReport:
+    global _last
+    report = _last = RetentionReport()
+
+    cutoff = today - timedelta(days=GUEST_QUESTION_RETENTION_DAYS)
+    for table in partitions.PARTITIONED:
+        for name in (table.name, partitions.ARCHIVES[table.name].name):
+            await run_chunks(engine, old_guest_questions(name, cutoff), report)
+    await run_chunks(engine, stale_test_users(test_user_retention_hours), report)
+    await run_chunks(
+        engine, expired_idempotency_keys(IDEMPOTENCY_KEY_RETENTION_HOURS), report
+    )
+    await run_chunks(engine, idle_rate_limit_buckets(), report)
+
+    report.finished = True
+    logging.info(f"Retention finished: {report.summary()}")
+    return report
+
+
+def stats() -> dict | None:
+    if _last is None:
+        return None
+    return {
+        "started_at": _last.started_at.isoformat(timespec="seconds"),
+        "finished": _last.finished,
+        "rows": _last.rows,
+        "rows_per_second": round(_last.rows_per_second, 1),
+        "chunks": _last.chunks,
+        "lock_timeouts": _last.lock_timeouts,
+        "deleted": {table: rows for table, rows in _last.deleted.items() if rows},
+    }
@@ -0,0 +1,118 @@
+"""Conditional GETs of the game state endpoints, and cached finished games.
+
+Every state row carries a version that each change bumps, so the version
+makes an ETag and updated_at a Last-Modified. A client whose validators are
+current gets a 304 after a lookup of just those columns, instead of the state
+with its guesses and questions.
+
+A finished game never changes again until the next day starts, so its
+responses are kept per (game, endpoint, user, day) until rollover. Polls of
+a finished game are then answered, or 304'd, without touching the database.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+
+from db.models import User
+from utils import daily_targets
+from utils.cache import TTLCache
+from utils.etag import http_date, make_etag, not_modified
+
+FINISHED_GAME_CACHE_SIZE = int(os.getenv("FINISHED_GAME_CACHE_SIZE", 10_000))
+
+
+@dataclass(frozen=True)
+class FinishedGame:
+    etag: str
+    updated_at: datetime
+    body: bytes
+
+
+_cache = TTLCache(maxsize=FINISHED_GAME_CACHE_SIZE)
+_counts = {"not_modified": 0, "version_checks": 0}
+
+
+def headers(etag: str, updated_at: datetime, finished: bool) -> dict:
+    if finished:
+        # Stays as it is for the rest of the day
+        max_age = max(int(daily_targets.next_rollover().timestamp() - time.time()), 0)
+        cache_control = f"private, max-age={max_age}"
+    else:
+        cache_control = "private, no-cache"
+    return {
+        "ETag": etag,
+        "Last-Modified": http_date(updated_at),
+        "Cache-Control": cache_control,
+        # Another account signing in on the same browser must not get this one
+        "Vary": "Cookie",
+    }
+
+
+def _not_modified(headers: dict) -> Response:
+    _counts["not_modified"] += 1
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+async def respond(
+    request: Request,
+    game: str,
+    endpoint: str,
+    user: User,
+    day,
+    states,
+    build: Callable[[], Awaitable[tuple[Any, BaseModel]]],
+) -> Response:
+    """Answers a state endpoint of `user` for `day` with validators.
+
+    `states` is the game's state repository and `build` loads the state and
+    makes the response for it. Without a state there is nothing to validate.
+    """
+    key = (game, endpoint, user.id, day.id)
+    finished = _cache.get(key)
+    if finished is not None:
+        response_headers = headers(finished.etag, finished.updated_at, True)
+        if not_modified(request, finished.etag, finished.updated_at):
+            return _not_modified(response_headers)
+        return Response(
+            content=finished.body, media_type="application/json", headers=response_headers
+        )
+
+    if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+        _counts["version_checks"] += 1
+        current = await states.get_version(user, day)
+        if current is not None:
+            etag = make_etag(game, endpoint, user.id, day.id, current.version)
+            if not_modified(request, etag, current.updated_at):
+                return _not_modified(headers(etag, current.updated_at, current.is_game_over))
+
+    state, payload = await build()
+    if state is None:
+        return Response(content=payload.model_dump_json(), media_type="application/json")
+
+    etag = make_etag(game, endpoint, user.id, day.id, state.version)
+    body = payload.model_dump_json().encode()
+    if state.is_game_over:
+        _cache.set(
+            key,
+            FinishedGame(etag, state.updated_at, body),
+            expires_at=daily_targets.next_rollover().timestamp(),
+        )
+
+    response_headers = headers(etag, state.updated_at, state.is_game_over)
+    if not_modified(request, etag, state.updated_at):
+        return _not_modified(response_headers)
+    return Response(content=body, media_type="application/json", headers=response_headers)
+
+
+def invalidate() -> None:
+    _cache.clear()
+
+
+def stats() -> dict:
+    return {**_cache.stats(), **_counts}
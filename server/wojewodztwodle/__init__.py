@@ -1,17 +1,23 @@
+from datetime import date
 from typing import Union, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db
+from db import get_db, get_read_db
 from db.models import User
+from db.repositories.leaderboard import LeaderboardRepository
+from db.repositories.statistics import (
+    HISTORY_LIMIT,
+    MAX_HISTORY_LIMIT,
+    ProfileStatisticsRepository,
+)
 from db.repositories.wojewodztwodle import (
     WojewodztwodleDayRepository,
     WojewodztwodleStateRepository,
     WojewodztwodleGuessRepository,
     WojewodztwodleQuestionRepository,
 )
-from db.repositories.wojewodztwo import WojewodztwoRepository
 from schemas.wojewodztwodle import (
     WojewodztwoDisplay,
     WojewodztwodleStateResponse,
@@ -26,9 +32,12 @@ from schemas.wojewodztwodle import (
     DayWojewodztwoDisplay,
     WojewodztwodleSyncSchema,
 )
+from schemas.fragment import QuestionContext
+from schemas.statistics import GameHistoryEntry
 from users.utils import get_current_or_guest_user, get_current_user
+from utils import catalogs, daily_targets, history, question_context, state_cache
 import wojewodztwodle.utils as wutils
-from game_logic import GameConfig, GameRules, GameState
+from game_logic import GameConfig, GameRules
 
 router = APIRouter(prefix="/wojewodztwodle")
 
@@ -36,35 +45,49 @@ WOJEWODZTWDLE_CONFIG = GameConfig(max_questions=5, max_guesses=2)
 game_rules = GameRules(WOJEWODZTWDLE_CONFIG)
 
 
-def db_state_to_game_state(db_state) -> GameState:
-    return GameState(
-        questions_used=WOJEWODZTWDLE_CONFIG.max_questions
-        - db_state.remaining_questions,
-        guesses_used=WOJEWODZTWDLE_CONFIG.max_guesses - db_state.remaining_guesses,
-        is_won=db_state.won,
-        is_lost=db_state.is_game_over and not db_state.won,
-    )
-
-
 @router.post("/sync", response_model=WojewodztwodleStateResponse)
 async def sync_guest_data(
     sync_data: WojewodztwodleSyncSchema,
     user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
 ):
-    from datetime import datetime
-    from sqlalchemy import update
-    
-    try:
-        game_date = datetime.strptime(sync_data.date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-        
-    day_state = await WojewodztwodleDayRepository(session).get_day_wojewodztwo_by_date(game_date)
-    if not day_state:
-        raise HTTPException(status_code=404, detail="Game for this date not found.")
-
-    state = await WojewodztwodleStateRepository(session).get_state(user, day_state)
+    # Imported here, since the bulk /sync is built on these routers
+    from sync import sync_game
+
+    # The outcome is worked out from the guesses, never taken from the client
+    await sync_game("wojewodztwodle", sync_data, user, session)
+    response = await get_state(user, session)
+    await session.commit()
+    return response
+
+
+@router.get("/history", response_model=List[DayWojewodztwoDisplay])
+async def get_history(
+    request: Request,
+    before: date | None = Query(None, description="Only days before this date"),
+    limit: int = Query(history.HISTORY_PAGE_SIZE, ge=1, le=history.MAX_HISTORY_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_db),
+):
+    page = await history.get_page("wojewodztwodle", session, before, limit)
+    return history.respond(request, page.etag, page.days)
+
+
+@router.get("/history/me", response_model=List[GameHistoryEntry])
+async def get_my_history(
+    before: int | None = Query(None, description="Day id of the last entry already loaded"),
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=MAX_HISTORY_LIMIT),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await ProfileStatisticsRepository(session).get_history(
+        "wojewodztwodle", user, before, limit
+    )
+
+
+async def state_response(user: User, day_state, session: AsyncSession):
+    """Loads the user's state, starting the game if need be, with the response for it."""
+    state = await WojewodztwodleStateRepository(session).load_state(user, day_state)
+
     if state is None:
         state = await WojewodztwodleStateRepository(session).create_state(
             user,
@@ -72,69 +95,36 @@ async def sync_guest_data(
             max_questions=WOJEWODZTWDLE_CONFIG.max_questions,
             max_guesses=WOJEWODZTWDLE_CONFIG.max_guesses,
         )
-    
-    if state.questions_asked > 0 or state.guesses_made > 0:
-        return await get_state(user, session)
-
-    if sync_data.questions:
-        from db.models import WojewodztwodleQuestion
-        await session.execute(
-            update(WojewodztwodleQuestion)
-            .where(
-                WojewodztwodleQuestion.id.in_(sync_data.questions), 
-                WojewodztwodleQuestion.user_id == None,
-                WojewodztwodleQuestion.day_id == day_state.id
-            )
-            .values(user_id=user.id)
-        )
+        await session.commit()
+        guesses, questions = [], []
+    else:
+        guesses, questions = state.guesses, state.questions
 
-    for guess in sync_data.guesses:
-        is_correct = False
-        if guess.wojewodztwo_id:
-            is_correct = guess.wojewodztwo_id == day_state.wojewodztwo_id
-            
-        guess_create = WojewodztwoGuessCreate(
-            guess=guess.guess,
-            wojewodztwo_id=guess.wojewodztwo_id,
-            day_id=day_state.id,
-            user_id=user.id,
-            answer=is_correct,
+    if state.is_game_over:
+        return state, WojewodztwodleEndStateResponse(
+            user=user,
+            date=str(day_state.date),
+            state=WojewodztwodleStateSchema.model_validate(state),
+            guesses=guesses,
+            questions=questions,
+            wojewodztwo=day_state.wojewodztwo,
         )
-        await WojewodztwodleGuessRepository(session).add_guess(guess_create)
-
-    state.remaining_questions = sync_data.state.remaining_questions
-    state.remaining_guesses = sync_data.state.remaining_guesses
-    state.questions_asked = sync_data.state.questions_asked
-    state.guesses_made = sync_data.state.guesses_made
-    state.is_game_over = sync_data.state.is_game_over
-    state.won = sync_data.state.won
-    
-    if state.won:
-        state.points = await WojewodztwodleStateRepository(session).calc_points(state)
-        
-    await WojewodztwodleStateRepository(session).update_state(state)
-    
-    return await get_state(user, session)
 
-
-@router.get("/history", response_model=List[DayWojewodztwoDisplay])
-async def get_history(session: AsyncSession = Depends(get_db)):
-    return await WojewodztwodleDayRepository(session).get_history()
+    return state, WojewodztwodleStateResponse(
+        user=user,
+        date=str(day_state.date),
+        state=WojewodztwodleStateSchema.model_validate(state),
+        guesses=guesses,
+        questions=questions,
+        wojewodztwo=None,
+    )
 
 
-@router.get(
-    "/state",
-    response_model=Union[WojewodztwodleStateResponse, WojewodztwodleEndStateResponse],
-)
 async def get_state(
-    user: User | None = Depends(get_current_or_guest_user),
-    session: AsyncSession = Depends(get_db),
-):
-    day_state = await WojewodztwodleDayRepository(session).get_today_wojewodztwo()
-    if not day_state:
-        day_state = await WojewodztwodleDayRepository(
-            session
-        ).generate_new_day_wojewodztwo()
+    user: User | None, session: AsyncSession
+) -> Union[WojewodztwodleStateResponse, WojewodztwodleEndStateResponse]:
+    """What GET /state answers, without the validators; the sync endpoints answer with it too."""
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
 
     if user is None:
         return WojewodztwodleStateResponse(
@@ -157,57 +147,61 @@ async def get_state(
             wojewodztwo=None,
         )
 
-    state = await WojewodztwodleStateRepository(session).get_state(user, day_state)
-
-    if state is None:
-        state = await WojewodztwodleStateRepository(session).create_state(
-            user,
-            day_state,
-            max_questions=WOJEWODZTWDLE_CONFIG.max_questions,
-            max_guesses=WOJEWODZTWDLE_CONFIG.max_guesses,
-        )
+    _, response = await state_response(user, day_state, session)
+    return response
 
-    guesses = await WojewodztwodleGuessRepository(session).get_user_day_guesses(
-        user, day_state
-    )
-    questions = await WojewodztwodleQuestionRepository(session).get_user_day_questions(
-        user, day_state
-    )
 
-    if state.is_game_over:
-        wojewodztwo = await WojewodztwoRepository(session).get(day_state.wojewodztwo_id)
-        return WojewodztwodleEndStateResponse(
-            user=user,
-            date=str(day_state.date),
-            state=WojewodztwodleStateSchema.model_validate(state),
-            guesses=guesses,
-            questions=questions,
-            wojewodztwo=wojewodztwo,
-        )
+@router.get(
+    "/state", response_model=Union[WojewodztwodleStateResponse, WojewodztwodleEndStateResponse]
+)
+async def read_state(
+    request: Request,
+    user: User | None = Depends(get_current_or_guest_user),
+    session: AsyncSession = Depends(get_db),
+):
+    if user is None:
+        return await get_state(user, session)
 
-    return WojewodztwodleStateResponse(
-        user=user,
-        date=str(day_state.date),
-        state=WojewodztwodleStateSchema.model_validate(state),
-        guesses=guesses,
-        questions=questions,
-        wojewodztwo=None,
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
+    return await state_cache.respond(
+        request,
+        "wojewodztwodle",
+        "state",
+        user,
+        day_state,
+        WojewodztwodleStateRepository(session),
+        lambda: state_response(user, day_state, session),
     )
 
 
-from schemas.countrydle import LeaderboardEntry
+from schemas.countrydle import LeaderboardEntry, LeaderboardRank
 
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(session: AsyncSession = Depends(get_db)):
-    return await WojewodztwodleStateRepository(session).get_leaderboard()
+async def get_leaderboard(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await LeaderboardRepository(session).get_leaderboard(
+        "wojewodztwodle", limit, offset
+    )
+
+
+@router.get("/leaderboard/me", response_model=LeaderboardRank)
+async def get_my_rank(
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db),
+):
+    return await LeaderboardRepository(session).get_rank("wojewodztwodle", user)
 
 
 @router.get("/wojewodztwa", response_model=List[WojewodztwoDisplay])
 async def get_wojewodztwa(
+    request: Request,
     session: AsyncSession = Depends(get_db),
 ):
-    return await WojewodztwoRepository(session).get_all()
+    return await catalogs.respond(request, "wojewodztwodle", session)
 
 
 @router.post("/question", response_model=WojewodztwoQuestionDisplay)
@@ -216,7 +210,7 @@ async def ask_question(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await WojewodztwodleDayRepository(session).get_today_wojewodztwo()
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
     
     from qdrant.utils import add_question_to_qdrant
 
@@ -237,6 +231,7 @@ async def ask_question(
             new_quest = await WojewodztwodleQuestionRepository(session).create_question(
                 question_create
             )
+            await session.commit()
             return new_quest
 
         question_create, question_vector = await wutils.ask_question(
@@ -249,6 +244,7 @@ async def ask_question(
         new_quest = await WojewodztwodleQuestionRepository(session).create_question(
             question_create
         )
+        await session.commit()
 
         if question_vector:
             await add_question_to_qdrant(
@@ -262,51 +258,54 @@ async def ask_question(
 
         return new_quest
 
-    state = await WojewodztwodleStateRepository(session).get_state(user, day_state)
-
-    current_game_state = db_state_to_game_state(state)
-    if not game_rules.can_ask_question(current_game_state):
+    state_repository = WojewodztwodleStateRepository(session)
+    if await state_repository.reserve_question(user, day_state, game_rules) is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No more questions left or game over!",
         )
+    # Committed before the LLM is called, so a concurrent request cannot take
+    # the same question while this one waits for the answer
+    await session.commit()
+
+    try:
+        enh_question = await wutils.enhance_question(question.question)
+        if not enh_question.valid:
+            question_create = WojewodztwoQuestionCreate(
+                user_id=user.id,
+                day_id=day_state.id,
+                original_question=enh_question.original_question,
+                valid=enh_question.valid,
+                question=enh_question.question,
+                answer=None,
+                explanation=enh_question.explanation,
+                context=None,
+            )
+            new_quest = await WojewodztwodleQuestionRepository(session).create_question(
+                question_create
+            )
+            await state_repository.bump_version(user, day_state)
+            await session.commit()
+
+            return new_quest
 
-    enh_question = await wutils.enhance_question(question.question)
-    if not enh_question.valid:
-        question_create = WojewodztwoQuestionCreate(
-            user_id=user.id,
-            day_id=day_state.id,
-            original_question=enh_question.original_question,
-            valid=enh_question.valid,
-            question=enh_question.question,
-            answer=None,
-            explanation=enh_question.explanation,
-            context=None,
+        question_create, question_vector = await wutils.ask_question(
+            enh_question,
+            day_state,
+            user,
+            session,
         )
+
         new_quest = await WojewodztwodleQuestionRepository(session).create_question(
             question_create
         )
-
-        # Update state
-        new_game_state = game_rules.process_question(current_game_state)
-        state.remaining_questions = (
-            WOJEWODZTWDLE_CONFIG.max_questions - new_game_state.questions_used
-        )
-        state.questions_asked += 1
-        await WojewodztwodleStateRepository(session).update_state(state)
-
-        return new_quest
-
-    question_create, question_vector = await wutils.ask_question(
-        enh_question,
-        day_state,
-        user,
-        session,
-    )
-
-    new_quest = await WojewodztwodleQuestionRepository(session).create_question(
-        question_create
-    )
+        await state_repository.bump_version(user, day_state)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        await state_repository.release_question(user, day_state)
+        await session.commit()
+        raise
 
     await add_question_to_qdrant(
         new_quest,
@@ -316,38 +315,62 @@ async def ask_question(
         collection_name="wojewodztwa_questions",
     )
 
-    # Update state
-    new_game_state = game_rules.process_question(current_game_state)
-    state.remaining_questions = (
-        WOJEWODZTWDLE_CONFIG.max_questions - new_game_state.questions_used
-    )
-    state.questions_asked += 1
-    await WojewodztwodleStateRepository(session).update_state(state)
-
     return new_quest
 
 
+@router.get("/question/{question_id}/context", response_model=QuestionContext)
+async def get_question_context(
+    question_id: int,
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
+    state = await WojewodztwodleStateRepository(session).load_state(user, day_state)
+
+    # The context describes the target, so it stays hidden until the game is over
+    if state is None or not state.is_game_over:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Question context is only available after the game is over.",
+        )
+
+    question = next((q for q in state.questions if q.id == question_id), None)
+    if question is None:
+        raise HTTPException(status_code=404, detail="Question not found.")
+
+    return await question_context.get_context("wojewodztwodle", question, session)
+
+
 @router.get("/reveal", response_model=WojewodztwoDisplay)
 async def reveal_wojewodztwo(
+    request: Request,
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await WojewodztwodleDayRepository(session).get_today_wojewodztwo()
-    if not day_state:
-        day_state = await WojewodztwodleDayRepository(session).generate_new_day_wojewodztwo()
-    if not day_state:
-        raise HTTPException(status_code=404, detail="No game today")
-        
-    if user is not None:
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
+
+    if user is None:
+        return day_state.wojewodztwo
+
+    async def build():
         state = await WojewodztwodleStateRepository(session).get_state(user, day_state)
         if state and not state.is_game_over:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Cannot reveal wojewodztwo before game is over.",
             )
-            
-    wojewodztwo = await WojewodztwoRepository(session).get(day_state.wojewodztwo_id)
-    return wojewodztwo
+        return state, WojewodztwoDisplay.model_validate(day_state.wojewodztwo)
+
+    return await state_cache.respond(
+        request,
+        "wojewodztwodle",
+        "reveal",
+        user,
+        day_state,
+        WojewodztwodleStateRepository(session),
+        build,
+    )
+
 
 @router.post("/guess", response_model=WojewodztwoGuessDisplay)
 async def make_guess(
@@ -355,7 +378,7 @@ async def make_guess(
     user: User | None = Depends(get_current_or_guest_user),
     session: AsyncSession = Depends(get_db),
 ):
-    day_state = await WojewodztwodleDayRepository(session).get_today_wojewodztwo()
+    day_state = await daily_targets.get_today("wojewodztwodle", session)
     
     if user is None:
         is_correct = False
@@ -371,19 +394,18 @@ async def make_guess(
             guessed_at=datetime.now()
         )
 
-    state = await WojewodztwodleStateRepository(session).get_state(user, day_state)
+    is_correct = False
+    if guess.wojewodztwo_id:
+        is_correct = guess.wojewodztwo_id == day_state.wojewodztwo_id
 
-    current_game_state = db_state_to_game_state(state)
-    if not game_rules.can_make_guess(current_game_state):
+    state_repository = WojewodztwodleStateRepository(session)
+    state = await state_repository.record_guess(user, day_state, game_rules, is_correct)
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No more guesses left or game over!",
         )
 
-    is_correct = False
-    if guess.wojewodztwo_id:
-        is_correct = guess.wojewodztwo_id == day_state.wojewodztwo_id
-
     guess_create = WojewodztwoGuessCreate(
         guess=guess.guess,
         wojewodztwo_id=guess.wojewodztwo_id,
@@ -394,18 +416,12 @@ async def make_guess(
 
     new_guess = await WojewodztwodleGuessRepository(session).add_guess(guess_create)
 
-    # Update state
-    new_game_state = game_rules.process_guess(current_game_state, is_correct)
-    state.remaining_guesses = (
-        WOJEWODZTWDLE_CONFIG.max_guesses - new_game_state.guesses_used
-    )
-    state.guesses_made += 1
-    state.won = new_game_state.is_won
-    state.is_game_over = new_game_state.is_game_over
-
     if state.won:
-        state.points = await WojewodztwodleStateRepository(session).calc_points(state)
+        state.points = await state_repository.calc_points(state)
+
+    if state.is_game_over:
+        await LeaderboardRepository(session).record_game("wojewodztwodle", state)
 
-    await WojewodztwodleStateRepository(session).update_state(state)
+    await session.commit()
 
     return new_guess
@@ -6,7 +6,11 @@ from openai import OpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Wojewodztwo, WojewodztwodleDay, User
-from qdrant.utils import get_fragments_matching_question
+from qdrant.utils import (
+    CONTEXT_SEPARATOR,
+    fragment_refs,
+    get_fragments_matching_question,
+)
 import qdrant
 from schemas.wojewodztwodle import (
     WojewodztwoQuestionCreate,
@@ -110,7 +114,7 @@ async def ask_question(
         session,
         limit=qdrant.WOJEWODZTWDLE_CONTEXT_LIMIT
     )
-    context = "\n[ ... ]\n".join(fragment.text for fragment in fragments)
+    context = CONTEXT_SEPARATOR.join(fragment.text for fragment in fragments)
     wojewodztwo: Wojewodztwo = await WojewodztwoRepository(session).get(
         day_wojewodztwo.wojewodztwo_id
     )
@@ -163,6 +167,7 @@ Jesteś 'Mistrzem Gry' w Wojewodztwodle. Twoim zadaniem jest odpowiedzieć na py
         print(answer)
         raise
 
+    refs = fragment_refs(fragments)
     question_create = WojewodztwoQuestionCreate(
         user_id=user.id if user else None,
         day_id=day_wojewodztwo.id,
@@ -171,7 +176,8 @@ Jesteś 'Mistrzem Gry' w Wojewodztwodle. Twoim zadaniem jest odpowiedzieć na py
         question=question.question,
         answer=answer_dict.get("answer"),
         explanation=answer_dict.get("explanation") or "Brak wyjaśnienia.",
-        context=context,
+        context=context if refs is None else None,
+        context_fragments=refs,
     )
 
     return question_create, question_vector